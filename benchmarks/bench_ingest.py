@@ -0,0 +1,72 @@
+# Time ensure_db() as the listing count grows: a full rebuild from one synthetic export, then the incremental
+# merge of a later export of the same listings with a share of them repriced (ingest.load_exports)
+# Run from the repo root: python -m benchmarks.bench_ingest [--sizes 5000 50000 250000 1000000]
+#                         [--changed 0.01] [--workers N]
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate import CHUNK_ROWS, generate
+from ingest import ensure_db
+
+
+SIZES = (5000, 50000, 250000, 1000000)
+
+
+# Copy a raw export to `path`, cutting the price of a `share` of its listings by 5%; return how many
+def reprice(source, path, share, seed=0):
+    rng = np.random.default_rng(seed)
+    repriced = 0
+    for i, chunk in enumerate(pd.read_csv(source, header=0, index_col=False, chunksize=CHUNK_ROWS,
+                                          encoding='utf-8-sig')):
+        cut = rng.random(len(chunk)) < share
+        chunk.loc[cut, 'price'] = (chunk.loc[cut, 'price'] * .95).round().astype('int64')
+        repriced += int(cut.sum())
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False,
+                     encoding='utf-8-sig' if i == 0 else 'utf-8')
+    return repriced
+
+
+# Seconds and ingest stats of one ensure_db() call
+def timed_ensure(exports, db_path, incremental, workers):
+    start = time.perf_counter()
+    stats = ensure_db(exports, db_path, incremental=incremental, workers=workers)
+    return time.perf_counter() - start, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time database rebuilds and incremental updates.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="Listing counts")
+    parser.add_argument('--changed', type=float, default=.01,
+                        help="Share of listings repriced in the later export (default: %(default)s)")
+    parser.add_argument('--workers', type=int, help="Worker processes parsing exports (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    print("{:>10}  {:>9}  {:>12}  {:>9}  {:>12}  {:>9}".format(
+        "rows", "rebuild s", "rows/s", "update s", "rows/s", "updated"))
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            exports = os.path.join(tmp, 'exports')
+            os.mkdir(exports)
+            first = os.path.join(exports, 'listings_2022-04-01.csv')
+            generate(rows, first)
+            db_path = os.path.join(tmp, 'bench.db')
+            rebuild, _ = timed_ensure(exports, db_path, False, args.workers)
+
+            # The week after: the same listings, some repriced, merged into the live database in place
+            later = os.path.join(tmp, 'listings_2022-04-08.csv')
+            reprice(first, later, args.changed)
+            os.remove(first)
+            os.rename(later, os.path.join(exports, os.path.basename(later)))
+            incremental, stats = timed_ensure(exports, db_path, True, args.workers)
+        updated = stats['changes']['updated']
+        print("{:>10,}  {:>9.2f}  {:>12,.0f}  {:>9.2f}  {:>12,.0f}  {:>9,}".format(
+            rows, rebuild, rows / rebuild, incremental, rows / incremental, updated))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Benchmark the vectorized metrics engine against the old per-row calculator loop
+# Run from the repo root: python -m benchmarks.bench_metrics [rows]
+import sys
+import time
+
+import numpy as np
+import numpy_financial as npf
+
+from ingest import clean_data
+from metrics import Assumptions, compute_metrics, fill_missing
+
+
+# Scalar calculator math, as create_st_interface() ran it for one zpid at a time
+def per_row_metrics(price, zestimate, restimate, tax_assessed_value, monthly_hoa_fee, a):
+    down_payment = price * a.down_payment
+    cash_invested = (price * a.closing_cost) + down_payment + a.rehab
+    loan_principle = price - down_payment
+    monthly_mortgage_payment = npf.pmt(a.interest_rate / 12, a.loan_term * 12, loan_principle, 0)
+    property_tax = (tax_assessed_value * a.property_tax_rate) / 12
+    gross_operating_expenses = (property_tax + a.insurance + a.gas_electric + a.water_sewer_garbage +
+                                monthly_hoa_fee) + (a.vacancy * restimate) + (a.maintenance * restimate) + \
+                               (a.management * restimate) + (a.capex * restimate)
+    noi_operating_expenses = (property_tax + a.insurance + a.gas_electric + a.water_sewer_garbage +
+                              monthly_hoa_fee) + (a.vacancy * restimate) + (a.maintenance * restimate) + \
+                             (a.management * restimate)
+    total_monthly_payment = (monthly_mortgage_payment * -1) + gross_operating_expenses
+    cash_flow = restimate - total_monthly_payment
+    noi = restimate - noi_operating_expenses
+    c_on_c_return = (cash_flow * 12) / cash_invested * 100
+    cap_rate = (noi * 12 / zestimate) * 100
+    fifty_p_rule = (restimate * .5) - monthly_mortgage_payment
+    two_p_rule = restimate / price * 100
+    return cash_flow, noi, c_on_c_return, cap_rate, fifty_p_rule, two_p_rule
+
+
+def main(rows=100000):
+    df = clean_data()
+    df = df.sample(rows, replace=True, random_state=0) if rows else df
+    price, zestimate, tax_assessed_value = fill_missing(df['price'].to_numpy(), df['zestimate'].to_numpy(),
+                                                        df['taxAssessedValue'].to_numpy())
+    restimate = df['restimate'].to_numpy(dtype=float)
+    hoa = df['monthlyHoaFee'].to_numpy(dtype=float)
+    a = Assumptions()
+
+    start = time.perf_counter()
+    loop = [per_row_metrics(*row, a) for row in zip(price, zestimate, restimate, tax_assessed_value, hoa)]
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = compute_metrics(price, zestimate, restimate, tax_assessed_value, hoa, a)
+    vector_seconds = time.perf_counter() - start
+
+    loop = np.array(loop)
+    names = ['cash_flow', 'noi', 'cash_on_cash', 'cap_rate', 'fifty_p_rule', 'two_p_rule']
+    for i, name in enumerate(names):
+        np.testing.assert_allclose(results[name], loop[:, i], rtol=1e-9)
+
+    print("rows: {:,}".format(len(price)))
+    print("per-row loop: {:.3f}s ({:,.0f} rows/s)".format(loop_seconds, len(price) / loop_seconds))
+    print("vectorized:   {:.3f}s ({:,.0f} rows/s)".format(vector_seconds, len(price) / vector_seconds))
+    print("speedup:      {:.0f}x".format(loop_seconds / vector_seconds))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
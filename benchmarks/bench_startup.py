@@ -0,0 +1,163 @@
+# Startup profile: what a cold start of the app costs before the property browser is drawn.
+# Import time each module adds in main.py's order, split into the modules imported up front and those only
+# imported when a map or chart is drawn; then the time from a fresh interpreter to the first grid page: from a
+# cold build, from an existing database checked against the CSV first, and with that check deferred (as main.py does)
+# Run from the repo root: python -m benchmarks.bench_startup [--repeat N] [--csv PATH]
+import argparse
+import ast
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from ingest import CSV_PATH
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Modules a file imports at the top level, and those it (or a repo module it imports) only imports inside
+# functions, each list in source order: read from the source so the profile follows main.py as it changes
+def file_imports(path):
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+
+    def modules(nodes):
+        names = []
+        for node in nodes:
+            if isinstance(node, ast.Import):
+                names += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names.append(node.module)
+        return names
+
+    nested = {node for function in ast.walk(tree) if isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef))
+              for node in ast.walk(function) if isinstance(node, (ast.Import, ast.ImportFrom))}
+    eager = modules(tree.body)
+    lazy = modules(sorted(nested, key=lambda node: node.lineno))
+    for module in eager:
+        local = os.path.join(ROOT, module + '.py')
+        if os.path.exists(local) and local != path:
+            lazy += file_imports(local)[1]
+    eager = list(dict.fromkeys(eager))
+    return eager, [module for module in dict.fromkeys(lazy) if module not in eager]
+
+
+# Imported at the top of main.py, before the grid, and inside the functions that draw maps and charts
+EAGER_IMPORTS, LAZY_IMPORTS = file_imports(os.path.join(ROOT, 'main.py'))
+
+# The data path of a first run up to the grid, as main.py takes it (less the widgets)
+FIRST_RENDER = """
+import json, sys, time
+start = time.perf_counter()
+from db import get_database
+from estimates import load_stats
+from ingest import compact_frame, ensure_db, last_build
+from metrics import GRID_METRICS
+from queries import ListingFilter, count_listings, query_page
+imported = time.perf_counter()
+csv_path, db_path, check = sys.argv[1:4]
+stats = None if check == 'check' else last_build(csv_path, db_path)
+built = stats is None
+if built:
+    stats = ensure_db(csv_path, db_path, incremental=True)
+ready = time.perf_counter()
+with get_database(db_path).reader() as conn:
+    count_listings(conn, ListingFilter())
+    page, _ = query_page(conn, ['zpid', 'price', 'bathrooms', 'bedrooms', 'livingArea', 'homeStatus', 'homeType',
+                                'city', 'state', 'region', 'zestimate', 'restimate', 'pageViewCount',
+                                'daysOnZillow', 'favoriteCount', 'priceChange', 'yearBuilt'] + GRID_METRICS,
+                         ListingFilter(), 'price', limit=100, compact=False)
+    compact_frame(page)
+    load_stats(conn)
+done = time.perf_counter()
+print(json.dumps({'imports': imported - start, 'database': ready - imported, 'grid_page': done - ready,
+                  'total': done - start, 'built': built}))
+"""
+
+
+# Import the modules in order in one fresh interpreter, each timed on top of those before it
+IMPORT_PROFILE = """
+import importlib, json, sys, time
+times = {}
+for module in sys.argv[1:]:
+    start = time.perf_counter()
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        times[module] = None
+        continue
+    times[module] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+
+
+# Best-of-`repeat` time each module adds when imported in the order given (as main.py runs them),
+# {module: seconds, or None when it isn't installed}
+def import_times(modules, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROFILE] + modules, cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {module: None if runs[0][module] is None else min(run[module] for run in runs) for module in modules}
+
+
+# Best-of-`repeat` timings of a first render, each in a fresh interpreter; with check=True the database is
+# checked against the CSV before the grid instead of after it
+def first_render(csv_path, db_path, check=False, repeat=1):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', FIRST_RENDER, csv_path, db_path,
+                                 'check' if check else 'defer'], cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        run = json.loads(output.splitlines()[-1])
+        run['process'] = time.perf_counter() - start
+        runs.append(run)
+    return min(runs, key=lambda run: run['total'])
+
+
+def print_imports(title, times):
+    print("\n{}".format(title))
+    for module, seconds in sorted(times.items(), key=lambda item: -(item[1] or 0)):
+        print("  {:<26} {}".format(module, "not installed" if seconds is None else
+                                   "{:>8.1f} ms".format(seconds * 1000)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the app's cold start.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, best kept (default: 3)")
+    parser.add_argument('--csv', default=CSV_PATH, help="Export to build from (default: the bundled CSV)")
+    args = parser.parse_args(argv)
+
+    print("import time each module adds, in main.py's order (fresh interpreter, best of {})".format(args.repeat))
+    times = import_times(EAGER_IMPORTS + LAZY_IMPORTS, args.repeat)
+    eager = {module: times[module] for module in EAGER_IMPORTS}
+    lazy = {module: times[module] for module in LAZY_IMPORTS}
+    print_imports("imported before the grid", eager)
+    print_imports("imported when a map or chart is drawn", lazy)
+    print("\n  before the grid {:>10.1f} ms, deferred {:>10.1f} ms".format(
+        sum(filter(None, eager.values())) * 1000, sum(filter(None, lazy.values())) * 1000))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'listings.csv')
+        db_path = os.path.join(tmp, 'listings.db')
+        shutil.copy(args.csv, csv_path)
+        runs = [("no database (build)", first_render(csv_path, db_path)),
+                ("existing, checked", first_render(csv_path, db_path, True, args.repeat)),
+                ("existing, deferred", first_render(csv_path, db_path, False, args.repeat))]
+
+    print("\ntime to first grid page (fresh interpreter)")
+    print("  {:<22} {:>10} {:>10} {:>10} {:>10} {:>10}".format("", "imports", "database", "grid page", "total",
+                                                               "process"))
+    for label, run in runs:
+        print("  {:<22} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}  ms".format(
+            label, *(run[name] * 1000 for name in ('imports', 'database', 'grid_page', 'total', 'process'))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# Scaling benchmark over synthetic exports: ingest, init_db(), queries, zpid lookups and calculator
+# throughput at each size, compared with the stored baseline (benchmarks/baseline.json)
+# Run from the repo root: python -m benchmarks.bench_suite [--sizes 10000 100000 1000000 5000000]
+#                         [--save] [--check] [--data-dir DIR]
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import generate
+from db import get_database
+from ingest import ensure_db, init_db, read_chunks
+from metrics import Assumptions, compute_metrics, score_listings
+from queries import ListingFilter, count_listings, get_listing, query_listings
+from spatial import nearest
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SIZES = (10000, 100000, 1000000, 5000000)
+
+# A stage is flagged when it runs this much slower than its baseline
+REGRESSION = 1.25
+
+# Grid page used for the query timings: filtered, sorted, one page deep
+GRID_COLUMNS = ['zpid', 'price', 'bedrooms', 'bathrooms', 'livingArea', 'homeType', 'city', 'zestimate',
+                'restimate', 'daysOnZillow']
+PAGE_FILTER = ListingFilter(min_price=100000, max_price=400000, min_bedrooms=3, home_types=('TOWNHOUSE',))
+DETAIL_COLUMNS = ['zpid', 'price', 'zestimate', 'restimate', 'taxAssessedValue', 'monthlyHoaFee', 'address',
+                  'city', 'state', 'zipcode', 'url', 'latitude', 'longitude', 'bedrooms', 'bathrooms']
+
+
+# Best-of-`repeat` seconds of fn()
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# Time every stage on one synthetic export, return {stage: seconds}
+def run_size(csv_path, workdir):
+    results = {}
+    rows = 0
+
+    start = time.perf_counter()
+    for chunk in read_chunks(csv_path):
+        rows += len(chunk)
+    results['clean'] = time.perf_counter() - start
+
+    db_path = os.path.join(workdir, 'ingest.db')
+    start = time.perf_counter()
+    ensure_db(csv_path, db_path)
+    results['ingest'] = time.perf_counter() - start
+
+    # init_db() alone: the same build from the chunk stream, less the cleaning time measured above
+    init_path = os.path.join(workdir, 'init.db')
+    conn = sqlite3.connect(init_path)
+    start = time.perf_counter()
+    init_db(read_chunks(csv_path), conn, conn.cursor())
+    results['init_db'] = time.perf_counter() - start - results['clean']
+    conn.close()
+    os.remove(init_path)
+
+    # Queries go through a pooled reader, as the app's do
+    database = get_database(db_path)
+    with database.reader() as conn:
+        results['count_listings'] = best_of(lambda: count_listings(conn, PAGE_FILTER))
+        results['query_page'] = best_of(lambda: query_listings(conn, GRID_COLUMNS, PAGE_FILTER, 'price', True,
+                                                               limit=100, offset=1000))
+
+        zpids = [row[0] for row in conn.execute("SELECT zpid FROM zp ORDER BY RANDOM() LIMIT 200")]
+        results['zpid_lookup'] = best_of(lambda: [get_listing(conn, zpid, DETAIL_COLUMNS) for zpid in zpids],
+                                         repeat=3) / len(zpids)
+
+        points = conn.execute("SELECT latitude, longitude FROM physical WHERE latitude IS NOT NULL "
+                              "ORDER BY RANDOM() LIMIT 50").fetchall()
+        results['nearest_10'] = best_of(lambda: [nearest(conn, lat, lon, 10, ['price'],
+                                                         ListingFilter(home_types=('TOWNHOUSE',)))
+                                                 for lat, lon in points], repeat=3) / len(points)
+
+        # Calculator: the whole database scored at once, and one property at a time as the sidebar does
+        listings = query_listings(conn, ['price', 'zestimate', 'restimate', 'taxAssessedValue', 'monthlyHoaFee'])
+        results['score_all'] = best_of(lambda: score_listings(listings), repeat=3)
+        single = listings.head(1000).to_numpy(dtype=float)
+        assumptions = Assumptions()
+        results['calculator_call'] = best_of(lambda: [compute_metrics(*row, assumptions) for row in single],
+                                             repeat=3) / len(single)
+    database.close()
+    return rows, results
+
+
+# Stage timings as the rates printed and stored: rows/s for whole-table stages, microseconds per call otherwise
+PER_CALL = {'count_listings', 'query_page', 'zpid_lookup', 'nearest_10', 'calculator_call'}
+
+
+def describe(stage, seconds, rows):
+    if stage in PER_CALL:
+        return "{:>12,.1f} us/call".format(seconds * 1e6)
+    return "{:>12,.0f} rows/s".format(rows / seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage over synthetic exports.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help="Listing counts (default: 10000 100000; the full suite is {})".format(
+                            " ".join(str(size) for size in SIZES)))
+    parser.add_argument('--data-dir', help="Keep generated exports here and reuse them between runs")
+    parser.add_argument('--save', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--check', action='store_true', help="Exit with status 1 if any stage regressed")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    report = {'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                          'processor': platform.processor() or platform.machine()},
+              'date': time.strftime('%Y-%m-%d'), 'sizes': {}}
+    regressions = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = args.data_dir or tmp
+            os.makedirs(data_dir, exist_ok=True)
+            csv_path = os.path.join(data_dir, 'synthetic_{}.csv'.format(size))
+            if not os.path.exists(csv_path):
+                print("generating {:,} listings ({:.1f}s)".format(size, generate(size, csv_path)))
+            rows, results = run_size(csv_path, tmp)
+
+        report['sizes'][str(size)] = results
+        previous = baseline.get('sizes', {}).get(str(size), {})
+        print("\n{:,} listings".format(rows))
+        print("{:<16} {:>10}  {:>24}  {:>9}".format("stage", "seconds", "rate", "baseline"))
+        for stage, seconds in results.items():
+            ratio = seconds / previous[stage] if stage in previous else None
+            flag = ""
+            if ratio is not None and ratio > REGRESSION:
+                flag = "  REGRESSION"
+                regressions.append((size, stage, ratio))
+            print("{:<16} {:>10.4f}  {:>24}  {:>9}{}".format(stage, seconds, describe(stage, seconds, rows),
+                                                             "{:.2f}x".format(ratio) if ratio else "-", flag))
+
+    if args.save:
+        baseline.setdefault('sizes', {}).update(report['sizes'])
+        baseline.update(machine=report['machine'], date=report['date'])
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("\nbaseline saved to {}".format(BASELINE_PATH))
+    if regressions:
+        print("\n{} stage(s) slower than {:.0%} of baseline".format(len(regressions), REGRESSION))
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
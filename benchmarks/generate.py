@@ -0,0 +1,83 @@
+# Synthetic Zillow exports: any number of listings in the raw column layout of zillow_philly_data.csv
+# (address/*, listing_sub_type/*, mortgageRates/* columns, zpid-bearing urls), so clean_data() and the
+# ingest pipeline read them unchanged. Rows are resampled from the real export and jittered: values,
+# gaps and category mixes stay realistic while every listing gets its own zpid, url and location
+# Run from the repo root: python -m benchmarks.generate rows output.csv [--seed N]
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest import CSV_PATH
+
+
+# Rows generated and written per chunk, so millions of rows never sit in memory at once
+CHUNK_ROWS = 250000
+
+# Columns scaled by one lognormal factor per listing (so price, value and rent stay consistent)
+VALUE_COLUMNS = ['price', 'zestimate', 'rentZestimate', 'taxAssessedValue', 'priceChange', 'monthlyHoaFee']
+
+# Count columns redrawn from a Poisson around the sampled value
+COUNT_COLUMNS = ['daysOnZillow', 'favoriteCount', 'pageViewCount']
+
+# First zpid handed out; real zpids in the sample are far below this
+FIRST_ZPID = 3000000000
+
+
+# Read the raw export used as the template (kept as raw strings/values, exactly as clean_data() sees them)
+def load_template(path=CSV_PATH):
+    return pd.read_csv(path, header=0, index_col=False)
+
+
+# One chunk of `rows` synthetic raw listings with zpids starting at `first_zpid`
+def generate_chunk(template, rows, first_zpid, rng):
+    df = template.iloc[rng.integers(0, len(template), rows)].reset_index(drop=True)
+
+    scale = rng.lognormal(0, .15, rows)
+    for col in VALUE_COLUMNS:
+        df[col] = (df[col] * scale).round()
+    df['price'] = df['price'].astype('int64')
+    df['livingArea'] = (df['livingArea'] * rng.lognormal(0, .1, rows)).round()
+    for col in COUNT_COLUMNS:
+        df[col] = df[col].where(df[col].isna(), rng.poisson(df[col].fillna(0).clip(lower=0)))
+
+    # About a kilometer of scatter around the sampled listing
+    df['latitude'] = (df['latitude'] + rng.normal(0, .01, rows)).round(6)
+    df['longitude'] = (df['longitude'] + rng.normal(0, .012, rows)).round(6)
+
+    zpid = np.arange(first_zpid, first_zpid + rows)
+    number = rng.integers(100, 9999, rows).astype(str)
+    street = df['address/streetAddress'].str.replace(r'^\d+\s*', '', regex=True)
+    df['address/streetAddress'] = pd.Series(number) + " " + street
+    slug = (df['address/streetAddress'] + " " + df['address/city'] + " " + df['address/state'] + " "
+            + df['address/zipcode'].astype(str)).str.replace(r'[^A-Za-z0-9]+', '-', regex=True)
+    df['url'] = "https://www.zillow.com/homedetails/" + slug + "/" + pd.Series(zpid).astype(str) + "_zpid/"
+    return df
+
+
+# Write a synthetic export of `rows` listings to `path`, chunk by chunk; return seconds taken
+def generate(rows, path, seed=0, template=None, chunk_rows=CHUNK_ROWS):
+    start = time.perf_counter()
+    template = load_template() if template is None else template
+    rng = np.random.default_rng(seed)
+    # utf-8-sig writes the byte order mark the real export starts with
+    for first in range(0, rows, chunk_rows):
+        chunk = generate_chunk(template, min(chunk_rows, rows - first), FIRST_ZPID + first, rng)
+        chunk.to_csv(path, mode='w' if first == 0 else 'a', header=first == 0, index=False,
+                     encoding='utf-8-sig' if first == 0 else 'utf-8')
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Zillow export in the raw CSV layout.")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    seconds = generate(args.rows, args.output, args.seed)
+    print("{:,} listings written to {} in {:.1f}s".format(args.rows, args.output, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Bounded, thread-safe LRU cache shared by the Streamlit sessions of one process
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    # Return the cached value (marking it most recently used), or default
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return default
+
+    # Store a value, evicting the least recently used entry when full
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    # Return the cached value, computing and storing it on a miss
+    # compute() runs outside the lock, so two sessions missing at once may both compute
+    def get_or_compute(self, key, compute):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
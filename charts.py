@@ -0,0 +1,73 @@
+# Calculator charts as pure functions of their numeric inputs: the monthly expense breakdown (donut) and the
+# property value projection (line). Figures are built with plotly.graph_objects straight from numbers and
+# arrays (no DataFrame, no plotly.express, no pre-formatted strings: dollar formatting is left to the axes and
+# hover templates), so the app can memoize each one by the inputs it actually depends on.
+# Plotly is imported inside the functions, keeping it off the app's startup path
+import numpy as np
+
+from projection import project, rate_schedule
+from tracing import traced
+
+
+# Points drawn per line at most; longer (monthly) series are thinned evenly, keeping both ends
+MAX_POINTS = 120
+
+# Expense breakdown slices, in order
+EXPENSE_LABELS = ["Property Tax", "Insurance", "Gas/Electric", "Water/Sewer/Garbage", "HOA Fees", "Vacancy",
+                  "Maintenance/Repairs", "Management", "Cap-Ex"]
+
+# plotly.colors.sequential.RdBu, the expense chart's palette
+EXPENSE_COLORS = ['rgb(103,0,31)', 'rgb(178,24,43)', 'rgb(214,96,77)', 'rgb(244,165,130)', 'rgb(253,219,199)',
+                  'rgb(247,247,247)', 'rgb(209,229,240)', 'rgb(146,197,222)', 'rgb(67,147,195)', 'rgb(33,102,172)',
+                  'rgb(5,48,97)']
+
+
+# Indices of at most `max_points` evenly spaced elements of a length-n series, first and last included
+def downsample(n, max_points=MAX_POINTS):
+    if n <= max_points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_points).round().astype(int))
+
+
+# Monthly expenses in EXPENSE_LABELS order, rounded to cents so they can key the chart cache
+def expense_breakdown(property_tax, hoa, restimate, assumptions):
+    a = assumptions
+    values = [property_tax, a.insurance, a.gas_electric, a.water_sewer_garbage, hoa, a.vacancy * restimate,
+              a.maintenance * restimate, a.management * restimate, a.capex * restimate]
+    return tuple(round(float(value), 2) for value in values)
+
+
+# Donut of the monthly expenses (a tuple from expense_breakdown())
+@traced('plotly expense_chart')
+def expense_chart(values):
+    import plotly.graph_objects as go
+    figure = go.Figure(go.Pie(labels=EXPENSE_LABELS, values=values, hole=.6,
+                              marker={'colors': EXPENSE_COLORS[:len(values)]}))
+    figure.update_layout(title={'text': "Monthly Expense Breakdown", 'y': .985, 'x': .46, 'xanchor': 'center',
+                                'yanchor': 'top'}, width=800)
+    return figure
+
+
+# Property value over the loan term, with monthly cash flow, equity and loan balance on hover. Projected month
+# by month (projection.project) and thinned to MAX_POINTS for display
+@traced('plotly appreciation_graph')
+def appreciation_chart(principal, interest_rate, loan_term, arm_fixed_years, arm_reset_rate, value, rent,
+                       expenses, appreciation):
+    import plotly.graph_objects as go
+    rates = rate_schedule(interest_rate, loan_term, arm_fixed_years, arm_reset_rate)
+    schedule = project(principal, rates, value, rent, expenses, appreciation)
+    months = schedule['value'].shape[1]
+    shown = downsample(months)
+
+    years = (shown + 1) / 12
+    hover = np.column_stack([schedule[name][0, shown] for name in ('cash_flow', 'equity', 'balance')])
+    figure = go.Figure(go.Scatter(
+        x=years, y=schedule['value'][0, shown], customdata=hover, mode='lines',
+        line={'color': '#2eb82e', 'width': 2}, name="Property Value",
+        hovertemplate="Property Value: $%{y:,.0f}<br>Cash Flow: $%{customdata[0]:,.0f}<br>"
+                      "Equity: $%{customdata[1]:,.0f}<br>Loan Balance: $%{customdata[2]:,.0f}<extra></extra>"))
+    figure.update_layout(hovermode='x', width=930, plot_bgcolor="#ffffff", title={
+        'text': "Property Appreciation Over Loan", 'y': .9, 'x': 0.405, 'xanchor': 'center', 'yanchor': 'top'})
+    figure.update_yaxes(title="Property Value", nticks=10, linecolor="#d9d9d9", tickprefix="$", tickformat=",.0f")
+    figure.update_xaxes(title="Year", linecolor="#d9d9d9", showticklabels=True, hoverformat=".1f")
+    return figure
@@ -0,0 +1,239 @@
+# Headless batch scoring: run the calculator over every listing (or a zpid list) without Streamlit
+# python cli.py --output scores.csv [--csv export.csv] [--zpids 1,2 | --zpid-file ids.txt] [--assumptions a.json]
+#               [--simulate]
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import get_database
+from estimates import impute, load_stats
+from ingest import CSV_PATH, DB_PATH, ensure_db
+from metrics import Assumptions, fill_missing, score_listings
+from queries import ListingFilter, build_query, count_listings
+from simulation import PERCENTILES, SimulationSettings, simulate_portfolio
+from tracing import span, start_trace, stop_trace
+
+
+# Columns read for each listing; the calculator inputs plus a few to identify the property
+INPUT_COLUMNS = ['zpid', 'address', 'city', 'zipcode', 'region', 'homeType', 'bedrooms', 'livingArea', 'price',
+                 'zestimate', 'restimate', 'taxAssessedValue', 'monthlyHoaFee']
+
+# Metrics written for each listing
+OUTPUT_METRICS = ['cash_invested', 'mortgage_payment', 'property_tax', 'gross_operating_expenses',
+                  'noi_operating_expenses', 'total_monthly_payment', 'cash_flow', 'noi', 'cash_on_cash', 'cap_rate',
+                  'fifty_p_rule', 'fifty_p_rule_pass', 'two_p_rule', 'two_p_rule_pass']
+
+# Monte Carlo metrics written for each listing with --simulate, one column per percentile
+SIMULATION_METRICS = ['cash_flow', 'cap_rate', 'cash_on_cash', 'irr']
+
+# zpids per query when scoring a zpid list (stays under SQLite's bound parameter limit)
+ZPID_BATCH = 500
+
+
+# Read an assumptions file (JSON, or TOML if the toml package is installed) into Assumptions
+# Keys are Assumptions field names; percentages are fractions (e.g. "interest_rate": 0.045)
+def load_assumptions(path):
+    if path is None:
+        return Assumptions()
+    with open(path) as f:
+        if path.endswith('.toml'):
+            import toml
+            values = toml.load(f)
+        else:
+            values = json.load(f)
+    try:
+        return Assumptions(**values)
+    except TypeError as e:
+        raise SystemExit("Invalid assumptions file {}: {}".format(path, e))
+
+
+# zpids from --zpids and --zpid-file (one per line or comma separated), None to score everything
+def load_zpids(args):
+    text = args.zpids or ""
+    if args.zpid_file:
+        with open(args.zpid_file) as f:
+            text += "," + f.read()
+    zpids = [int(token) for token in text.replace("\n", ",").split(",") if token.strip()]
+    return zpids or None
+
+
+# Yield frames of calculator inputs from the database, `chunk_size` rows at a time
+def read_listings(connection, zpids=None, chunk_size=50000):
+    if zpids is None:
+        sql, params = build_query(INPUT_COLUMNS, ListingFilter())
+        for chunk in pd.read_sql(sql, con=connection, params=params, chunksize=chunk_size):
+            yield chunk
+        return
+
+    for i in range(0, len(zpids), ZPID_BATCH):
+        sql, params = build_query(INPUT_COLUMNS, ListingFilter(zpids=tuple(zpids[i:i + ZPID_BATCH])))
+        yield pd.read_sql(sql, con=connection, params=params)
+
+
+# Score one chunk of listings (runs in a worker process), imputing missing values when stats are given
+def score_chunk(df, assumptions, stats=None):
+    df = impute(df, stats)
+    return df.join(score_listings(df, assumptions, columns=OUTPUT_METRICS))
+
+
+# Monte Carlo risk of each listing of a chunk (simulation.simulate_portfolio over `workers` processes), with
+# the calculator's fallbacks for missing inputs: `<metric>_p<percentile>` columns and negative_cash_flow_share
+def simulate_listings(df, assumptions, settings, appreciation, workers=1):
+    price, zestimate, tax_assessed_value = fill_missing(np.nan_to_num(df['price'].to_numpy(dtype=float)),
+                                                        np.nan_to_num(df['zestimate'].to_numpy(dtype=float)),
+                                                        np.nan_to_num(df['taxAssessedValue'].to_numpy(dtype=float)))
+    restimate = np.nan_to_num(df['restimate'].to_numpy(dtype=float))
+    hoa = np.nan_to_num(df['monthlyHoaFee'].to_numpy(dtype=float))
+    properties = [dict(price=values[0], zestimate=values[1], restimate=values[2], tax_assessed_value=values[3],
+                       hoa=values[4], apg=appreciation, assumptions=assumptions)
+                  for values in zip(price.tolist(), zestimate.tolist(), restimate.tolist(),
+                                    tax_assessed_value.tolist(), hoa.tolist())]
+    summaries = simulate_portfolio(properties, settings, workers)
+    columns = {'{}_p{}'.format(metric, percentile): [summary[metric][percentile] for summary in summaries]
+               for metric in SIMULATION_METRICS for percentile in PERCENTILES}
+    columns['negative_cash_flow_share'] = [summary['negative_cash_flow_share'] for summary in summaries]
+    return pd.DataFrame(columns, index=df.index)
+
+
+# Append scored chunks to a CSV or Parquet file (Parquet needs pyarrow)
+class ResultWriter:
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self.writer = None
+        if self.parquet:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise SystemExit("Writing Parquet needs pyarrow (pip install pyarrow), or use a .csv output")
+            self.pyarrow = pyarrow
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if self.parquet:
+            table = self.pyarrow.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a', header=not os.path.exists(self.path), index=False)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+# Score every chunk, in a process pool when workers > 1, writing results in order and reporting progress.
+# With `simulation` (settings, mean appreciation) every listing is also simulated: chunks are then scored in
+# this process and the pool runs the simulations, each chunk seeded from the settings' seed plus its index
+def run(connection, assumptions, writer, zpids=None, workers=1, chunk_size=50000, stats=None, simulation=None,
+        out=sys.stderr):
+    total = len(zpids) if zpids is not None else count_listings(connection)
+    start = time.perf_counter()
+    done = 0
+
+    def report(df):
+        nonlocal done
+        with span('write', rows=len(df)):
+            writer.write(df)
+        done += len(df)
+        elapsed = time.perf_counter() - start
+        out.write("\r{:,}/{:,} listings ({:.0%}) {:,.0f} rows/s".format(
+            done, total, done / total if total else 1, done / elapsed if elapsed else 0))
+        out.flush()
+
+    chunks = read_listings(connection, zpids, chunk_size)
+    if simulation is not None:
+        settings, appreciation = simulation
+        for index, chunk in enumerate(chunks):
+            scored = score_chunk(chunk, assumptions, stats)
+            seed = None if settings.seed is None else settings.seed + index
+            with span('simulate', rows=len(scored)):
+                risk = simulate_listings(scored, assumptions, replace(settings, seed=seed), appreciation, workers)
+            report(scored.join(risk))
+    elif workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk, assumptions, stats))
+                # Keep a bounded number of chunks in flight so memory stays flat
+                while len(pending) > workers * 2:
+                    report(pending.pop(0).result())
+            for future in pending:
+                report(future.result())
+    else:
+        for chunk in chunks:
+            report(score_chunk(chunk, assumptions, stats))
+
+    elapsed = time.perf_counter() - start
+    out.write("\nScored {:,} listings in {:.2f}s ({:,.0f} rows/s)\n".format(
+        done, elapsed, done / elapsed if elapsed else 0))
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score listings with the investment calculator, headless.")
+    parser.add_argument('--db', default=DB_PATH, help="SQLite database to score (default: %(default)s)")
+    parser.add_argument('--csv', help="Zillow export(s) to ingest into --db first: a CSV (e.g. {}), a directory "
+                                      "of them or a quoted glob".format(CSV_PATH))
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Rebuild --db from --csv instead of merging (price history and snapshots dated before "
+                             "the exports are kept)")
+    parser.add_argument('--assumptions', help="JSON/TOML file of Assumptions fields (fractions for percentages)")
+    parser.add_argument('--zpids', help="Comma separated zpids to score (default: every active listing)")
+    parser.add_argument('--zpid-file', help="File of zpids to score, one per line")
+    parser.add_argument('--no-impute', action='store_true',
+                        help="Score missing zestimates/rents/assessments as given instead of imputing them")
+    parser.add_argument('--output', '-o', required=True, help="Output file, .csv or .parquet")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (parsing exports, scoring and simulation)")
+    parser.add_argument('--chunk-size', type=int, default=50000, help="Listings per chunk")
+    parser.add_argument('--simulate', action='store_true',
+                        help="Add Monte Carlo risk percentiles (cash flow, cap rate, cash on cash, IRR) per listing")
+    parser.add_argument('--paths', type=int, default=2000, help="Simulated paths per listing (default: %(default)s)")
+    parser.add_argument('--hold-years', type=int, default=10,
+                        help="Hold period of the simulated IRR, in years (default: %(default)s)")
+    parser.add_argument('--appreciation', type=float, default=.02,
+                        help="Mean annual appreciation and rent growth, as a fraction (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="Simulation random seed (default: %(default)s)")
+    parser.add_argument('--trace', help="Write per-stage timings to this file (Chrome trace format)")
+    args = parser.parse_args(argv)
+    start_trace(args.trace is not None, name='cli')
+
+    assumptions = load_assumptions(args.assumptions)
+    if args.csv:
+        stats = ensure_db(args.csv, args.db, incremental=not args.rebuild, workers=args.workers)
+        sys.stderr.write("Ingest: {} ({:.2f}s)\n".format(stats['source'], stats['seconds']))
+    elif not os.path.exists(args.db):
+        raise SystemExit("Database {} not found; pass --csv to build it".format(args.db))
+
+    writer = ResultWriter(args.output)
+    try:
+        with get_database(args.db).reader() as connection:
+            stats = None if args.no_impute else load_stats(connection)
+            simulation = None
+            if args.simulate:
+                simulation = (SimulationSettings(paths=args.paths, hold_years=args.hold_years, seed=args.seed),
+                              args.appreciation)
+            run(connection, assumptions, writer, load_zpids(args), args.workers, args.chunk_size, stats, simulation)
+    finally:
+        writer.close()
+
+    trace = stop_trace()
+    if trace is not None:
+        with open(args.trace, 'w') as f:
+            f.write(trace.to_chrome_trace())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# Shared SQLite access: one writer and a pool of read-only connections per database file, reused by every
+# session and thread of the process. The live database runs in WAL mode, so readers don't wait on each other
+# or on the writer. Small changes are made in place in one transaction on the writer; full builds go into a
+# separate file that is copied into the live one in a single write transaction once finished (publish()), so
+# a reader, in this process or another, sees the old database or the new one, never a half-built one
+from contextlib import contextmanager
+import os
+import sqlite3
+import tempfile
+import threading
+
+from tracing import span
+
+
+# Idle read connections kept per database (more are opened under load, and closed again when returned)
+READERS = 8
+
+# Prepared statements kept per connection; the app's queries are parameterized, so their text repeats
+STATEMENT_CACHE = 256
+
+# Readers: no writes, a 64 MB page cache, the file memory-mapped
+READ_PRAGMAS = ["PRAGMA query_only = ON", "PRAGMA cache_size = -65536", "PRAGMA mmap_size = 268435456",
+                "PRAGMA temp_store = MEMORY"]
+
+# Writer: WAL (persistent in the file), fsync at checkpoints only; the WAL is cut back to 64 MB whenever it
+# is reset, so it doesn't keep the size of the last publish on disk
+WRITE_PRAGMAS = ["PRAGMA journal_mode = WAL", "PRAGMA synchronous = NORMAL", "PRAGMA cache_size = -65536",
+                 "PRAGMA temp_store = MEMORY", "PRAGMA journal_size_limit = 67108864"]
+
+# Builds: nothing reads the file until it is published and a failed build is thrown away, so no durability
+BUILD_PRAGMAS = ["PRAGMA journal_mode = MEMORY", "PRAGMA synchronous = OFF", "PRAGMA cache_size = -65536",
+                 "PRAGMA temp_store = MEMORY"]
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+    for pragma in pragmas:
+        connection.execute(pragma)
+    return connection
+
+
+class Database:
+
+    def __init__(self, path, readers=READERS):
+        self.path = path
+        self.readers = readers
+        self._idle = []
+        self._writer = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+
+    # Lend a read-only connection for the duration of the block; never waits on the writer or a publish
+    @contextmanager
+    def reader(self):
+        with self._lock:
+            generation = self._generation
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None:
+                connection = connect(self.path, READ_PRAGMAS)
+            yield connection
+        finally:
+            with self._lock:
+                keep = connection is not None and generation == self._generation and len(self._idle) < self.readers
+                if keep:
+                    self._idle.append(connection)
+            if connection is not None and not keep:
+                connection.close()
+
+    # The writer connection, for changes made in place; one thread at a time
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = connect(self.path, WRITE_PRAGMAS)
+            yield self._writer
+
+    # Build a new version of the database from scratch in a temporary file next to it and publish it when the
+    # block exits without an error (a failed build is deleted and the live database left as it was)
+    @contextmanager
+    def build(self):
+        handle, build_path = tempfile.mkstemp(suffix='.build', dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(handle)
+        try:
+            connection = connect(build_path, BUILD_PRAGMAS)
+            try:
+                yield connection
+                connection.commit()
+                self.publish(connection)
+            finally:
+                connection.close()
+        finally:
+            for path in (build_path, build_path + '-journal'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # Copy a finished build into the live database through the writer: one write transaction, committed
+    # through the live file's own WAL, so readers already open (in any process) keep their snapshot of the old
+    # version until their next read transaction. The WAL, which now holds the whole database, is checkpointed
+    # back into the file as far as readers of the old version allow, without waiting for them (later
+    # checkpoints finish the job)
+    def publish(self, build):
+        with self.writer() as writer:
+            with span('publish'):
+                build.backup(writer)
+            with span('checkpoint'):
+                writer.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # Close every idle connection (lent-out readers are closed when returned)
+    def close(self):
+        with self._write_lock, self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._generation += 1
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+# The process-wide Database for a file, created on first use
+def get_database(path):
+    path = os.path.abspath(path)
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
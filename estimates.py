@@ -0,0 +1,152 @@
+# Impute missing zestimate, restimate and taxAssessedValue from the listing_stats aggregates built at ingest:
+# the listing's living area (or value) times the median ratio of the most specific group with enough listings.
+# Also materializes every listing's default-terms metrics from the imputed values (listing_metrics)
+import numpy as np
+import pandas as pd
+
+from ingest import CHUNK_ROWS, STATS_COLUMNS, STATS_LEVELS, table_columns
+from metrics import GRID_METRICS, score_listings
+from tracing import span, traced
+
+
+# Fewest listings a group needs before its median is used (the citywide level is always used)
+MIN_COUNT = 5
+
+# Columns filled by impute()
+IMPUTED_COLUMNS = ['zestimate', 'restimate', 'taxAssessedValue']
+
+
+class ListingStats:
+
+    # levels: one frame per STATS_LEVELS entry, indexed by that level's group columns, NaN where too thin
+    def __init__(self, levels):
+        self.levels = levels
+
+    # Load listing_stats from the database
+    @classmethod
+    def from_db(cls, connection):
+        df = pd.read_sql("SELECT * FROM listing_stats", con=connection)
+        levels = []
+        for level, keys in enumerate(STATS_LEVELS):
+            table = df[df['level'] == level]
+            stats = table[STATS_COLUMNS].copy()
+            for col in STATS_COLUMNS:
+                if keys:
+                    stats[col] = stats[col].where(table[col + '_count'] >= MIN_COUNT)
+            levels.append(stats.set_index([table[key] for key in keys]) if keys else stats.reset_index(drop=True))
+        return cls(levels)
+
+    # Ratios for every row of a frame, one vectorized reindex per level
+    def lookup_frame(self, df):
+        result = {col: np.full(len(df), np.nan) for col in STATS_COLUMNS}
+        for level, keys in enumerate(STATS_LEVELS):
+            table = self.levels[level]
+            if keys:
+                index = pd.MultiIndex.from_arrays([df[key].astype(object).to_numpy() for key in keys])
+                matched = table.reindex(index if len(keys) > 1 else index.get_level_values(0))
+            else:
+                matched = table.reindex(np.zeros(len(df), dtype=int))
+            for col in STATS_COLUMNS:
+                result[col] = np.where(np.isnan(result[col]), matched[col].to_numpy(dtype=float), result[col])
+        return result
+
+    # Copy of a listings frame (needing price, livingArea, the IMPUTED_COLUMNS and STATS_GROUP_COLUMNS) with
+    # missing or zero IMPUTED_COLUMNS estimated, plus a boolean `<column>_imputed` column for each
+    @traced('impute')
+    def impute(self, df):
+        ratios = self.lookup_frame(df)
+        df = df.copy()
+        living_area = df['livingArea'].to_numpy(dtype=float)
+        living_area = np.where(living_area > 0, living_area, np.nan)
+        price = df['price'].to_numpy(dtype=float)
+
+        # Zestimate: the listing price (not flagged: it isn't estimated), else value per sqft, else the
+        # group's median value
+        estimate = ratios['value_per_sqft'] * living_area
+        estimate = np.where(np.isnan(estimate), ratios['value'], estimate)
+        zestimate = fill(df, 'zestimate', np.where(price > 0, price, estimate), flag=~(price > 0))
+
+        # Rent: rent per sqft, else the group's rent-to-value ratio
+        estimate = ratios['rent_per_sqft'] * living_area
+        fill(df, 'restimate', np.where(np.isnan(estimate), ratios['rent_ratio'] * zestimate, estimate))
+        fill(df, 'taxAssessedValue', ratios['tax_ratio'] * zestimate)
+        return df
+
+
+# Replace missing or zero values of a column with the rounded estimate (where there is one) and flag those
+# filled where `flag` is set (default: all of them), return the filled column as floats
+def fill(df, column, estimate, flag=True):
+    values = df[column].to_numpy(dtype=float)
+    missing = ~(values > 0) & ~np.isnan(estimate)
+    values = np.where(missing, np.round(estimate), values)
+    df[column] = values
+    df[column + '_imputed'] = missing & flag
+    return values
+
+
+# Load the aggregates, None if the database has none (imputation then leaves values as they are)
+@traced()
+def load_stats(connection):
+    if not connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'listing_stats'").fetchone():
+        return None
+    return ListingStats.from_db(connection)
+
+
+# Module-level shortcut: impute with `stats`, or return the frame unchanged when there are none
+def impute(df, stats):
+    return df if stats is None else stats.impute(df)
+
+
+# The property browser's metric columns for every listing (the calculator's default assumptions on imputed
+# inputs), one row per master_table rowid, so the browser can sort and page by them in the database
+LISTING_METRICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listing_metrics (
+listing_id INTEGER PRIMARY KEY,
+{}
+);
+""".format(",\n".join("{} REAL".format(col) for col in GRID_METRICS))
+
+METRIC_INDEXES = ["CREATE INDEX IF NOT EXISTS idx_metrics_{0} ON listing_metrics ({0})".format(col)
+                  for col in GRID_METRICS]
+
+# Columns of master_table the metrics are computed from
+METRIC_INPUTS = ['price', 'zestimate', 'restimate', 'taxAssessedValue', 'monthlyHoaFee', 'livingArea', 'zipcode',
+                 'region', 'homeType', 'bedrooms']
+
+
+# Bring listing_metrics up to date with master_table and listing_stats, in the caller's transaction. Listings
+# are scored a chunk at a time in rowid order and only rows whose metrics changed are written, so a refresh
+# that moves few listings (or aggregates) writes few rows. master_table rows are never deleted (delisting is a
+# flag), so neither are these. Return the number of rows written
+@traced()
+def build_metrics(connection, chunksize=CHUNK_ROWS):
+    stats = load_stats(connection)
+    connection.execute(LISTING_METRICS_SCHEMA)
+    written = 0
+    sql = "SELECT rowid AS listing_id, {} FROM master_table ORDER BY rowid".format(", ".join(METRIC_INPUTS))
+    for chunk in pd.read_sql(sql, con=connection, chunksize=chunksize):
+        with span('metrics chunk', rows=len(chunk)):
+            chunk = chunk.set_index('listing_id')
+            scores = score_listings(impute(chunk, stats))[GRID_METRICS].astype(float)
+            stored = pd.read_sql("SELECT * FROM listing_metrics WHERE listing_id BETWEEN ? AND ?", con=connection,
+                                 params=(int(chunk.index[0]), int(chunk.index[-1])), index_col='listing_id')
+            new = ~scores.index.isin(stored.index)
+            stored = stored.reindex(scores.index).astype(float)
+            same = ((scores == stored) | (scores.isna() & stored.isna())).all(axis=1)
+            changed = scores[new | ~same]
+            connection.executemany(
+                "INSERT OR REPLACE INTO listing_metrics VALUES ({})".format(", ".join("?" * (len(GRID_METRICS) + 1))),
+                changed.astype(object).where(changed.notna(), None).itertuples(name=None))
+            written += len(changed)
+    for statement in METRIC_INDEXES:
+        connection.execute(statement)
+    return written
+
+
+# Build the metrics of a database created before they existed
+def ensure_metrics(connection):
+    cursor = connection.cursor()
+    if not table_columns(cursor, 'listing_metrics') and table_columns(cursor, 'listing_stats'):
+        cursor.execute("BEGIN")
+        build_metrics(connection)
+        connection.commit()
@@ -0,0 +1,1035 @@
+# Data ingest: clean the Zillow export (or several, one snapshot date at a time) and build zillow.db
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import glob
+import hashlib
+import itertools
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from db import get_database
+from tracing import span, traced
+
+
+CSV_PATH = "zillow_philly_data.csv"
+DB_PATH = "zillow.db"
+CHUNK_ROWS = 100000
+
+
+# Clean CSV, return dataframe
+def clean_data(path=CSV_PATH):
+
+    # Load CSV
+    with span('read_csv'):
+        df = pd.read_csv(path, header=0, index_col=False)
+    pd.set_option('display.max_columns', None)
+
+    with span('clean_chunk', rows=len(df)):
+        df = clean_chunk(df)
+    # df['daysOnZillow'] = df['daysOnZillow'].fillna(200).astype(int)
+    df['daysOnZillow'] = df['daysOnZillow'].fillna(value=df['daysOnZillow'].mean())
+
+    return df
+
+
+# Rename columns, extract zpid and convert types of a raw export frame (or one chunk of it)
+# Everything here is row-local; the daysOnZillow mean fill needs the whole export and is left to the caller
+def clean_chunk(df):
+
+    # Delete, rename columns
+    df.drop(columns=['parentRegion', 'mortgageRates', 'timeOnZillow'], inplace=True)
+    df.rename(columns={'address/city': 'city', 'address/state': 'state',
+                       'address/streetAddress': 'address', 'address/zipcode': 'zipcode',
+                       'listing_sub_type/is_FSBA': 'is_fsba', 'listing_sub_type/is_FSBO': 'is_fsbo',
+                       'listing_sub_type/is_bankOwned': 'is_bankOwned',
+                       'listing_sub_type/is_comingSoon': 'is_comingSoon',
+                       'listing_sub_type/is_forAuction': 'is_forAuction',
+                       'listing_sub_type/is_foreclosure': 'is_foreclosure',
+                       'listing_sub_type/is_newHome': 'is_newHome', 'listing_sub_type/is_openHouse': 'is_openHouse',
+                       'listing_sub_type/is_pending': 'is_pending', 'mortgageRates/arm5Rate': 'arm5_rate',
+                       'mortgageRates/fifteenYearFixedRate': '15fixed_rate',
+                       'mortgageRates/thirtyYearFixedRate': '30fixed_rate',
+                       'parentRegion/name': 'region', 'rentZestimate': 'restimate'}, inplace=True)
+
+    # Create zpid column from url
+    df['zpid'] = df['url'].str.extract(r'((?<=\/)\d*(?=_zpid))')
+    zpid_column = df.pop('zpid')
+    df.insert(0, 'zpid', zpid_column)
+
+    # Convert data types
+    df['zpid'] = df['zpid'].astype(int)
+    df['is_openHouse'] = df['is_openHouse'].astype(bool)
+    df['yearBuilt'] = df['yearBuilt'].fillna(0).astype(int)
+    df['taxAssessedYear'] = df['taxAssessedYear'].fillna(0).astype(int)
+    df['price'] = df['price'].astype(float)
+    df['priceChange'] = df['priceChange'].fillna(0).astype(float)
+    df['zestimate'] = df['zestimate'].fillna(0).astype(float)
+    df['restimate'] = df['restimate'].fillna(0).astype(float)
+    df['taxAssessedValue'] = df['taxAssessedValue'].fillna(0).astype(float)
+    df['monthlyHoaFee'] = df['monthlyHoaFee'].fillna(0).astype(float)
+
+    return df
+
+
+# Stream the export in bounded chunks, yielding each one cleaned
+def read_chunks(path=CSV_PATH, chunksize=CHUNK_ROWS):
+    reader = iter(pd.read_csv(path, header=0, index_col=False, chunksize=chunksize))
+    while True:
+        # Spans cover only this generator's own work, not the consumer's between chunks
+        with span('read_csv'):
+            chunk = next(reader, None)
+        if chunk is None:
+            return
+        with span('clean_chunk', rows=len(chunk)):
+            chunk = clean_chunk(chunk)
+        yield chunk
+
+
+# Write a cleaned frame, or any iterable of cleaned chunks, to `table` one chunk at a time,
+# then drop duplicate zpids (keeping the last) and fill missing daysOnZillow with the mean
+def write_frames(frames, connection, table, **extra):
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+
+    if_exists = 'replace'
+    for frame in frames:
+        with span('to_sql', table=table, rows=len(frame)):
+            frame.assign(**extra).to_sql(table, connection, if_exists=if_exists, index=False)
+        if_exists = 'append'
+
+    settle_listings(connection, table)
+    connection.commit()
+
+
+# Drop duplicate zpids from a table of cleaned listings (keeping the last) and fill missing daysOnZillow with
+# the mean
+def settle_listings(connection, table):
+    connection.execute("DELETE FROM {0} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {0} GROUP BY zpid)"
+                       .format(table))
+    connection.execute("UPDATE {0} SET daysOnZillow = (SELECT AVG(daysOnZillow) FROM {0}) "
+                       "WHERE daysOnZillow IS NULL".format(table))
+
+
+# Normalized tables and their columns, filled from master_table; every table's id is the
+# master_table rowid, so zp can link all of them in one set-based insert
+SCHEMA = {
+    'page': """
+    CREATE TABLE page (
+    url TEXT PRIMARY KEY NOT NULL,
+    daysOnZillow INTEGER,
+    pageViewCount INTEGER,
+    favoriteCount INTEGER
+    );
+    """,
+    'address': """
+    CREATE TABLE address (
+    address_id INTEGER PRIMARY KEY ASC,
+    city TEXT,
+    state TEXT,
+    address TEXT,
+    zipcode INTEGER,
+    region TEXT
+    );
+    """,
+    'physical': """
+    CREATE TABLE physical (
+    physical_id INTEGER PRIMARY KEY ASC,
+    bedrooms REAL,
+    bathrooms REAL,
+    livingArea REAL,
+    latitude REAL,
+    longitude REAL,
+    yearBuilt INTEGER,
+    homeType TEXT,
+    homeStatus TEXT,
+    isNonOwnerOccupied INTEGER,
+    is_fsba INTEGER,
+    is_fsbo INTEGER,
+    is_bankOwned INTEGER,
+    is_comingSoon INTEGER,
+    is_forAuction INTEGER,
+    is_foreclosure INTEGER,
+    is_newHome INTEGER,
+    is_openHouse INTEGER,
+    is_pending INTEGER
+    );
+    """,
+    'financial': """
+    CREATE TABLE financial (
+    financial_id INTEGER PRIMARY KEY ASC,
+    price REAL,
+    zestimate REAL,
+    restimate REAL,
+    priceChange REAL,
+    taxAssessedValue REAL,
+    taxAssessedYear INTEGER,
+    monthlyHoaFee REAL,
+    "30fixed_rate" REAL,
+    "15fixed_rate" REAL
+    );
+    """,
+    'zp': """
+    CREATE TABLE zp (
+    ID INTEGER UNIQUE PRIMARY KEY ASC,
+    zpid INTEGER,
+    url TEXT,
+    address_id INTEGER,
+    physical_id INTEGER,
+    financial_id INTEGER,
+    delisted INTEGER DEFAULT 0,
+    FOREIGN KEY (url) REFERENCES page (url) ON UPDATE CASCADE,
+    FOREIGN KEY (address_id) REFERENCES address (address_id) ON UPDATE CASCADE,
+    FOREIGN KEY (physical_id) REFERENCES physical (physical_id) ON UPDATE CASCADE,
+    FOREIGN KEY (financial_id) REFERENCES financial (financial_id) ON UPDATE CASCADE
+    );
+    """,
+}
+
+# Columns copied from master_table into each normalized table (after its id)
+TABLE_COLUMNS = {
+    'page': ['url', 'daysOnZillow', 'pageViewCount', 'favoriteCount'],
+    'address': ['city', 'state', 'address', 'zipcode', 'region'],
+    'physical': ['bedrooms', 'bathrooms', 'livingArea', 'latitude', 'longitude', 'yearBuilt', 'homeType',
+                 'homeStatus', 'isNonOwnerOccupied', 'is_fsba', 'is_fsbo', 'is_bankOwned', 'is_comingSoon',
+                 'is_forAuction', 'is_foreclosure', 'is_newHome', 'is_openHouse', 'is_pending'],
+    'financial': ['price', 'zestimate', 'restimate', 'priceChange', 'taxAssessedValue', 'taxAssessedYear',
+                  'monthlyHoaFee', '30fixed_rate', '15fixed_rate'],
+}
+
+# Page statistics that move on nearly every refresh: not a change of the listing, so update_db() refreshes
+# them in place (master_table and page only) instead of rewriting the listing's rows in every table
+VOLATILE_COLUMNS = ['daysOnZillow', 'pageViewCount', 'favoriteCount']
+
+# Price/zestimate/restimate of each listing every time it is first seen or changes
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_history (
+zpid INTEGER NOT NULL,
+snapshot_date TEXT NOT NULL,
+price REAL,
+zestimate REAL,
+restimate REAL,
+priceChange REAL,
+datePriceChanged REAL
+);
+"""
+
+# Every listing of every export loaded, one row per listing and snapshot date, tagged with the export it came
+# from; the days-on-market and price-drop trends (trends.py) are computed from it
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listing_snapshots (
+zpid INTEGER NOT NULL,
+snapshot_date TEXT NOT NULL,
+source TEXT,
+homeStatus TEXT,
+price REAL,
+zestimate REAL,
+restimate REAL,
+daysOnZillow REAL,
+PRIMARY KEY (zpid, snapshot_date)
+);
+"""
+SNAPSHOT_COLUMNS = ['zpid', 'snapshot_date', 'source', 'homeStatus', 'price', 'zestimate', 'restimate',
+                    'daysOnZillow']
+
+# R-tree over listing coordinates (id = master_table rowid), for radius and nearest-listing searches
+# Each listing is a point stored as a zero-size box
+SPATIAL_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS listing_rtree USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+"""
+
+# Grouping levels of the listing_stats aggregates, most specific first; imputation falls back down
+# the list until a group has enough listings
+STATS_LEVELS = [('zipcode', 'homeType', 'bedrooms'), ('zipcode', 'homeType'), ('zipcode',),
+                ('region', 'homeType', 'bedrooms'), ('region', 'homeType'), ('region',),
+                ('homeType', 'bedrooms'), ('homeType',), ()]
+STATS_GROUP_COLUMNS = ['zipcode', 'region', 'homeType', 'bedrooms']
+
+# Per-listing ratios summarized (median and count per group) in listing_stats
+STATS_COLUMNS = ['value_per_sqft', 'rent_per_sqft', 'rent_ratio', 'tax_ratio', 'value']
+
+# Indexes on the join and filter columns and on the columns the property browser sorts by (so a sorted page
+# is read in index order), created after the bulk inserts
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_master_zpid ON master_table (zpid)",
+    "CREATE INDEX IF NOT EXISTS idx_zp_zpid ON zp (zpid)",
+    "CREATE INDEX IF NOT EXISTS idx_zp_url ON zp (url)",
+    "CREATE INDEX IF NOT EXISTS idx_zp_address ON zp (address_id)",
+    "CREATE INDEX IF NOT EXISTS idx_zp_physical ON zp (physical_id)",
+    "CREATE INDEX IF NOT EXISTS idx_zp_financial ON zp (financial_id)",
+    "CREATE INDEX IF NOT EXISTS idx_address_zipcode ON address (zipcode)",
+    "CREATE INDEX IF NOT EXISTS idx_address_region ON address (region)",
+    "CREATE INDEX IF NOT EXISTS idx_physical_type_beds ON physical (homeType, bedrooms)",
+    "CREATE INDEX IF NOT EXISTS idx_financial_price ON financial (price)",
+    "CREATE INDEX IF NOT EXISTS idx_financial_zestimate ON financial (zestimate)",
+    "CREATE INDEX IF NOT EXISTS idx_financial_restimate ON financial (restimate)",
+    "CREATE INDEX IF NOT EXISTS idx_financial_price_change ON financial (priceChange)",
+    "CREATE INDEX IF NOT EXISTS idx_physical_bedrooms ON physical (bedrooms)",
+    "CREATE INDEX IF NOT EXISTS idx_physical_bathrooms ON physical (bathrooms)",
+    "CREATE INDEX IF NOT EXISTS idx_physical_living_area ON physical (livingArea)",
+    "CREATE INDEX IF NOT EXISTS idx_physical_year_built ON physical (yearBuilt)",
+    "CREATE INDEX IF NOT EXISTS idx_page_days ON page (daysOnZillow)",
+    "CREATE INDEX IF NOT EXISTS idx_page_views ON page (pageViewCount)",
+    "CREATE INDEX IF NOT EXISTS idx_page_favorites ON page (favoriteCount)",
+    "CREATE INDEX IF NOT EXISTS idx_history_zpid ON price_history (zpid, snapshot_date)",
+    "CREATE INDEX IF NOT EXISTS idx_snapshots_date ON listing_snapshots (snapshot_date)",
+]
+
+
+# Quote a column name for SQL (some start with digits, e.g. 30fixed_rate)
+def quote(column):
+    return '"{}"'.format(column)
+
+
+# Copy master_table rows (all of them, or those matching `where`) into the normalized tables
+def fill_tables(cursor, where=""):
+    # PAGE TABLE
+    columns = ", ".join(quote(col) for col in TABLE_COLUMNS['page'])
+    cursor.execute("INSERT INTO page ({0}) SELECT {0} FROM master_table {1}".format(columns, where))
+
+    # ADDRESS, PHYSICAL, FINANCIAL TABLES (id = master_table rowid)
+    for table in ['address', 'physical', 'financial']:
+        columns = ", ".join(quote(col) for col in TABLE_COLUMNS[table])
+        cursor.execute("INSERT INTO {0} ({0}_id, {1}) SELECT rowid, {1} FROM master_table {2}"
+                       .format(table, columns, where))
+
+    # ZP TABLE, linked to the other tables in the same insert
+    cursor.execute(
+    """
+    INSERT INTO zp (ID, zpid, url, address_id, physical_id, financial_id, delisted)
+    SELECT rowid, zpid, url, rowid, rowid, rowid, delisted FROM master_table {}
+    """.format(where)
+    )
+
+    # SPATIAL INDEX, listings without coordinates are left out
+    fill_spatial(cursor, where)
+
+
+# Add the coordinates of master_table rows (all of them, or those matching `where`) to the R-tree
+def fill_spatial(cursor, where=""):
+    cursor.execute(
+    """
+    INSERT INTO listing_rtree (id, min_lat, max_lat, min_lon, max_lon)
+    SELECT id, latitude, latitude, longitude, longitude
+    FROM (SELECT rowid AS id, latitude, longitude FROM master_table {})
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """.format(where)
+    )
+
+
+# Delete the normalized rows belonging to the master_table rows matching `where`
+def clear_tables(cursor, where):
+    ids = "SELECT rowid FROM master_table {}".format(where)
+    cursor.execute("DELETE FROM page WHERE url IN (SELECT url FROM zp WHERE ID IN ({}))".format(ids))
+    for table in ['address', 'physical', 'financial']:
+        cursor.execute("DELETE FROM {0} WHERE {0}_id IN ({1})".format(table, ids))
+    cursor.execute("DELETE FROM zp WHERE ID IN ({})".format(ids))
+    cursor.execute("DELETE FROM listing_rtree WHERE id IN ({})".format(ids))
+
+
+# Append the current price/zestimate/restimate of the staged listings matching `where` to price_history
+def record_snapshots(cursor, snapshot_date, source='staging', where=""):
+    cursor.execute(
+    """
+    INSERT INTO price_history (zpid, snapshot_date, price, zestimate, restimate, priceChange, datePriceChanged)
+    SELECT s.zpid, ?, s.price, s.zestimate, s.restimate, s.priceChange, s.datePriceChanged FROM {} s {}
+    """.format(source, where), (snapshot_date,)
+    )
+    return cursor.rowcount
+
+
+# Build the R-tree of a database created before it existed
+def ensure_spatial(connection):
+    cursor = connection.cursor()
+    if table_columns(cursor, 'listing_rtree') or not table_columns(cursor, 'master_table'):
+        return
+    cursor.execute("BEGIN")
+    cursor.execute(SPATIAL_SCHEMA)
+    fill_spatial(cursor)
+    connection.commit()
+
+
+# Group columns and STATS_COLUMNS ratios of every listing, NULL where an input is missing or zero
+RATIOS_SQL = """
+SELECT {},
+CASE WHEN zestimate > 0 AND livingArea > 0 THEN 1.0 * zestimate / livingArea END AS value_per_sqft,
+CASE WHEN restimate > 0 AND livingArea > 0 THEN 1.0 * restimate / livingArea END AS rent_per_sqft,
+CASE WHEN restimate > 0 AND zestimate > 0 THEN 1.0 * restimate / zestimate END AS rent_ratio,
+CASE WHEN taxAssessedValue > 0 AND zestimate > 0 THEN 1.0 * taxAssessedValue / zestimate END AS tax_ratio,
+CASE WHEN zestimate > 0 THEN 1.0 * zestimate END AS value
+FROM master_table
+""".format(", ".join(STATS_GROUP_COLUMNS))
+
+LISTING_STATS_SCHEMA = """
+CREATE TABLE listing_stats (
+level INTEGER,
+zipcode INTEGER,
+region TEXT,
+homeType TEXT,
+bedrooms REAL,
+{}
+);
+""".format(",\n".join(["{} REAL".format(col) for col in STATS_COLUMNS] +
+                      ["{}_count INTEGER".format(col) for col in STATS_COLUMNS]))
+
+
+# Materialize listing_stats: median and count of every ratio for each group of every level in STATS_LEVELS
+# (group columns a level doesn't use are NULL; groups with a NULL key are left out), in the caller's
+# transaction. Rebuilt whenever the
+# data changes, in bounded memory: counts come from a SQL GROUP BY over every distinct combination of the
+# group columns (the leaves, which every level's groups are unions of), and each ratio's values are read once
+# in sorted order, chunk by chunk, each group's median being picked up as its running count passes the middle
+@traced()
+def build_stats(connection, chunksize=CHUNK_ROWS):
+    count_columns = [col + '_count' for col in STATS_COLUMNS]
+    groups = ", ".join(STATS_GROUP_COLUMNS)
+    rows = connection.execute("SELECT {0}, {1} FROM ({2}) GROUP BY {0}".format(
+        groups, ", ".join("COUNT({})".format(col) for col in STATS_COLUMNS), RATIOS_SQL)).fetchall()
+    leaf_ids = {row[:len(STATS_GROUP_COLUMNS)]: leaf for leaf, row in enumerate(rows)}
+    leaves = pd.DataFrame.from_records(rows, columns=STATS_GROUP_COLUMNS + count_columns)
+
+    # Group of each leaf at every level (-1 where one of the level's keys is NULL), and each group's keys and counts
+    levels = []
+    for keys in STATS_LEVELS:
+        ids = {}
+        leaf_keys = zip(*(leaves[col] for col in keys)) if keys else [()] * len(leaves)
+        leaf_group = np.array([ids.setdefault(key, len(ids)) if all(pd.notna(value) for value in key) else -1
+                               for key in leaf_keys], dtype=int)
+        keep = leaf_group >= 0
+        sums = leaves[count_columns][keep].groupby(leaf_group[keep]).sum().reindex(range(len(ids)))
+        table = pd.DataFrame(list(ids), columns=list(keys)) if keys else pd.DataFrame(index=range(len(ids)))
+        for count_column in count_columns:
+            table[count_column] = sums[count_column].to_numpy()
+        levels.append((leaf_group, table))
+
+    for col in STATS_COLUMNS:
+        seen = [np.zeros(len(table), dtype=np.int64) for _, table in levels]
+        low = [np.full(len(table), np.nan) for _, table in levels]
+        high = [np.full(len(table), np.nan) for _, table in levels]
+        cursor = connection.execute("SELECT {0}, {1} FROM ({2}) WHERE {1} IS NOT NULL ORDER BY {1}"
+                                    .format(groups, col, RATIOS_SQL))
+        with span('stats medians', column=col):
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                leaf = np.fromiter((leaf_ids[row[:-1]] for row in rows), dtype=int, count=len(rows))
+                values = np.fromiter((row[-1] for row in rows), dtype=float, count=len(rows))
+                for level, (leaf_group, table) in enumerate(levels):
+                    group = leaf_group[leaf]
+                    keep = group >= 0
+                    group, level_values = group[keep], values[keep]
+                    # Rank of each value within its group, counting the values of earlier chunks
+                    rank = seen[level][group] + pd.Series(group).groupby(group).cumcount().to_numpy()
+                    count = table[col + '_count'].to_numpy()[group]
+                    middle = rank == (count - 1) // 2
+                    low[level][group[middle]] = level_values[middle]
+                    middle = rank == count // 2
+                    high[level][group[middle]] = level_values[middle]
+                    seen[level] += np.bincount(group, minlength=len(table))
+        for level, (_, table) in enumerate(levels):
+            table[col] = (low[level] + high[level]) / 2
+
+    columns = ['level'] + STATS_GROUP_COLUMNS + STATS_COLUMNS + [col + '_count' for col in STATS_COLUMNS]
+    stats = pd.concat([table.assign(level=level) for level, (_, table) in enumerate(levels)],
+                      ignore_index=True).reindex(columns=columns)
+    stats = stats.astype(object).where(stats.notna(), None)
+    connection.execute("DROP TABLE IF EXISTS listing_stats")
+    connection.execute(LISTING_STATS_SCHEMA)
+    connection.executemany("INSERT INTO listing_stats VALUES ({})".format(", ".join("?" * len(columns))),
+                           stats.itertuples(index=False, name=None))
+    return stats
+
+
+# Build the aggregates of a database created before they existed
+def ensure_stats(connection):
+    cursor = connection.cursor()
+    if not table_columns(cursor, 'listing_stats') and table_columns(cursor, 'master_table'):
+        cursor.execute("BEGIN")
+        build_stats(connection)
+        connection.commit()
+
+
+# Add any of INDEXES a database built before them lacks
+def ensure_indexes(connection):
+    cursor = connection.cursor()
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    cursor.execute("BEGIN")
+    for statement in INDEXES:
+        if statement.split(" ON ")[1].split()[0] in tables:
+            cursor.execute(statement)
+    connection.commit()
+
+
+# Return the column names of a table, empty if it doesn't exist
+def table_columns(cursor, table):
+    return [row[1] for row in cursor.execute("PRAGMA table_info({})".format(table))]
+
+
+# Drop and recreate the normalized tables, fill them from the master table and index them (inside the
+# caller's transaction)
+def create_tables(cursor):
+    for table in SCHEMA:
+        cursor.execute("DROP TABLE IF EXISTS {}".format(table))
+        cursor.execute(SCHEMA[table])
+    cursor.execute(HISTORY_SCHEMA)
+    cursor.execute(SNAPSHOT_SCHEMA)
+    cursor.execute("DROP TABLE IF EXISTS listing_rtree")
+    cursor.execute(SPATIAL_SCHEMA)
+
+    fill_tables(cursor)
+
+    for statement in INDEXES:
+        cursor.execute(statement)
+
+
+# Initialize database, create tables and schema
+# dataframe may be a cleaned frame or an iterable of cleaned chunks (see read_chunks())
+@traced()
+def init_db(dataframe, connection, cursor):
+    # Create master table from cleaned dataframe
+    write_frames(dataframe, connection, 'master_table', delisted=False)
+
+    # The normalized tables in one transaction (a single fsync instead of one per table)
+    cursor.execute("BEGIN")
+    try:
+        create_tables(cursor)
+    except Exception:
+        connection.rollback()
+        raise
+
+    connection.commit()
+
+
+# Merge a freshly cleaned export (frame or iterable of chunks) into the database by zpid: insert new
+# listings, rewrite only the rows that changed (page statistics that move daily are refreshed in place, see
+# VOLATILE_COLUMNS), mark listings missing from the export as delisted and append price moves to
+# price_history. Work is proportional to the number of changes; return their counts
+@traced()
+def update_db(dataframe, connection, snapshot_date=None):
+    write_frames(dataframe, connection, 'staging')
+    cursor = connection.cursor()
+    cursor.execute("BEGIN")
+    try:
+        changes = merge_staging(cursor, snapshot_date or time.strftime('%Y-%m-%d'))
+    except Exception:
+        connection.rollback()
+        raise
+
+    connection.commit()
+    return changes
+
+
+# Merge the listings written to `staging` (write_frames()) into the database as the snapshot of
+# `snapshot_date` and drop the staging table, inside the caller's transaction; see update_db()
+def merge_staging(cursor, snapshot_date, staging='staging'):
+    # First load: the staged export becomes the master table and every listing is new. A rebuild may carry
+    # history over from the database it replaces (copy_history()): only listings whose price moved since
+    # their latest history row are recorded
+    if 'zpid' not in table_columns(cursor, 'master_table'):
+        cursor.execute("DROP TABLE IF EXISTS master_table")
+        cursor.execute("ALTER TABLE {} RENAME TO master_table".format(staging))
+        cursor.execute("ALTER TABLE master_table ADD COLUMN delisted INTEGER DEFAULT 0")
+        create_tables(cursor)
+        snapshots = record_snapshots(cursor, snapshot_date, source='master_table', where="""
+        LEFT JOIN (SELECT zpid, MAX(snapshot_date), price, zestimate, restimate FROM price_history GROUP BY zpid) h
+        ON h.zpid = s.zpid
+        WHERE h.zpid IS NULL OR h.price IS NOT s.price OR h.zestimate IS NOT s.zestimate
+        OR h.restimate IS NOT s.restimate""")
+        inserted = cursor.execute("SELECT COUNT(*) FROM master_table").fetchone()[0]
+        return {'inserted': inserted, 'updated': 0, 'refreshed': 0, 'delisted': 0, 'snapshots': snapshots}
+
+    columns = table_columns(cursor, staging)
+    quoted = ", ".join(quote(col) for col in columns)
+    cursor.execute("CREATE INDEX idx_{0}_zpid ON {0} (zpid)".format(staging))
+    cursor.execute(HISTORY_SCHEMA)
+    cursor.execute(SNAPSHOT_SCHEMA)
+
+    # Tables built before a column was added to the export get it added now
+    master_columns = table_columns(cursor, 'master_table')
+    for col in columns + ['delisted']:
+        if col not in master_columns:
+            cursor.execute("ALTER TABLE master_table ADD COLUMN {}".format(quote(col)))
+    if 'delisted' not in table_columns(cursor, 'zp'):
+        cursor.execute("ALTER TABLE zp ADD COLUMN delisted INTEGER DEFAULT 0")
+    cursor.execute("UPDATE master_table SET delisted = 0 WHERE delisted IS NULL")
+    if not table_columns(cursor, 'listing_rtree'):
+        cursor.execute(SPATIAL_SCHEMA)
+        fill_spatial(cursor)
+
+    # Listings present in both whose values differ (or that come back after being delisted)
+    volatile = [col for col in VOLATILE_COLUMNS if col in columns]
+    differs = " OR ".join("m.{0} IS NOT s.{0}".format(quote(col)) for col in columns if col not in volatile)
+    cursor.execute("DROP TABLE IF EXISTS temp.changed")
+    cursor.execute("CREATE TEMP TABLE changed (master_id INTEGER PRIMARY KEY)")
+    cursor.execute(
+    """
+    INSERT INTO changed (master_id)
+    SELECT m.rowid FROM {} s JOIN master_table m ON m.zpid = s.zpid
+    WHERE m.delisted OR {}
+    """.format(staging, differs)
+    )
+    updated = cursor.rowcount
+
+    snapshots = record_snapshots(cursor, snapshot_date, source=staging, where="""
+    LEFT JOIN master_table m ON m.zpid = s.zpid
+    WHERE m.zpid IS NULL OR m.price IS NOT s.price OR m.zestimate IS NOT s.zestimate
+    OR m.restimate IS NOT s.restimate""")
+
+    # Other listings whose page statistics alone moved: only those columns are updated
+    cursor.execute("DROP TABLE IF EXISTS temp.refreshed")
+    cursor.execute("CREATE TEMP TABLE refreshed (master_id INTEGER PRIMARY KEY)")
+    refreshed = 0
+    if volatile:
+        cursor.execute(
+        """
+        INSERT INTO refreshed (master_id)
+        SELECT m.rowid FROM {} s JOIN master_table m ON m.zpid = s.zpid
+        WHERE m.rowid NOT IN (SELECT master_id FROM changed) AND ({})
+        """.format(staging, " OR ".join("m.{0} IS NOT s.{0}".format(quote(col)) for col in volatile))
+        )
+        refreshed = cursor.rowcount
+        quoted_volatile = ", ".join(quote(col) for col in volatile)
+        cursor.execute(
+        """
+        UPDATE master_table SET ({0}) = (SELECT {0} FROM {1} s WHERE s.zpid = master_table.zpid)
+        WHERE rowid IN (SELECT master_id FROM refreshed)
+        """.format(quoted_volatile, staging)
+        )
+        cursor.execute(
+        """
+        UPDATE page SET ({0}) = (SELECT {1} FROM zp z JOIN master_table m ON m.rowid = z.ID WHERE z.url = page.url)
+        WHERE url IN (SELECT url FROM zp WHERE ID IN (SELECT master_id FROM refreshed))
+        """.format(quoted_volatile, ", ".join("m." + quote(col) for col in volatile))
+        )
+
+    # Rewrite changed rows in place (their ids stay the same)
+    touched = "WHERE rowid IN (SELECT master_id FROM changed)"
+    clear_tables(cursor, touched)
+    cursor.execute(
+    """
+    UPDATE master_table SET ({0}, delisted) = (SELECT {0}, 0 FROM {1} s WHERE s.zpid = master_table.zpid)
+    {2}
+    """.format(quoted, staging, touched)
+    )
+
+    # New listings get the next ids
+    last_id = cursor.execute("SELECT IFNULL(MAX(rowid), 0) FROM master_table").fetchone()[0]
+    cursor.execute(
+    """
+    INSERT INTO master_table ({0}, delisted)
+    SELECT {0}, 0 FROM {1} WHERE zpid NOT IN (SELECT zpid FROM master_table)
+    """.format(quoted, staging)
+    )
+    inserted = cursor.rowcount
+
+    fill_tables(cursor, "{} OR rowid > {}".format(touched, int(last_id)))
+
+    # Listings no longer in the export
+    gone = "WHERE NOT delisted AND zpid NOT IN (SELECT zpid FROM {})".format(staging)
+    cursor.execute("UPDATE zp SET delisted = 1 " + gone)
+    cursor.execute("UPDATE master_table SET delisted = 1 " + gone)
+    delisted = cursor.rowcount
+
+    cursor.execute("DROP TABLE {}".format(staging))
+    cursor.execute("DROP TABLE temp.changed")
+    cursor.execute("DROP TABLE temp.refreshed")
+    for statement in INDEXES:
+        cursor.execute(statement)
+    return {'inserted': inserted, 'updated': updated, 'refreshed': refreshed, 'delisted': delisted,
+            'snapshots': snapshots}
+
+
+# Low-cardinality text columns, stored as categoricals
+CATEGORY_COLUMNS = ['city', 'state', 'homeType', 'homeStatus', 'region']
+
+# Listing flags, stored as 1-byte booleans (SQLite hands them back as int64)
+FLAG_COLUMNS = ['isNonOwnerOccupied', 'is_fsba', 'is_fsbo', 'is_bankOwned', 'is_comingSoon', 'is_forAuction',
+                'is_foreclosure', 'is_newHome', 'is_openHouse', 'is_pending', 'delisted']
+
+
+# Return a copy of a listings frame in the compact schema: categoricals for low-cardinality strings,
+# booleans for flags, the smallest integer type that fits and float32 wherever it holds every value exactly
+def compact_frame(df):
+    df = df.copy()
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif col in FLAG_COLUMNS and df[col].notna().all():
+            df[col] = df[col].astype(bool)
+        elif pd.api.types.is_integer_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif pd.api.types.is_float_dtype(df[col]):
+            narrow = df[col].astype('float32')
+            if narrow.astype('float64').equals(df[col].astype('float64')):
+                df[col] = narrow
+    return df
+
+
+# Per-column dtype and memory (bytes) of a frame before and after compact_frame(), with a total row
+def memory_report(before, after):
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_after': after.memory_usage(index=False, deep=True),
+    })
+    report.loc['TOTAL'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    return report
+
+
+# Fingerprint the source CSV, hashing its content (or just size + mtime when quick=True)
+def source_fingerprint(path=CSV_PATH, quick=False):
+    if quick:
+        stat = os.stat(path)
+        return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Date in an export's file name (2022-04-03 or 20220403), else the day the file was last modified
+SNAPSHOT_DATE = re.compile(r'(20\d\d)-?([01]\d)-?([0-3]\d)')
+
+
+def snapshot_date(path):
+    match = SNAPSHOT_DATE.search(os.path.basename(path))
+    if match:
+        return "-".join(match.groups())
+    return time.strftime('%Y-%m-%d', time.localtime(os.stat(path).st_mtime))
+
+
+# Name an export's rows are tagged with: its file name without the extension
+def export_source(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# The exports named by a file, a directory (every .csv in it) or a glob pattern, oldest snapshot first
+def export_paths(pattern=CSV_PATH):
+    if os.path.isfile(pattern):
+        return [pattern]
+    paths = glob.glob(os.path.join(pattern, '*.csv') if os.path.isdir(pattern) else pattern)
+    if not paths:
+        raise FileNotFoundError("No exports found at {}".format(pattern))
+    return sorted(paths, key=lambda path: (snapshot_date(path), path))
+
+
+# Fingerprint a set of exports: a single export's own fingerprint, else a hash of every export's path and
+# fingerprint (content hashes run in threads; hashlib releases the GIL on large reads)
+def exports_fingerprint(paths, quick=False):
+    if len(paths) == 1:
+        return source_fingerprint(paths[0], quick)
+    if quick:
+        fingerprints = [source_fingerprint(path, quick) for path in paths]
+    else:
+        with ThreadPoolExecutor(min(len(paths), os.cpu_count() or 1)) as pool:
+            fingerprints = list(pool.map(source_fingerprint, paths))
+    lines = ["{} {}".format(os.path.abspath(path), fingerprint) for path, fingerprint in zip(paths, fingerprints)]
+    return hashlib.sha1("\n".join(lines).encode()).hexdigest()
+
+
+# Parse and clean one export into its own SQLite file (runs in a worker process), a chunk at a time: its
+# listing_snapshots columns, tagged with the export, in `snapshots` and, with listings=True, the cleaned
+# listings in `listings`. Nothing reads the file before it is finished and a failed load throws it away, so
+# it is written without a journal
+def stage_export(path, staging_path, listings=True, chunksize=CHUNK_ROWS):
+    connection = sqlite3.connect(staging_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        source = export_source(path)
+        if_exists = 'replace'
+        for chunk in read_chunks(path, chunksize):
+            snapshots = chunk.assign(source=source).reindex(columns=SNAPSHOT_COLUMNS[:1] + SNAPSHOT_COLUMNS[2:])
+            snapshots.to_sql('snapshots', connection, if_exists=if_exists, index=False)
+            if listings:
+                chunk.to_sql('listings', connection, if_exists=if_exists, index=False)
+            if_exists = 'append'
+        connection.commit()
+    finally:
+        connection.close()
+    return staging_path
+
+
+# Stage exports in parallel worker processes (stage_export(), each into a file of `directory`); yield each
+# export's file as soon as it and every export before it is done, so the caller copies them in `paths` order
+# while later exports are still being parsed. `listings` holds one flag per export
+def stage_exports(paths, directory, listings, workers=None, chunksize=CHUNK_ROWS):
+    staging_paths = [os.path.join(directory, '{}.db'.format(index)) for index in range(len(paths))]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        for args in zip(paths, staging_paths, listings):
+            yield stage_export(*args, chunksize=chunksize)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        for staging_path in pool.map(stage_export, paths, staging_paths, listings, [chunksize] * len(paths)):
+            yield staging_path
+
+
+# Append the table `source` of an attached staging file to `table` of the main database (created from the
+# first one appended), over the columns they share
+def append_staged(cursor, source, table):
+    columns = [row[1] for row in cursor.execute("PRAGMA staged.table_info({})".format(source))]
+    if not table_columns(cursor, table):
+        cursor.execute("CREATE TABLE {} AS SELECT * FROM staged.{}".format(table, source))
+        return
+    columns = ", ".join(quote(col) for col in table_columns(cursor, table) if col in columns)
+    cursor.execute("INSERT INTO {0} ({1}) SELECT {1} FROM staged.{2}".format(table, columns, source))
+
+
+# Move the snapshot rows staged in `table` into listing_snapshots under `date` (a listing in two exports of
+# the date keeps the row of the later one), inside the caller's transaction; return the number of rows written
+def record_staged_snapshots(cursor, date, table):
+    if not table_columns(cursor, table):
+        return 0
+    columns = SNAPSHOT_COLUMNS[:1] + SNAPSHOT_COLUMNS[2:]
+    cursor.execute(SNAPSHOT_SCHEMA)
+    cursor.execute("INSERT OR REPLACE INTO listing_snapshots (snapshot_date, {0}) "
+                   "SELECT ?, {0} FROM {1} ORDER BY rowid".format(", ".join(columns), table), (date,))
+    written = cursor.rowcount
+    cursor.execute("DROP TABLE {}".format(table))
+    return written
+
+
+# Copy the price_history and listing_snapshots rows dated before `before` from the database at `db_path` (if
+# there is one) into a rebuild, so rebuilding from the current exports keeps the history of earlier snapshots;
+# return the number of rows copied
+def copy_history(connection, db_path, before):
+    if not os.path.exists(db_path):
+        return 0
+    cursor = connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS live", (db_path,))
+    copied = 0
+    try:
+        cursor.execute("BEGIN")
+        cursor.execute(HISTORY_SCHEMA)
+        cursor.execute(SNAPSHOT_SCHEMA)
+        for table in ('price_history', 'listing_snapshots'):
+            live = {row[1] for row in cursor.execute("PRAGMA live.table_info({})".format(table))}
+            columns = ", ".join(quote(col) for col in table_columns(cursor, table) if col in live)
+            if 'snapshot_date' in live:
+                cursor.execute("INSERT INTO main.{0} ({1}) SELECT {1} FROM live.{0} WHERE snapshot_date < ?"
+                               .format(table, columns), (before,))
+                copied += cursor.rowcount
+        connection.commit()
+    finally:
+        cursor.execute("DETACH DATABASE live")
+    return copied
+
+
+# Newest snapshot date loaded into the database, None if there is none
+def latest_snapshot(connection):
+    if not table_columns(connection.cursor(), 'listing_snapshots'):
+        return None
+    return connection.execute("SELECT MAX(snapshot_date) FROM listing_snapshots").fetchone()[0]
+
+
+# Load exports into the database one snapshot date at a time, oldest first. Exports are parsed and cleaned in
+# parallel worker processes (stage_exports()) and copied into per-date staging tables as they finish (these
+# writes commit as they go); then every date is merged by
+# merge_staging() in a single transaction, left open for the caller to commit (or roll back) along with
+# anything else that goes with the load, so readers see all of it or none of it. price_history and delisting
+# follow the snapshots in order (the first date of an empty database is a full build); every export's listings
+# are recorded in listing_snapshots under its source and date. Dates older than the newest one already loaded
+# only add their snapshots. Return merge_staging()'s change counts, summed over the dates merged
+def load_exports(paths, connection, chunksize=CHUNK_ROWS, workers=None):
+    cursor = connection.cursor()
+    loaded = latest_snapshot(connection)
+
+    # Leftovers of a load that failed before its merge
+    for (table,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND "
+                                   "(name GLOB 'staging_*' OR name GLOB 'snapshot_staging_*')").fetchall():
+        cursor.execute("DROP TABLE {}".format(table))
+
+    # Dates older than the newest one loaded only add their snapshots
+    groups = [(date, list(group)) for date, group in itertools.groupby(paths, key=snapshot_date)]
+    merged = [loaded is None or date >= loaded for date, _ in groups]
+    flags = [merge for merge, (_, group) in zip(merged, groups) for _ in group]
+
+    # Exports are parsed and cleaned in worker processes; each one's file is copied into the staging tables
+    # of its date, in order, as it comes in
+    directory = tempfile.mkdtemp(prefix='staging', dir=os.path.dirname(os.path.abspath(
+        connection.execute("PRAGMA database_list").fetchone()[2] or DB_PATH)))
+    try:
+        staged = stage_exports(paths, directory, flags, workers, chunksize)
+        for index, ((date, group), merge) in enumerate(zip(groups, merged)):
+            with span('stage_snapshot', date=date, exports=len(group)):
+                for _ in group:
+                    staging_path = next(staged)
+                    cursor.execute("ATTACH DATABASE ? AS staged", (staging_path,))
+                    try:
+                        append_staged(cursor, 'snapshots', 'snapshot_staging_{}'.format(index))
+                        if merge:
+                            append_staged(cursor, 'listings', 'staging_{}'.format(index))
+                        connection.commit()
+                    finally:
+                        connection.rollback()
+                        cursor.execute("DETACH DATABASE staged")
+                    os.remove(staging_path)
+                if merge:
+                    settle_listings(connection, 'staging_{}'.format(index))
+                    connection.commit()
+    finally:
+        staged.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    changes = None
+    cursor.execute("BEGIN")
+    for index, ((date, _), merge) in enumerate(zip(groups, merged)):
+        with span('load_snapshot', date=date):
+            if merge:
+                counts = merge_staging(cursor, date, 'staging_{}'.format(index))
+                changes = counts if changes is None else {name: changes[name] + counts[name] for name in changes}
+            record_staged_snapshots(cursor, date, 'snapshot_staging_{}'.format(index))
+    return changes
+
+
+# Return the fingerprint zillow.db was last built from, None if it was never built
+def stored_fingerprint(connection):
+    try:
+        row = connection.execute("SELECT fingerprint FROM ingest_meta").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+# Record the fingerprint and build time of a finished build (in the build's transaction)
+def store_fingerprint(connection, fingerprint, seconds):
+    connection.execute("""DROP TABLE IF EXISTS ingest_meta""")
+    connection.execute("""
+    CREATE TABLE ingest_meta (
+    fingerprint TEXT NOT NULL,
+    built_at REAL,
+    build_seconds REAL
+    );
+    """)
+    connection.execute("INSERT INTO ingest_meta VALUES (?, ?, ?)", (fingerprint, time.time(), seconds))
+
+
+# Databases already checked against their exports in this process, keyed by check_key(). _checked has its own
+# short lock, so looking a database up never waits on a build (which holds _load_lock throughout)
+_checked = {}
+_checked_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+
+# (exports, db, size + mtime of every export): changes whenever an export is added, removed or touched
+def check_key(csv_path, db_path, paths):
+    return os.path.abspath(csv_path), os.path.abspath(db_path), exports_fingerprint(paths, quick=True)
+
+
+# Fingerprint a database was checked against in this process, None if it wasn't
+def checked_fingerprint(key):
+    with _checked_lock:
+        return _checked.get(key)
+
+
+# Make sure the database matches the exports at `csv_path` (a CSV, a directory of them or a glob, see
+# load_exports()) and return ingest stats. Reruns in the same process skip the check; otherwise the
+# database is only rebuilt when the content hash of the exports no longer matches the one stored in it.
+# With incremental=True changed exports are merged into the live database in place, in one transaction on its
+# writer (load_exports()), so the work follows the size of the changes and readers see the old version until it
+# commits. Otherwise the database is rebuilt in a separate file and published when finished
+# (db.Database.build()), keeping the price history and snapshots of dates before the exports (copy_history()).
+# Exports are parsed and cleaned by `workers` processes (default: one per CPU). Either way the aggregates and
+# the default-terms metrics are brought up to date in the same transaction (estimates.build_metrics()).
+# One check or build runs at a time; with wait=False a call that would wait for another returns None at once
+# (the caller carries on with the database as last published)
+@traced()
+def ensure_db(csv_path=CSV_PATH, db_path=DB_PATH, incremental=False, chunksize=CHUNK_ROWS, workers=None, wait=True):
+    # estimates imports this module
+    from estimates import build_metrics, ensure_metrics
+
+    start = time.perf_counter()
+    paths = export_paths(csv_path)
+    key = check_key(csv_path, db_path, paths)
+    changes = None
+
+    fingerprint = checked_fingerprint(key)
+    if fingerprint is not None:
+        return {'key': key, 'fingerprint': fingerprint, 'source': 'memory', 'cache_hit': True, 'changes': None,
+                'seconds': time.perf_counter() - start}
+    if not _load_lock.acquire(blocking=wait):
+        return None
+    try:
+        # Another thread may have finished the check while this one waited
+        fingerprint = checked_fingerprint(key)
+        if fingerprint is not None:
+            source = 'memory'
+        else:
+            with span('source_fingerprint'):
+                fingerprint = exports_fingerprint(paths)
+            database = get_database(db_path)
+            current = None
+            if os.path.exists(db_path):
+                with database.reader() as conn:
+                    current = stored_fingerprint(conn)
+            if current == fingerprint:
+                source = 'database'
+                with database.writer() as conn:
+                    ensure_spatial(conn)
+                    ensure_indexes(conn)
+                    ensure_stats(conn)
+                    ensure_metrics(conn)
+            elif incremental:
+                source = 'update'
+                with database.writer() as conn:
+                    try:
+                        changes = load_exports(paths, conn, chunksize, workers)
+                        build_stats(conn)
+                        build_metrics(conn, chunksize)
+                        store_fingerprint(conn, fingerprint, time.perf_counter() - start)
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    conn.commit()
+            else:
+                source = 'rebuild'
+                with database.build() as conn:
+                    with span('copy_history'):
+                        copy_history(conn, db_path, snapshot_date(paths[0]))
+                    changes = load_exports(paths, conn, chunksize, workers)
+                    build_stats(conn)
+                    build_metrics(conn, chunksize)
+                    store_fingerprint(conn, fingerprint, time.perf_counter() - start)
+            with _checked_lock:
+                _checked.clear()
+                _checked[key] = fingerprint
+    finally:
+        _load_lock.release()
+
+    return {'key': key, 'fingerprint': fingerprint, 'source': source,
+            'cache_hit': source in ('memory', 'database'), 'changes': changes,
+            'seconds': time.perf_counter() - start}
+
+
+# Ingest stats for the database as it was last built, without checking it against the CSV: None when it has
+# no finished build (or predates the spatial index, aggregates and metrics), so the caller must run ensure_db()
+# first. Lets the app draw from an existing database straight away and defer the check until the page is out
+def last_build(csv_path=CSV_PATH, db_path=DB_PATH):
+    start = time.perf_counter()
+    key = check_key(csv_path, db_path, export_paths(csv_path))
+    fingerprint = checked_fingerprint(key)
+    if fingerprint is not None:
+        return {'key': key, 'fingerprint': fingerprint, 'source': 'memory', 'cache_hit': True, 'changes': None,
+                'seconds': time.perf_counter() - start}
+    if not os.path.exists(db_path):
+        return None
+
+    with get_database(db_path).reader() as conn:
+        fingerprint = stored_fingerprint(conn)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    if fingerprint is None or not {'listing_rtree', 'listing_stats', 'listing_metrics'} <= tables:
+        return None
+    return {'key': None, 'fingerprint': fingerprint, 'source': 'unchecked', 'cache_hit': True, 'changes': None,
+            'seconds': time.perf_counter() - start}
+
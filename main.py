@@ -1,281 +1,155 @@
 # Import Libraries
-import npf as npf
+# Only what the property browser needs is imported here; folium and plotly are imported inside the functions
+# that draw maps and charts, so a cold start reaches the grid without loading them
+import time
+RUN_STARTED = time.perf_counter()
 import streamlit as st
 import pandas as pd
-import numpy_financial as npf
-import sqlite3
-from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, DataReturnMode, JsCode
-from streamlit_folium import folium_static
-import folium
-import plotly.express as px
+import numpy as np
+from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode
+import streamlit.components.v1 as components
+from dataclasses import replace
+import os
+from cache import LRUCache
+from charts import appreciation_chart, expense_breakdown, expense_chart
+from db import get_database
+from estimates import impute, load_stats
+from ingest import CSV_PATH, DB_PATH, compact_frame, ensure_db, last_build, memory_report
+from metrics import GRID_METRICS, Assumptions, compute_metrics, sensitivity
+from screener import OBJECTIVES, screen
+from simulation import SimulationSettings, simulate, summarize
+from spatial import map_points, nearest, within_radius
+from queries import FLAGS, ListingFilter, count_listings, distinct_values, get_listing, query_page
+from tracing import span, start_trace, stop_trace, traced
+from trends import days_on_market_trend, largest_price_drops, price_drop_trend, snapshot_dates
+IMPORT_SECONDS = time.perf_counter() - RUN_STARTED
 
 
 # Set Page Width
 st.set_page_config(layout="wide")
 
-# Clean CSV, return dataframe
-def clean_data():
-
-    # Load CSV
-    df = pd.read_csv("zillow_philly_data.csv", header=0, index_col=False)
-
-    # Delete, rename columns
-    df.drop(columns=['parentRegion', 'mortgageRates', 'datePriceChanged', 'timeOnZillow'], inplace=True)
-    df.rename(columns={'address/city': 'city', 'address/state': 'state',
-                       'address/streetAddress': 'address', 'address/zipcode': 'zipcode',
-                       'listing_sub_type/is_FSBA': 'is_fsba', 'listing_sub_type/is_FSBO': 'is_fsbo',
-                       'listing_sub_type/is_bankOwned': 'is_bankOwned',
-                       'listing_sub_type/is_comingSoon': 'is_comingSoon',
-                       'listing_sub_type/is_forAuction': 'is_forAuction',
-                       'listing_sub_type/is_foreclosure': 'is_foreclosure',
-                       'listing_sub_type/is_newHome': 'is_newHome', 'listing_sub_type/is_openHouse': 'is_openHouse',
-                       'listing_sub_type/is_pending': 'is_pending', 'mortgageRates/arm5Rate': 'arm5_rate',
-                       'mortgageRates/fifteenYearFixedRate': '15fixed_rate',
-                       'mortgageRates/thirtyYearFixedRate': '30fixed_rate',
-                       'parentRegion/name': 'region', 'rentZestimate': 'restimate'}, inplace=True)
-    pd.set_option('display.max_columns', None)
-
-    # Create zpid column from url
-    df['zpid'] = df['url'].str.extract('((?<=\/)\d*(?=_zpid))')
-    zpid_column = df.pop('zpid')
-    df.insert(0, 'zpid', zpid_column)
-
-    # Convert data types
-    df['zpid'] = df['zpid'].astype(int)
-    df['is_openHouse'] = df['is_openHouse'].astype(bool)
-    df['yearBuilt'] = df['yearBuilt'].fillna(0).astype(int)
-    df['taxAssessedYear'] = df['taxAssessedYear'].fillna(0).astype(int)
-    # df['daysOnZillow'] = df['daysOnZillow'].fillna(200).astype(int)
-    df['daysOnZillow'].fillna(value=df['daysOnZillow'].mean(), inplace=True)
-    df['price'] = df['price'].astype(float)
-    df['priceChange'] = df['priceChange'].fillna(0).astype(float)
-    df['zestimate'] = df['zestimate'].fillna(0).astype(float)
-    df['restimate'] = df['restimate'].fillna(0).astype(float)
-    df['taxAssessedValue'] = df['taxAssessedValue'].fillna(0).astype(float)
-    df['monthlyHoaFee'] = df['monthlyHoaFee'].fillna(0).astype(float)
-
-    return df
-
-
-# Initialize database, create tables and schema
-def init_db(dataframe, connection, cursor):
-    # Create master table from cleaned dataframe
-    dataframe.to_sql('master_table', connection, if_exists ='replace', index = False)
-    connection.commit()
-
-    # Drop table if exists, create table with constraints, insert data from master table, commit to conn
-
-    # PAGE TABLE
-
-    cursor.execute("""DROP TABLE IF EXISTS page""")
-
-    cursor.execute("""
-    CREATE TABLE page (
-    url TEXT PRIMARY KEY NOT NULL,
-    daysOnZillow INTEGER,
-    pageViewCount INTEGER,
-    favoriteCount INTEGER
-    );
-    """)
-
-    cursor.execute(
-    """
-    INSERT INTO page (url, daysOnZillow, pageViewCount, favoriteCount)
-    SELECT url, daysOnZillow, pageViewCount, favoriteCount FROM master_table"""
-    )
-
-    connection.commit()
-
-    # ADDRESS TABLE
-
-    cursor.execute("""DROP TABLE IF EXISTS address""")
-
-    cursor.execute("""
-    CREATE TABLE address (
-    address_id INTEGER PRIMARY KEY ASC,
-    city TEXT,
-    state TEXT, 
-    address TEXT,
-    zipcode INTEGER, 
-    region TEXT
-    );
-    """)
-
-    cursor.execute(
-    """
-    INSERT INTO address (city, state, address, zipcode, region)
-    SELECT city, state, address, zipcode, region FROM master_table"""
-    )
-
-    connection.commit()
-
-    # PHYSICAL TABLE
-
-    cursor.execute("""DROP TABLE IF EXISTS physical""")
-
-    cursor.execute("""
-    CREATE TABLE physical (
-    physical_id INTEGER PRIMARY KEY ASC,
-    bedrooms REAL,
-    bathrooms REAL,
-    livingArea REAL,
-    latitude REAL,
-    longitude REAL,
-    yearBuilt INTEGER,
-    homeType TEXT,
-    homeStatus TEXT,
-    isNonOwnerOccupied INTEGER,
-    is_fsba INTEGER,
-    is_fsbo INTEGER,
-    is_bankOwned INTEGER,
-    is_comingSoon INTEGER,
-    is_forAuction INTEGER,
-    is_foreclosure INTEGER,
-    is_newHome INTEGER,
-    is_openHouse INTEGER,
-    is_pending INTEGER
-    );
-    """)
-
-    cursor.execute(
-    """
-    INSERT INTO physical (bedrooms, bathrooms, livingArea, latitude, longitude, yearBuilt, homeType,homeStatus, 
-    isNonOwnerOccupied, is_fsba, is_fsbo, is_bankOwned, is_comingSoon, is_forAuction,
-    is_foreclosure, is_newHome, is_openHouse, is_pending)
-    SELECT bedrooms, bathrooms, livingArea, latitude, longitude, yearBuilt, homeType,homeStatus, isNonOwnerOccupied,
-    is_fsba, is_fsbo, is_bankOwned, is_comingSoon, is_forAuction,
-    is_foreclosure, is_newHome, is_openHouse, is_pending FROM master_table"""
-    )
-
-    connection.commit()
-
-    # FINANCIAL TABLE
-
-    cursor.execute("""DROP TABLE IF EXISTS financial""")
-
-    cursor.execute("""
-    CREATE TABLE financial (
-    financial_id INTEGER PRIMARY KEY ASC,
-    price REAL,
-    zestimate REAL,
-    restimate REAL,
-    priceChange REAL,
-    taxAssessedValue REAL,
-    taxAssessedYear INTEGER,
-    monthlyHoaFee REAL,
-    "30fixed_rate" REAL,
-    "15fixed_rate" REAL
-    );
-    """)
-
-    cursor.execute(
-    """
-    INSERT INTO financial (price, zestimate, restimate, priceChange, taxAssessedValue,
-    TaxAssessedYear, monthlyHoaFee, "30fixed_rate", "15fixed_rate")
-    SELECT price, zestimate, restimate, priceChange, taxAssessedValue,
-    TaxAssessedYear, monthlyHoaFee, "30fixed_rate", "15fixed_rate" FROM master_table"""
-    )
-
-    connection.commit()
-
-    # ZP TABLE
-
-    cursor.execute("""DROP TABLE IF EXISTS zp""")
-
-    cursor.execute("""
-    CREATE TABLE zp (
-    ID INTEGER UNIQUE PRIMARY KEY ASC,
-    zpid INTEGER,
-    url TEXT,
-    address_id INTEGER,
-    physical_id INTEGER,
-    financial_id INTEGER,
-    FOREIGN KEY (url) REFERENCES page (url) ON UPDATE CASCADE,
-    FOREIGN KEY (address_id) REFERENCES address (address_id) ON UPDATE CASCADE,
-    FOREIGN KEY (physical_id) REFERENCES physical (physical_id) ON UPDATE CASCADE,
-    FOREIGN KEY (financial_id) REFERENCES financial (financial_id) ON UPDATE CASCADE
-    );
-    """)
-
-    cursor.execute(
-    """
-    INSERT INTO zp (zpid, url)
-    SELECT zpid, url FROM master_table;
-    """
-    )
-
-    cursor.execute(
-    """
-    UPDATE zp 
-    SET address_id = (
-    SELECT address_id
-    FROM address
-    WHERE ID = address_id)
-    """
-    )
-
-    cursor.execute(
-    """
-    UPDATE zp 
-    SET physical_id = (
-    SELECT physical_id
-    FROM physical
-    WHERE ID = physical_id)
-    """
-    )
-
-    cursor.execute(
-    """
-    UPDATE zp 
-    SET financial_id = (
-    SELECT financial_id
-    FROM financial
-    WHERE ID = financial_id)
-    """
-    )
-
-
-    connection.commit()
-
-
-# Return table's corresponding dataframes (for streamlit interactive compatibility)
-def get_dfs(connector):
-    df1 = pd.read_sql("SELECT * FROM address", con=connector)
-    df2 = pd.read_sql("SELECT * FROM financial", con=connector)
-    df3 = pd.read_sql("SELECT * FROM page", con=connector)
-    df4 = pd.read_sql("SELECT * FROM physical", con=connector)
-    df5 = pd.read_sql("SELECT * FROM zp", con=connector)
-    df6 = pd.read_sql("SELECT * FROM master_table", con=connector)
-    return df1, df2, df3, df4, df5, df6
-
-# Reorganize Columns for Grid, return organized df
-def reorganize_columns(df):
-    df = df[['zpid', 'price', 'bathrooms', 'bedrooms', 'livingArea', 'homeStatus',
-               'homeType', 'city', 'state', 'address', 'zipcode', 'region',
-               'zestimate', 'restimate', 'pageViewCount', 'daysOnZillow',
-               'favoriteCount', 'isNonOwnerOccupied', 'latitude',
-               'is_fsba', 'is_fsbo', 'is_bankOwned', 'is_comingSoon', 'is_forAuction', 'is_foreclosure',
-               'is_newHome', 'is_openHouse', 'is_pending', 'longitude', 'monthlyHoaFee', 'arm5_rate', '15fixed_rate',
-               '30fixed_rate', 'priceChange', 'propertyTaxRate',
-               'restimateHighPercent', 'restimateLowPercent', 'taxAssessedValue', 'taxAssessedYear', 'url', 'yearBuilt',
-               'zestimateHighPercent', 'zestimateLowPercent']]
-    return df
-
-
-def create_grid(dfs):
+# Record per-stage timings of this rerun when the Performance panel's switch is on (or PHILLY_TRACE=1)
+trace = start_trace(st.session_state.get('trace_enabled', False) or os.environ.get('PHILLY_TRACE') == '1',
+                    memory=st.session_state.get('trace_memory', False))
+
+
+# Per-process caches shared by every session: listing rows, counts and filter choices by data fingerprint,
+# calculator analyses by zpid + inputs, rendered maps, and chart figures by their numeric inputs
+@st.experimental_singleton
+def get_caches():
+    return {'listings': LRUCache(1024), 'analyses': LRUCache(256), 'maps': LRUCache(32), 'charts': LRUCache(128)}
+
+
+# Exports the database is built from: the bundled CSV, or a directory/glob of exports (cleaned in parallel,
+# kept as dated snapshots for the market trends)
+EXPORTS = os.environ.get('PHILLY_EXPORTS', CSV_PATH)
+
+# Columns the property browser shows, in grid order; nothing else is sent to the grid
+GRID_COLUMNS = ['zpid', 'price', 'bathrooms', 'bedrooms', 'livingArea', 'homeStatus',
+                'homeType', 'city', 'state', 'region', 'zestimate', 'restimate', 'pageViewCount', 'daysOnZillow',
+                'favoriteCount', 'priceChange', 'yearBuilt']
+
+# Columns the property browser can sort by, each read in the order of its index (ingest.INDEXES, and
+# estimates.METRIC_INDEXES for the investment metrics)
+SORT_COLUMNS = ['price', 'zestimate', 'restimate', 'bedrooms', 'bathrooms', 'livingArea', 'yearBuilt',
+                'daysOnZillow', 'pageViewCount', 'favoriteCount', 'priceChange', 'zpid'] + GRID_METRICS
+
+# Columns of the selected property used by the calculator and map
+DETAIL_COLUMNS = ['zpid', 'price', 'zestimate', 'restimate', 'taxAssessedValue', 'monthlyHoaFee', 'address',
+                  'city', 'state', 'zipcode', 'url', 'latitude', 'longitude', 'bedrooms', 'bathrooms', 'homeType',
+                  'livingArea', 'region']
+
+# Columns shown for comparable properties, with their headers
+COMP_COLUMNS = {'zpid': "ZPID", 'address': "Address", 'distance': "Distance (m)", 'price': "Price",
+                'zestimate': "Market Value", 'restimate': "Rental Value", 'bedrooms': "Bedrooms",
+                'bathrooms': "Bathrooms", 'livingArea': "Living Area (sqft)", 'homeType': "Home Type"}
+
+# Metrics offered by the sensitivity tables
+SENSITIVITY_METRICS = {'cash_flow': "Cash Flow $", 'noi': "NOI $", 'cap_rate': "Cap Rate %",
+                       'cash_on_cash': "Cash On Cash %"}
+
+# Columns shown for screener results, with their headers
+SCREENER_COLUMNS = {'zpid': "ZPID", 'address': "Address", 'zipcode': "Zipcode", 'region': "Region",
+                    'homeType': "Home Type", 'bedrooms': "Bedrooms", 'price': "Price", 'restimate': "Rental Value",
+                    'cash_flow': "Cash Flow $", 'cap_rate': "Cap Rate %", 'cash_on_cash': "Cash On Cash %",
+                    'two_p_rule': "2% Rule %"}
+
+# Map view choices and size
+MAP_MODES = ("Selected Property", "All Listings (Clustered)", "All Listings (Heatmap)")
+MAP_WIDTH, MAP_HEIGHT = 930, 500
+
+# Builds each clustered marker in the browser from a [latitude, longitude, price, zpid] row, so thousands
+# of listings are sent as one array instead of one Python-rendered marker each
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindTooltip('$' + row[2].toLocaleString() + '<br>ZPID ' + row[3]);
+    return marker;
+};
+"""
+
+# Choices for the grid's rows per page
+PAGE_SIZES = (50, 100, 250, 500)
+
+
+# Distinct values of a column for a filter widget, cached per build
+def filter_choices(connection, column, caches, fingerprint):
+    return caches['listings'].get_or_compute((fingerprint, 'distinct', column),
+                                             lambda: distinct_values(connection, column))
+
+
+# Number of listings matching a filter, cached per build
+def listing_count(connection, listing_filter, caches, fingerprint):
+    return caches['listings'].get_or_compute((fingerprint, 'count', listing_filter),
+                                             lambda: count_listings(connection, listing_filter))
+
+
+# Filter widgets above the grid, return the ListingFilter they describe (applied in SQL)
+def create_filters(connection, caches, fingerprint):
+    with st.expander("Filters", expanded=False):
+        col1, col2, col3 = st.columns((1, 1, 1))
+        min_price, max_price = col1.slider("Price", min_value=0, max_value=3000000, value=(0, 3000000),
+                                           step=10000, format="$%d")
+        min_bedrooms = col1.number_input("Minimum Bedrooms", min_value=0, max_value=20, value=0)
+        zipcodes = col2.multiselect("Zipcodes", filter_choices(connection, 'zipcode', caches, fingerprint))
+        home_types = col2.multiselect("Home Types", filter_choices(connection, 'homeType', caches, fingerprint))
+        home_statuses = col2.multiselect("Status", filter_choices(connection, 'homeStatus', caches, fingerprint))
+        regions = col3.multiselect("Regions", filter_choices(connection, 'region', caches, fingerprint))
+        cities = col3.multiselect("Cities", filter_choices(connection, 'city', caches, fingerprint))
+        flags = col3.multiselect("Listing Types", FLAGS)
+
+    return ListingFilter(min_price=min_price if min_price > 0 else None,
+                         max_price=max_price if max_price < 3000000 else None,
+                         min_bedrooms=min_bedrooms if min_bedrooms > 0 else None,
+                         zipcodes=tuple(zipcodes), home_types=tuple(home_types),
+                         home_statuses=tuple(home_statuses), regions=tuple(regions), cities=tuple(cities),
+                         flags=tuple(flags))
+
+
+# Sort and paging widgets of the property browser, return (order_by, descending, page, page_size)
+def create_page_controls(connection, listing_filter, caches, fingerprint):
+    total = listing_count(connection, listing_filter, caches, fingerprint)
+    col1, col2, col3, col4 = st.columns((2, 1, 1, 1))
+    order_by = col1.selectbox("Sort By", SORT_COLUMNS, index=SORT_COLUMNS.index('price'))
+    descending = col2.checkbox("Descending", value=False)
+    page_size = col3.selectbox("Rows Per Page", PAGE_SIZES, index=1)
+    pages = max(1, -(-total // page_size))
+    # Keyed on the filter and page size so the page resets to 1 when either changes
+    page = col4.number_input("Page", min_value=1, max_value=pages, value=1, step=1,
+                             key="page_{}".format(hash((listing_filter, page_size))))
+    first = (page - 1) * page_size
+    st.caption("Showing {:,}-{:,} of {:,} properties".format(min(first + 1, total), min(first + page_size, total),
+                                                             total))
+    return order_by, descending, page, page_size
+
+
+def create_grid(dfs, connection, browser, caches, fingerprint):
 
     gb = GridOptionsBuilder.from_dataframe(dfs)
 
     # Table configurations (sending to gridOptions dictionary)
 
-    # Hiding columns
-    hidden_columns = [ "isNonOwnerOccupied", "latitude", "longitude", "is_fsba", "is_fsbo", "is_bankOwned",
-                      "is_comingSoon", "is_forAuction", "is_foreclosure", "is_newHome", "is_openHouse",
-                      "is_pending", "monthlyHoaFee", "arm5_rate", "15fixed_rate", "30fixed_rate", "propertyTaxRate",
-                      "restimateHighPercent", "restimateLowPercent", "taxAssessedValue", "taxAssessedYear",
-                      "zestimateHighPercent", "zestimateLowPercent", "url", "zipcode", "address"]
     # Column Configurations, Naming Headers
-    gb.configure_columns(hidden_columns, editable=False, hide=True)
     gb.configure_columns("zpid",pinned = "left", headerName = "ZPID")
     gb.configure_columns("price", headerName="Price")
     gb.configure_columns("bathrooms", headerName="Bathrooms")
@@ -292,29 +166,98 @@ def create_grid(dfs):
     gb.configure_columns("daysOnZillow", headerName="Days On Zillow")
     gb.configure_columns("favoriteCount", headerName="Favorite Count")
     gb.configure_columns("yearBuilt", headerName="Year Built")
+    gb.configure_columns("cash_flow", headerName="Cash Flow (default terms)")
+    gb.configure_columns("noi", headerName="NOI")
+    gb.configure_columns("cap_rate", headerName="Cap Rate %")
+    gb.configure_columns("cash_on_cash", headerName="Cash On Cash %")
+    gb.configure_columns("fifty_p_rule", headerName="50% Rule $")
+    gb.configure_columns("two_p_rule", headerName="2% Rule %")
+
+    # Rows are sorted in the database (Sort By above); sorting in the grid would only reorder the current page
+    gb.configure_columns(list(dfs.columns), sortable=False)
 
     #Grid Configurations
     gb.configure_selection('single', use_checkbox=False)
     gb.configure_grid_options(copyHeadersToClipboard=True, enableCellTextSelection=True, ensureDomOrder=True,
-                              suppressCopyRowsToClipboard=True, rowHeight=38, headerHeight = 50, floatingFilter = True)
+                              suppressCopyRowsToClipboard=True, rowHeight=38, headerHeight = 50)
     gb.configure_side_bar(True,False)
     go = gb.build()
 
     # Uses the gridOptions dictionary to generate table
-    with st.expander("Property Browser", expanded=True):
-        AgGrid(dfs, gridOptions=go, updatallow_unsafe_jscode=True, data_return_mode='AS_INPUT',
-               update_mode=GridUpdateMode.NO_UPDATE, enable_enterprise_modules=True, allow_unsafe_jscode=True)
+    with browser:
+        with span('aggrid', rows=len(dfs)):
+            AgGrid(dfs, gridOptions=go, updatallow_unsafe_jscode=True, data_return_mode='AS_INPUT',
+                   update_mode=GridUpdateMode.NO_UPDATE, enable_enterprise_modules=True, allow_unsafe_jscode=True)
 
         # Get input from user
         zpid_input = st.number_input('Paste the property zpid# here!', None, None, 10429543,
                                      help="Right-click to copy/paste a zpid from the grid above")
-        df_input = dfs.loc[dfs['zpid'] == zpid_input]
-        df_input.reset_index(drop=True, inplace=True)
+        df_input = caches['listings'].get_or_compute(
+            (fingerprint, int(zpid_input)), lambda: get_listing(connection, zpid_input, DETAIL_COLUMNS))
         #st.write(df_input.head())
         return df_input
 
 
-def create_st_interface(df_input):
+# One page of the property browser, read by keyset: from the key of the last row of the nearest page before
+# it already seen in this session (for the same data, filter, sort and page size), skipping only the pages
+# in between, so paging forward never re-reads the rows before the page
+def read_page(connection, columns, listing_filter, order_by, descending, page, page_size, fingerprint):
+    query = (fingerprint, listing_filter, order_by, descending, page_size)
+    if st.session_state.get('page_keys_query') != query:
+        st.session_state['page_keys_query'] = query
+        st.session_state['page_keys'] = {1: None}
+    keys = st.session_state['page_keys']
+    known = max(number for number in keys if number <= page)
+    df, last = query_page(connection, columns, listing_filter, order_by, descending, limit=page_size,
+                          after=keys[known], skip=(page - known) * page_size, compact=False)
+    if last is not None:
+        keys[page + 1] = last
+    return df
+
+
+# Top-K screener over every listing matching the filters above, ranked by the chosen metric
+# (results cached by data, filters and terms, in the compact schema); return the results, None if not run
+def create_screener(connection, listing_filter, caches, fingerprint, stats):
+    with st.expander("Screener", expanded=False):
+        col1, col2, col3, col4 = st.columns((1, 1, 1, 1))
+        objective = col1.selectbox("Rank By", list(OBJECTIVES), format_func=OBJECTIVES.get)
+        k = col1.slider("Top", min_value=10, max_value=500, value=50, step=10)
+        interest_rate = col2.number_input("Interest Rate %", value=2.0, step=.1, key='screen_rate') * .01
+        down_payment = col2.number_input("Down Payment %", value=20.0, step=1.0, key='screen_down') * .01
+        for_sale = col3.checkbox("For Sale Only", value=True)
+        positive = col3.checkbox("Positive Cash Flow Only", value=False)
+        min_price = col4.number_input("Minimum Price", min_value=0, value=10000, step=5000)
+        if not col4.checkbox("Run Screener"):
+            return None
+
+        statuses = ('FOR_SALE',) if for_sale else listing_filter.home_statuses
+        screen_filter = replace(listing_filter, home_statuses=statuses,
+                                min_price=max(listing_filter.min_price or 0, min_price) or None)
+        assumptions = Assumptions(interest_rate=interest_rate, down_payment=down_payment)
+        minimums = (('cash_flow', 0),) if positive else ()
+        results = caches['analyses'].get_or_compute(
+            ('screen', fingerprint, screen_filter, objective, k, assumptions, minimums),
+            lambda: screen(connection, objective, k, screen_filter, assumptions, stats, dict(minimums)))
+        st.caption("Top {} of {:,} matching listings by {} (default expenses; copy a ZPID into the calculator)"
+                   .format(len(results), listing_count(connection, screen_filter, caches, fingerprint),
+                           OBJECTIVES[objective]))
+        st.dataframe(results[list(SCREENER_COLUMNS)].round(2).rename(columns=SCREENER_COLUMNS))
+        return results
+
+
+# Run the calculator for one property: metrics as plain floats/bools (the charts are built in charts.py)
+@traced('calculator')
+def analyze(price, zestimate, restimate, tax_assessed_value, hoa, apg, assumptions):
+    results = compute_metrics(price, zestimate, restimate, tax_assessed_value, hoa, assumptions)
+    return {name: value.item() for name, value in results.items()}
+
+
+# Whether a value of the selected property was estimated from the listing aggregates
+def imputed(df_input, column):
+    return column + '_imputed' in df_input and bool(df_input[column + '_imputed'][0])
+
+
+def create_st_interface(df_input, caches):
     try:
         with st.sidebar:
             st.title("Investment Calculator")
@@ -350,6 +293,8 @@ def create_st_interface(df_input):
             elif zestimate_input != 0:
                 zestimate_slider = st.slider("Market Value / ARV (Zestimate)", min_value=int(zestimate_input * .5),
                                              max_value=int(zestimate_input * 1.5), value=int(zestimate_input), format="$%d", step=100)
+            if imputed(df_input, 'zestimate'):
+                st.caption("No Zestimate, estimated from similar listings nearby")
 
             # Input directly from user
 
@@ -370,12 +315,18 @@ def create_st_interface(df_input):
             interest_rate_input = st.number_input("Interest Rate %", min_value=None, max_value=None, value=2.00,
                                                   step=.1) * .01
             loan_term_input = st.radio("Loan Term", ("15 Year", "30 Year", "Arm5"), index=1)
+            arm_fixed_years = None
+            arm_reset_rate = None
             if loan_term_input == "15 Year":
                 loan_term = 15
             elif loan_term_input == "30 Year":
                 loan_term = 30
             elif loan_term_input == "Arm5":
-                loan_term = 5
+                # 5/1 ARM: 30 year loan, fixed for 5 years, then resets yearly (2/2/5 caps)
+                loan_term = 30
+                arm_fixed_years = 5
+                arm_reset_rate = st.number_input("Rate After Reset %", min_value=None, max_value=None,
+                                                 value=interest_rate_input * 100 + 2, step=.1) * .01
 
             # Expenses/Income Input
             st.header('Monthly Expenses/Income')
@@ -388,6 +339,8 @@ def create_st_interface(df_input):
             elif restimate_input != 0:
                 restimate_slider = st.slider("Rental Income (Monthly)", min_value=0,
                                              max_value=int(restimate_input * 2), value=int(restimate_input), format="$%d", step=20)
+            if imputed(df_input, 'restimate'):
+                st.caption("No Rent Zestimate, estimated from similar listings nearby")
 
             taxAssessedValue_input = df_input['taxAssessedValue'][0]
             if taxAssessedValue_input == 0:
@@ -399,6 +352,8 @@ def create_st_interface(df_input):
                                                           min_value=int(taxAssessedValue_input * .5),
                                                           max_value=int(taxAssessedValue_input * 1.5),
                                                           value=int(taxAssessedValue_input), format="$%d", step=100)
+            if imputed(df_input, 'taxAssessedValue'):
+                st.caption("No tax assessment, estimated from similar listings nearby")
 
             property_tax_input = (taxAssessedValue_input_slider * .0098) / 12
             st.caption("$" + str("{:.0f}".format(property_tax_input)) + " in tax payments per month")
@@ -426,42 +381,22 @@ def create_st_interface(df_input):
                                         value=int("{:.0f}".format(df_input['monthlyHoaFee'][0])), step = 5)
 
             # ALL CALCULATIONS
-            cash_invested = (price_slider * closing_cost_input) + down_payment_input + rehab_input
-
-            loan_principle = price_slider - down_payment_input
-
-            monthly_mortgage_payment = npf.pmt(interest_rate_input / 12, loan_term * 12, loan_principle, 0)
-
-            gross_operating_expenses = (property_tax_input + insurance_input + gas_electric_input +
-                                        water_sewer_garbage_input + hoa_input) + (vacancy_input * restimate_slider) + \
-                                       (maintenance_input * restimate_slider) + (management_input * restimate_slider) + \
-                                       (capex_input * restimate_slider)
-
-            noi_operating_expenses = (property_tax_input + insurance_input + gas_electric_input +
-                                      water_sewer_garbage_input + hoa_input) + (vacancy_input * restimate_slider) + \
-                                     (maintenance_input * restimate_slider) + (management_input * restimate_slider)
-
-            total_monthly_payment = (monthly_mortgage_payment * -1) + gross_operating_expenses
-
-            cash_flow = restimate_slider - total_monthly_payment
-
-            noi = restimate_slider - noi_operating_expenses
-
-            c_on_c_return = (cash_flow * 12) / cash_invested * 100
-
-            cap_rate = (noi * 12 / zestimate_slider) * 100
-
-            fifty_p_rule = (restimate_slider * .5) - monthly_mortgage_payment
-
-            fifty_p_rule_bool = False
-            if fifty_p_rule > 0:
-                fifty_p_rule_bool = True
-
-            two_p_rule = restimate_slider / price_slider * 100
-
-            two_p_rule_bool = False
-            if two_p_rule > 2:
-                two_p_rule_bool = True
+            assumptions = Assumptions(closing_cost=closing_cost_input,
+                                      down_payment=down_payment_input / price_slider if price_slider else 0,
+                                      rehab=rehab_input, interest_rate=interest_rate_input, loan_term=loan_term,
+                                      arm_fixed_years=arm_fixed_years, arm_reset_rate=arm_reset_rate,
+                                      insurance=insurance_input, maintenance=maintenance_input, capex=capex_input,
+                                      vacancy=vacancy_input, management=management_input,
+                                      gas_electric=gas_electric_input,
+                                      water_sewer_garbage=water_sewer_garbage_input)
+
+            # Metrics are cached by zpid and every calculator input, so switching back
+            # to a property (or a rerun that changed nothing) skips the math
+            key = (int(df_input['zpid'][0]), price_slider, zestimate_slider, restimate_slider,
+                   taxAssessedValue_input_slider, hoa_input, apg_input, assumptions)
+            analysis = caches['analyses'].get_or_compute(key, lambda: analyze(
+                price_slider, zestimate_slider, restimate_slider, taxAssessedValue_input_slider, hoa_input,
+                apg_input, assumptions))
     except KeyError:
         st.caption("This zpid number is invalid")
 
@@ -469,117 +404,335 @@ def create_st_interface(df_input):
     try:
         # Display various metrics
         col1, col2, col3, = st.columns((1.5,1.5,1.5))
-        col1.metric(label="Cash Flow", value="${:,.0f}".format(cash_flow))
+        col1.metric(label="Cash Flow", value="${:,.0f}".format(analysis['cash_flow']))
         col2.metric(label="Total Rental Income", value="${:,.0f}".format(restimate_slider))
-        col3.metric(label="Total Monthly Payment", value="${:,.0f}".format(total_monthly_payment * -1))
-        col3.metric(label="Monthly Mortgage Payment", value="${:,.0f}".format(monthly_mortgage_payment))
-        col2.metric(label="NOI", value="${:,.0f}".format(noi))
-        col1.metric(label="Total Cash Invested", value="${:,.0f}".format(cash_invested))
+        col3.metric(label="Total Monthly Payment", value="${:,.0f}".format(analysis['total_monthly_payment'] * -1))
+        col3.metric(label="Monthly Mortgage Payment", value="${:,.0f}".format(analysis['mortgage_payment']))
+        col2.metric(label="NOI", value="${:,.0f}".format(analysis['noi']))
+        col1.metric(label="Total Cash Invested", value="${:,.0f}".format(analysis['cash_invested']))
         st.write("")
         st.write("")
         colA, colB, colC, colD = st.columns((1,1,1,1))
-        colA.metric(label="Capitalization Rate", value="%{:,.2f}".format(cap_rate))
-        colB.metric(label="Cash On Cash Return ", value="%{:,.2f}".format(c_on_c_return))
-        colC.metric(label="50% Rule ", value=fifty_p_rule_bool, delta="${:,.0f}".format(fifty_p_rule))
-        colD.metric(label="2% Rule ", value=two_p_rule_bool, delta="%{:,.1f}".format(two_p_rule))
+        colA.metric(label="Capitalization Rate", value="%{:,.2f}".format(analysis['cap_rate']))
+        colB.metric(label="Cash On Cash Return ", value="%{:,.2f}".format(analysis['cash_on_cash']))
+        colC.metric(label="50% Rule ", value=analysis['fifty_p_rule_pass'],
+                    delta="${:,.0f}".format(analysis['fifty_p_rule']))
+        colD.metric(label="2% Rule ", value=analysis['two_p_rule_pass'], delta="%{:,.1f}".format(analysis['two_p_rule']))
         st.write("")
         st.write("")
 
-        with st.expander("Visualizations", expanded = True):
-            # Plot Expense Chart
-            ge_labels = ["Property Tax", "Insurance", "Gas/Electric", "Water/Sewer/Garbage", "HOA Fees", "Vacancy",
-                         "Maintenance/Repairs", "Management", "Cap-Ex"]
-            ge_values = [property_tax_input, insurance_input, gas_electric_input, water_sewer_garbage_input, hoa_input,
-                         (vacancy_input * restimate_slider), (maintenance_input * restimate_slider),
-                         (management_input * restimate_slider), (capex_input * restimate_slider)]
-            expense_chart = px.pie(names=ge_labels, values=ge_values, hole=.6, color=ge_labels,
-                                   color_discrete_sequence=px.colors.sequential.RdBu)
-            expense_chart.update_layout(title={
-                'text': "Monthly Expense Breakdown", 'y': .985, 'x': .46, 'xanchor': 'center', 'yanchor': 'top'}, width = 800)
-            st.plotly_chart(expense_chart)
-
-            # Create appreciation graph for
-            year_series = []
-            for i in range(1, loan_term + 1):
-                year_series.append(i)
-
-            property_appreciation_series = []
-            for i in range(1, loan_term + 1):
-                i = "${:,.0f}".format(((apg_input + 1) ** i) * zestimate_slider, 0)
-                property_appreciation_series.append(i)
-
-            cash_flow_series = []
-            for i in range(1, loan_term + 1):
-                i = "${:,.0f}".format((((apg_input + 1) ** i) * restimate_slider) - (
-                        (((apg_input + 1) ** i) * gross_operating_expenses) + (monthly_mortgage_payment * -1)), 0)
-                cash_flow_series.append(i)
-
-            df_appreciate = pd.DataFrame(list(zip(year_series, property_appreciation_series, cash_flow_series)),
-                                         columns=['Year', 'Property Value', 'Cash Flow'])
-
-            appreciation_graph = px.line(df_appreciate, x="Year", y="Property Value", hover_data=["Cash Flow"])
-            appreciation_graph.update_layout(hovermode='x', title={
-                'text': "Property Appreciation Over Loan", 'y': .9, 'x': 0.405, 'xanchor': 'center', 'yanchor': 'top'},
-                                             width=930, plot_bgcolor="#ffffff")
-            appreciation_graph.update_traces(line_color='#2eb82e', line_width=2)
-            appreciation_graph.update_yaxes(nticks=10, linecolor="#d9d9d9")
-            appreciation_graph.update_xaxes(linecolor="#d9d9d9", showticklabels=True)
-            st.plotly_chart(appreciation_graph)
+        # Each chart is memoized by the numbers it is drawn from, not by every calculator input: changing
+        # the closing cost redraws neither, changing the rent only redraws what depends on it
+        expenses = expense_breakdown(analysis['property_tax'], hoa_input, restimate_slider, assumptions)
+        expense_figure = caches['charts'].get_or_compute(('expenses', expenses), lambda: expense_chart(expenses))
+        projection = (round(analysis['loan_principal'], 2), assumptions.interest_rate, assumptions.loan_term,
+                      assumptions.arm_fixed_years, assumptions.arm_reset_rate, zestimate_slider, restimate_slider,
+                      round(analysis['gross_operating_expenses'], 2), apg_input)
+        appreciation_figure = caches['charts'].get_or_compute(('appreciation', projection),
+                                                              lambda: appreciation_chart(*projection))
+        with st.expander("Visualizations", expanded = True), span('plotly_chart'):
+            st.plotly_chart(expense_figure)
+            st.plotly_chart(appreciation_figure)
 
     except NameError:
         print(None)
 
-    # Map Selected Property
+    # Sensitivity tables: one broadcast over a 2-D grid of inputs around the current values
     try:
-        with st.expander("Map",True):
-            latitude = df_input['latitude'][0]
-            longitude = df_input['longitude'][0]
-            url = df_input['url'][0]
-
-            # center map
-            m = folium.Map(location=[latitude, longitude], zoom_start=16)
-
-            # add marker for Liberty Bell
-            tooltip = "{address}<br>" "Price: ${price}<br>" "Bedrooms: {bedrooms}<br>" "Bathrooms: {bathrooms}<br>".format\
-                (address = str(df_input['address'][0] + " " + df_input['city'][0] + ", " + df_input['state'][0]),
-                 price=int(df_input['price'][0]), bedrooms = df_input['bedrooms'][0], bathrooms = df_input['bathrooms'][0])
+        with st.expander("Sensitivity", expanded=False):
+            col1, col2, col3 = st.columns((1, 1, 1))
+            pair = col1.radio("Inputs", ("Price × Interest Rate", "Rent × Vacancy"))
+            metric = col2.selectbox("Metric", list(SENSITIVITY_METRICS), format_func=SENSITIVITY_METRICS.get)
+            size = col3.slider("Grid Size", min_value=5, max_value=100, value=25)
+            spread = col3.slider("Range (± %)", min_value=5, max_value=75, value=30) * .01
+
+            if pair == "Price × Interest Rate":
+                row_name, row_label, row_center = 'price', "Price", price_slider
+                col_name, col_label, col_center = 'interest_rate', "Interest Rate %", interest_rate_input
+            else:
+                row_name, row_label, row_center = 'restimate', "Rental Income", restimate_slider
+                col_name, col_label, col_center = 'vacancy', "Vacancy %", vacancy_input
+            row_values = np.linspace(row_center * (1 - spread), row_center * (1 + spread), size)
+            col_values = np.linspace(col_center * (1 - spread), col_center * (1 + spread), size)
+            if col_center == 0:
+                col_values = np.linspace(0, spread, size)
+
+            listing = dict(price=price_slider, zestimate=zestimate_slider, restimate=restimate_slider,
+                           tax_assessed_value=taxAssessedValue_input_slider, monthly_hoa_fee=hoa_input)
+            with span('sensitivity', size=size):
+                grid = sensitivity(listing, assumptions, row_name, row_values, col_name, col_values)[metric]
+            # Collapsed expanders still run, so the heatmap (and plotly with it) waits until asked for
+            if st.checkbox("Show Heatmap"):
+                import plotly.express as px
+                heatmap = px.imshow(grid, x=col_values * 100, y=row_values, origin='lower', aspect='auto',
+                                    color_continuous_scale=px.colors.diverging.RdYlGn, color_continuous_midpoint=0,
+                                    labels={'x': col_label, 'y': row_label, 'color': SENSITIVITY_METRICS[metric]})
+                heatmap.update_layout(width=930, height=600)
+                st.plotly_chart(heatmap)
+            if st.checkbox("Show Table"):
+                st.dataframe(pd.DataFrame(grid, index=np.round(row_values, 0), columns=np.round(col_values * 100, 2)))
+    except NameError:
+        print(None)
 
-            folium.Marker(
-                [latitude, longitude], popup=url, tooltip=tooltip
-            ).add_to(m)
+    # Monte Carlo risk simulation (only run when asked for; results cached with the analysis inputs)
+    try:
+        with st.expander("Risk Simulation", expanded=False):
+            col1, col2, col3 = st.columns((1, 1, 1))
+            paths = col1.select_slider("Paths", options=[500, 1000, 2000, 5000, 10000], value=2000)
+            hold_years = col1.slider("Hold Period (Years)", min_value=1, max_value=30, value=10)
+            appreciation_sd = col2.number_input("Appreciation Volatility %", value=4.0, step=.5) * .01
+            rent_growth_sd = col2.number_input("Rent Growth Volatility %", value=2.0, step=.5) * .01
+            vacancy_sd = col3.number_input("Vacancy Volatility %", value=3.0, step=.5) * .01
+            rate_sd = col3.number_input("ARM Reset Rate Volatility %", value=1.0, step=.25) * .01
+            if st.checkbox("Run Simulation"):
+                settings = SimulationSettings(paths=paths, hold_years=hold_years, appreciation_sd=appreciation_sd,
+                                              rent_growth_sd=rent_growth_sd, vacancy_sd=vacancy_sd,
+                                              rate_sd=rate_sd, seed=0)
+                simulation = caches['analyses'].get_or_compute(('simulation', key, settings), lambda: simulate(
+                    price_slider, zestimate_slider, restimate_slider, taxAssessedValue_input_slider, hoa_input,
+                    apg_input, assumptions, settings))
+                summary = summarize(simulation)
+                st.dataframe(pd.DataFrame({name: summary[name] for name in
+                                           ['cash_flow', 'cap_rate', 'cash_on_cash', 'irr']})
+                             .rename(index=lambda p: "P{}".format(p))
+                             .rename(columns={'cash_flow': "Cash Flow $", 'cap_rate': "Cap Rate %",
+                                              'cash_on_cash': "Cash On Cash %", 'irr': "IRR %"}))
+                st.caption("{:.1%} of paths have negative cash flow in year 1".format(
+                    summary['negative_cash_flow_share']))
+                import plotly.express as px
+                st.plotly_chart(px.histogram(x=simulation['irr'], nbins=60, labels={'x': "IRR %"},
+                                             title="IRR Over {} Years".format(hold_years)))
+    except NameError:
+        print(None)
 
-            # call to render Folium map in Streamlit
-            folium_static(m)
+# Selected property marker (address, price, beds/baths tooltip; zillow link popup)
+def selected_marker(df_input):
+    import folium
+    tooltip = "{address}<br>" "Price: ${price}<br>" "Bedrooms: {bedrooms}<br>" "Bathrooms: {bathrooms}<br>".format\
+        (address = str(df_input['address'][0] + " " + df_input['city'][0] + ", " + df_input['state'][0]),
+         price=int(df_input['price'][0]), bedrooms = df_input['bedrooms'][0], bathrooms = df_input['bathrooms'][0])
+    return folium.Marker([df_input['latitude'][0], df_input['longitude'][0]], popup=df_input['url'][0],
+                         tooltip=tooltip, icon=folium.Icon(color='red'))
+
+
+# Map of the selected property alone
+def property_map(df_input):
+    import folium
+    m = folium.Map(location=[df_input['latitude'][0], df_input['longitude'][0]], zoom_start=16)
+    selected_marker(df_input).add_to(m)
+    return m
+
+
+# Render a folium map to the HTML handed to the browser
+@traced('folium render')
+def render_map(m):
+    import folium
+    return folium.Figure().add_child(m).render()
+
+
+# Map of many listings, clustered or as a heatmap, with the selected property marked
+def listings_map(points, mode, df_input):
+    import folium
+    from folium.plugins import FastMarkerCluster, HeatMap
+    m = folium.Map(location=[df_input['latitude'][0], df_input['longitude'][0]], zoom_start=12)
+    latitude = points['latitude'].astype(float).round(5)
+    longitude = points['longitude'].astype(float).round(5)
+    if mode == MAP_MODES[1]:
+        data = np.column_stack((latitude, longitude, points['price'].round(), points['zpid']))
+        FastMarkerCluster(data.tolist(), callback=MARKER_CALLBACK).add_to(m)
+    else:
+        HeatMap(np.column_stack((latitude, longitude)).tolist(), radius=12, blur=15).add_to(m)
+    selected_marker(df_input).add_to(m)
+    if len(latitude):
+        m.fit_bounds([[latitude.min(), longitude.min()], [latitude.max(), longitude.max()]])
+    return m
+
+
+# Map expander: the selected property alone, or every listing matching the filters. Rendered HTML is cached
+# by zpid and filter state, so reruns that don't change either skip building the map entirely
+def create_map(df_input, connection, listing_filter, caches, fingerprint):
+    try:
+        with st.expander("Map", True):
+            mode = st.radio("Show", MAP_MODES)
+            zpid = int(df_input['zpid'][0])
+            if mode == MAP_MODES[0]:
+                html = caches['maps'].get_or_compute((fingerprint, mode, zpid),
+                                                     lambda: render_map(property_map(df_input)))
+            else:
+                points = caches['maps'].get_or_compute((fingerprint, 'points', listing_filter),
+                                                       lambda: map_points(connection, listing_filter))
+                html = caches['maps'].get_or_compute((fingerprint, mode, zpid, listing_filter),
+                                                     lambda: render_map(listings_map(points, mode, df_input)))
+                st.caption("{:,} listings matching the filters".format(len(points['zpid'])))
+
+            with span('map html', bytes=len(html)):
+                components.html(html, width=MAP_WIDTH, height=MAP_HEIGHT + 10)
     except KeyError:
         print(None)
 
 
-# Create SQLITE CONNECTION, zillow.db
-# MAIN
-# Establish connection, cursor
-conn = sqlite3.connect('zillow.db')
-c = conn.cursor()
-
-# Clean data, get dfs back
-df = clean_data()
-init_db(df, conn, c)
-df_address, df_financial, df_page, df_physical, df_zp, dfs = get_dfs(conn)
-
-dfs = reorganize_columns(dfs)
-
-st.subheader("The Philadelphia Real Estate Assessor")
-st.caption("Welcome! Use the property browser to sort through investment properties.")
-st.caption("Copy/Paste an individual property's ZPID in the field below to run financial analysis via the Investment Calculator.")
+# Comparable listings to the selected property (same home type, similar bedrooms): the k nearest, or every one
+# within a radius, found through the R-tree and cached with the listing rows
+def create_comps(df_input, connection, caches, fingerprint):
+    try:
+        with st.expander("Comparable Properties", expanded=False):
+            col1, col2, col3, col4 = st.columns((1, 1, 1, 1))
+            k = col1.slider("Comparables", min_value=3, max_value=50, value=10)
+            radius = col2.number_input("Within Meters (0: nearest)", min_value=0, max_value=50000, value=0, step=100)
+            bedroom_range = col3.number_input("Bedrooms ±", min_value=0, max_value=5, value=0)
+            same_type = col4.checkbox("Same Home Type", value=True)
+
+            bedrooms = df_input['bedrooms'][0]
+            comp_filter = ListingFilter(
+                home_types=(df_input['homeType'][0],) if same_type and df_input['homeType'][0] else (),
+                min_bedrooms=bedrooms - bedroom_range if bedrooms is not None else None,
+                max_bedrooms=bedrooms + bedroom_range if bedrooms is not None else None)
+            zpid = int(df_input['zpid'][0])
+            latitude, longitude = df_input['latitude'][0], df_input['longitude'][0]
+            columns = [col for col in COMP_COLUMNS if col != 'distance']
+            if radius:
+                comps = caches['listings'].get_or_compute(
+                    (fingerprint, 'comps within', zpid, radius, comp_filter),
+                    lambda: within_radius(connection, latitude, longitude, radius, columns, comp_filter))
+                comps = comps[comps['zpid'] != zpid]
+            else:
+                comps = caches['listings'].get_or_compute(
+                    (fingerprint, 'comps', zpid, k, comp_filter),
+                    lambda: nearest(connection, latitude, longitude, k, columns, comp_filter, exclude=zpid))
+            if comps.empty:
+                st.caption("No comparable properties found within {:,.0f} m".format(radius or 50000))
+                return
+
+            comps = comps[list(COMP_COLUMNS)]
+            prices = comps['price'].where(comps['price'] > 0)
+            rents = comps['restimate'].where(comps['restimate'] > 0)
+            st.caption("Median price ${:,.0f}, median rent ${:,.0f}/month, within {:,.0f} m".format(
+                prices.median(), rents.median(), comps['distance'].max()))
+            st.dataframe(comps.round({'distance': 0}).rename(columns=COMP_COLUMNS))
+    except (KeyError, TypeError):
+        print(None)
 
-# Create Grid, Get zpid # input and return single row dataframe
 
-df_input = create_grid(dfs)
+# Market trends across the export snapshots: days on market and price drops per snapshot date for the
+# filtered listings, and the largest cuts. Only queried when asked for, then cached by data version and filters
+def create_trends(connection, listing_filter, caches, fingerprint):
+    with st.expander("Market Trends", expanded=False):
+        dates = snapshot_dates(connection)
+        if len(dates) < 2:
+            st.caption("Trends need at least two export snapshots ({} loaded); point PHILLY_EXPORTS at a directory "
+                       "or glob of exports".format(len(dates)))
+            return
+        st.caption("{} snapshots from {} to {}".format(len(dates), dates[0], dates[-1]))
+        if not st.checkbox("Show Trends"):
+            return
+
+        days = caches['analyses'].get_or_compute((fingerprint, 'days on market', listing_filter),
+                                                 lambda: days_on_market_trend(connection, listing_filter))
+        drops = caches['analyses'].get_or_compute((fingerprint, 'price drops', listing_filter),
+                                                  lambda: price_drop_trend(connection, listing_filter))
+        col1, col2 = st.columns((1, 1))
+        col1.caption("Median days on market (for sale)")
+        col1.line_chart(days.set_index('snapshot_date')[['median_days']])
+        col2.caption("Share of repeat listings with a price drop")
+        col2.line_chart(drops.set_index('snapshot_date')[['drop_share']])
+
+        largest = caches['analyses'].get_or_compute((fingerprint, 'largest drops', listing_filter),
+                                                    lambda: largest_price_drops(connection, listing_filter, limit=50))
+        st.caption("Largest price cuts since first seen")
+        st.dataframe(largest.round(2))
 
 
-# Calculator Sidebar, Create Variables
-create_st_interface(df_input)
+# MAIN
+# Draw from the existing zillow.db straight away; the check against the CSV (and any rebuild) runs once the
+# page is out. Only a missing or outdated database is built before anything is shown
+ingest_stats = last_build(EXPORTS, DB_PATH)
+if ingest_stats is None:
+    with st.spinner("Building the listing database..."):
+        ingest_stats = ensure_db(EXPORTS, DB_PATH, incremental=True)
+
+# Every query of this run goes through one read-only connection lent by the shared pool (db.py); it goes
+# back before the freshness check below, which may swap in a rebuilt database
+with get_database(DB_PATH).reader() as conn:
+    st.subheader("The Philadelphia Real Estate Assessor")
+    st.caption("Welcome! Use the property browser to sort through investment properties.")
+    st.caption("Copy/Paste an individual property's ZPID in the field below to run financial analysis via the Investment Calculator.")
+
+    # Filtering, sorting and paging happen in the database; only the current page is read and sent to the grid
+    caches = get_caches()
+    listing_filter = create_filters(conn, caches, ingest_stats['fingerprint'])
+    browser = st.expander("Property Browser", expanded=True)
+    with browser:
+        order_by, descending, page, page_size = create_page_controls(conn, listing_filter, caches,
+                                                                     ingest_stats['fingerprint'])
+    # Investment metrics under the calculator's default assumptions, with missing zestimates/rents/assessments
+    # imputed from the precomputed aggregates (the grid shows the raw values), are materialized at ingest
+    # (estimates.build_metrics), so they are read, and sorted by, like any other column
+    df = read_page(conn, GRID_COLUMNS + GRID_METRICS, listing_filter, order_by, descending, page, page_size,
+                   ingest_stats['fingerprint'])
+    dfs = compact_frame(df)
+    memory = memory_report(df, dfs)
+    stats = caches['listings'].get_or_compute((ingest_stats['fingerprint'], 'stats'), lambda: load_stats(conn))
+
+    screened = create_screener(conn, listing_filter, caches, ingest_stats['fingerprint'], stats)
+
+    # Create Grid, Get zpid # input and return single row dataframe
+
+    df_input = impute(create_grid(dfs, conn, browser, caches, ingest_stats['fingerprint']), stats)
+    first_render_seconds = time.perf_counter() - RUN_STARTED
+
+
+    # Calculator Sidebar, Create Variables
+    create_st_interface(df_input, caches)
+    create_map(df_input, conn, listing_filter, caches, ingest_stats['fingerprint'])
+    create_comps(df_input, conn, caches, ingest_stats['fingerprint'])
+    create_trends(conn, listing_filter, caches, ingest_stats['fingerprint'])
 
 
 # Text at end
 st.caption("")
-st.caption("Data last updated from zillow on 4/03/2022")
\ No newline at end of file
+st.caption("Data last updated from zillow on 4/03/2022")
+st.caption("Data cache {} from {} ({:.3f}s)".format("hit" if ingest_stats['cache_hit'] else "miss",
+                                                 ingest_stats['source'], ingest_stats['seconds']))
+st.caption("Analysis cache: {hits} hits / {misses} misses ({size}/{maxsize} entries)".format(
+    **caches['analyses'].stats()))
+st.caption("Chart cache: {hits} hits / {misses} misses ({size}/{maxsize} entries)".format(
+    **caches['charts'].stats()))
+with st.expander("Data Memory", expanded=False):
+    st.caption("Grid page: {:,.1f} MB ({:,.1f} MB before compaction)".format(
+        memory['bytes_after']['TOTAL'] / 2 ** 20, memory['bytes_before']['TOTAL'] / 2 ** 20))
+    st.dataframe(memory)
+    if screened is not None:
+        st.caption("Screener results: {:,.1f} MB ({:,} rows)".format(
+            screened.memory_usage(index=False, deep=True).sum() / 2 ** 20, len(screened)))
+
+
+# Deferred freshness check: rerun against the new data if the CSV changed since the database was built.
+# While another session's check or build is running this run keeps the published data and doesn't wait
+if ingest_stats['source'] == 'unchecked':
+    checked = ensure_db(EXPORTS, DB_PATH, incremental=True, wait=False)
+    if checked is not None and checked['fingerprint'] != ingest_stats['fingerprint']:
+        st.experimental_rerun()
+
+
+# Performance panel: switches for the next rerun's trace, and this rerun's timings with JSON/Chrome-trace export
+trace = stop_trace()
+with st.expander("Performance", expanded=False):
+    col1, col2 = st.columns((1, 1))
+    col1.checkbox("Record timings", key='trace_enabled')
+    col2.checkbox("Trace Python allocations (slow)", key='trace_memory')
+    st.caption("Imports {:,.0f} ms, property browser drawn {:,.0f} ms into this run".format(
+        IMPORT_SECONDS * 1000, first_render_seconds * 1000))
+    if trace is None:
+        st.caption("Switch on recording to time each stage of the next rerun")
+    else:
+        events = pd.DataFrame(trace.to_dict()['events'])
+        st.caption("{} spans recorded".format(len(events)))
+        st.dataframe(pd.DataFrame(trace.summary()).round(2))
+        if not events.empty:
+            events['name'] = ["  " * depth + name for depth, name in zip(events['depth'], events['name'])]
+            events['args'] = events['args'].astype(str)
+            st.dataframe(events.drop(columns=['depth', 'thread']).round(2))
+        col1, col2 = st.columns((1, 1))
+        col1.download_button("Download JSON", trace.to_json(), file_name="trace.json", mime="application/json")
+        col2.download_button("Download Chrome Trace", trace.to_chrome_trace(), file_name="trace.chrome.json",
+                             mime="application/json")
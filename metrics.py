@@ -0,0 +1,134 @@
+# Investment metrics engine: the calculator math from the sidebar, run on whole columns of listings at once
+from dataclasses import dataclass, fields, replace
+
+import numpy as np
+
+from tracing import traced
+
+
+# Calculator assumptions shared by every listing (defaults match the sidebar)
+# Percentages are fractions, dollar amounts are monthly unless noted; frozen so it can be a cache key
+@dataclass(frozen=True)
+class Assumptions:
+    closing_cost: float = .05
+    down_payment: float = .20
+    rehab: float = 0
+    interest_rate: float = .02
+    loan_term: int = 30
+    arm_fixed_years: int = None
+    arm_reset_rate: float = None
+    property_tax_rate: float = .0098
+    insurance: float = 110
+    maintenance: float = .11
+    capex: float = .10
+    vacancy: float = .05
+    management: float = 0
+    gas_electric: float = 0
+    water_sewer_garbage: float = 80
+
+
+# Monthly mortgage payment, same sign convention as numpy_financial.pmt (negative = paid out)
+def mortgage_payment(principal, annual_rate, years):
+    principal = np.asarray(principal, dtype=float)
+    rate = np.asarray(annual_rate, dtype=float) / 12
+    periods = np.asarray(years, dtype=float) * 12
+
+    growth = (1 + rate) ** periods
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = np.where(rate == 0, principal / periods, principal * rate * growth / (growth - 1))
+    return -payment
+
+
+# Apply the sidebar's defaults for missing values: no price -> zestimate (or $200k),
+# no zestimate -> price, no tax assessment -> zestimate
+def fill_missing(price, zestimate, tax_assessed_value):
+    price = np.asarray(price, dtype=float)
+    zestimate = np.asarray(zestimate, dtype=float)
+    tax_assessed_value = np.asarray(tax_assessed_value, dtype=float)
+
+    price = np.where(price != 0, price, np.where(zestimate != 0, zestimate, 200000.))
+    zestimate = np.where(zestimate != 0, zestimate, price)
+    tax_assessed_value = np.where(tax_assessed_value != 0, tax_assessed_value, zestimate)
+    return price, zestimate, tax_assessed_value
+
+
+# Compute every calculator metric for arrays of listings in one pass, return dict of arrays
+def compute_metrics(price, zestimate, restimate, tax_assessed_value, monthly_hoa_fee, assumptions=Assumptions()):
+    a = assumptions
+    price = np.asarray(price, dtype=float)
+    zestimate = np.asarray(zestimate, dtype=float)
+    restimate = np.asarray(restimate, dtype=float)
+    tax_assessed_value = np.asarray(tax_assessed_value, dtype=float)
+    monthly_hoa_fee = np.asarray(monthly_hoa_fee, dtype=float)
+
+    down_payment = price * a.down_payment
+    cash_invested = (price * a.closing_cost) + down_payment + a.rehab
+    loan_principal = price - down_payment
+    monthly_mortgage_payment = mortgage_payment(loan_principal, a.interest_rate, a.loan_term)
+
+    property_tax = (tax_assessed_value * a.property_tax_rate) / 12
+    fixed_expenses = property_tax + a.insurance + a.gas_electric + a.water_sewer_garbage + monthly_hoa_fee
+    noi_operating_expenses = fixed_expenses + (a.vacancy + a.maintenance + a.management) * restimate
+    gross_operating_expenses = noi_operating_expenses + a.capex * restimate
+
+    total_monthly_payment = (monthly_mortgage_payment * -1) + gross_operating_expenses
+    cash_flow = restimate - total_monthly_payment
+    noi = restimate - noi_operating_expenses
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c_on_c_return = (cash_flow * 12) / cash_invested * 100
+        cap_rate = (noi * 12 / zestimate) * 100
+        two_p_rule = restimate / price * 100
+    fifty_p_rule = (restimate * .5) - monthly_mortgage_payment
+
+    return {
+        'cash_invested': cash_invested,
+        'loan_principal': loan_principal,
+        'mortgage_payment': monthly_mortgage_payment,
+        'property_tax': property_tax,
+        'gross_operating_expenses': gross_operating_expenses,
+        'noi_operating_expenses': noi_operating_expenses,
+        'total_monthly_payment': total_monthly_payment,
+        'cash_flow': cash_flow,
+        'noi': noi,
+        'cash_on_cash': c_on_c_return,
+        'cap_rate': cap_rate,
+        'fifty_p_rule': fifty_p_rule,
+        'fifty_p_rule_pass': fifty_p_rule > 0,
+        'two_p_rule': two_p_rule,
+        'two_p_rule_pass': two_p_rule > 2,
+    }
+
+
+# Metric columns shown in the property browser
+GRID_METRICS = ['cash_flow', 'noi', 'cap_rate', 'cash_on_cash', 'fifty_p_rule', 'two_p_rule']
+
+
+# Score every listing of a frame with the default fallbacks, return frame of metric columns
+@traced()
+def score_listings(df, assumptions=Assumptions(), columns=GRID_METRICS):
+    price, zestimate, tax_assessed_value = fill_missing(df['price'].to_numpy(), df['zestimate'].to_numpy(),
+                                                        df['taxAssessedValue'].to_numpy())
+    results = compute_metrics(price, zestimate, df['restimate'].to_numpy(), tax_assessed_value,
+                              df['monthlyHoaFee'].to_numpy(), assumptions)
+    return df[[]].assign(**{name: np.round(results[name], 2) if results[name].dtype.kind == 'f' else results[name]
+                            for name in columns})
+
+
+# Evaluate the calculator over a 2-D grid of two inputs in one broadcast: rows vary `row_name`, columns vary
+# `col_name`. Either may be a listing input (price, zestimate, restimate, tax_assessed_value, monthly_hoa_fee)
+# or an Assumptions field (interest_rate, vacancy, ...). Return dict of (rows, cols) metric arrays
+def sensitivity(listing, assumptions, row_name, row_values, col_name, col_values):
+    overrides = {row_name: np.asarray(row_values, dtype=float)[:, None],
+                 col_name: np.asarray(col_values, dtype=float)[None, :]}
+    assumption_fields = {field.name for field in fields(Assumptions)}
+    unknown = set(overrides) - assumption_fields - set(listing)
+    if unknown:
+        raise ValueError("Unknown sensitivity input: {}".format(", ".join(sorted(unknown))))
+
+    listing = {name: overrides.get(name, value) for name, value in listing.items()}
+    assumptions = replace(assumptions, **{name: value for name, value in overrides.items()
+                                          if name in assumption_fields})
+    results = compute_metrics(assumptions=assumptions, **listing)
+    shape = (len(row_values), len(col_values))
+    return {name: np.broadcast_to(value, shape) for name, value in results.items()}
@@ -0,0 +1,93 @@
+# Projection engine: monthly amortization and multi-year value/rent/expense projections as NumPy arrays
+# Every input broadcasts, so one call can project many properties or scenarios (rows) at once
+import numpy as np
+
+
+# Monthly rate schedule, shape (rows, months). A fixed loan keeps `rate`; an ARM (arm_fixed_years set) keeps it
+# for the fixed period, then resets once a year toward `reset_rate`, limited by the first/periodic/lifetime caps
+def rate_schedule(rate, years, arm_fixed_years=None, reset_rate=None, first_cap=.02, periodic_cap=.02,
+                  lifetime_cap=.05):
+    rate = np.atleast_1d(np.asarray(rate, dtype=float))[:, None]
+    months = int(years * 12)
+    rates = np.repeat(rate, months, axis=1)
+    if arm_fixed_years is None or arm_fixed_years >= years:
+        return rates
+
+    target = np.atleast_1d(np.asarray(rate if reset_rate is None else reset_rate, dtype=float))[:, None]
+    target = np.clip(target, rate - lifetime_cap, rate + lifetime_cap)
+    resets = np.arange(int(arm_fixed_years * 12), months, 12)
+
+    # Largest total move allowed by each reset: first cap, then another periodic cap per year
+    allowed = first_cap + periodic_cap * np.arange(len(resets))
+    reset_rates = rate + np.clip(target - rate, -allowed, allowed)
+    for reset, reset_rate_k in zip(resets, reset_rates.T):
+        rates[:, reset:] = np.broadcast_to(reset_rate_k[:, None], rates[:, reset:].shape)
+    return rates
+
+
+# Amortize `principal` over a (rows, months) rate schedule. The payment is recomputed on the remaining
+# balance whenever a row's rate changes (as an ARM does at each reset); each stretch of constant rates is
+# solved in closed form, so the only Python loop is over rate changes, not months
+def amortize(principal, rates):
+    rates = np.atleast_2d(np.asarray(rates, dtype=float)) / 12
+    rows, months = rates.shape
+    balance = np.broadcast_to(np.atleast_1d(np.asarray(principal, dtype=float)), (rows,)).astype(float)
+
+    payment = np.empty((rows, months))
+    interest = np.empty((rows, months))
+    ending = np.empty((rows, months))
+
+    changes = np.flatnonzero(np.any(np.diff(rates, axis=1) != 0, axis=0)) + 1
+    bounds = np.concatenate(([0], changes, [months]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        r = rates[:, start][:, None]
+        remaining = months - start
+        k = np.arange(1, end - start + 1)[None, :]
+        b0 = balance[:, None]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth_n = (1 + r) ** remaining
+            pmt = np.where(r == 0, b0 / remaining, b0 * r * growth_n / (growth_n - 1))
+            growth = (1 + r) ** k
+            bal = np.where(r == 0, b0 - pmt * k, b0 * growth - pmt * (growth - 1) / r)
+
+        previous = np.concatenate((b0, bal[:, :-1]), axis=1)
+        payment[:, start:end] = pmt
+        interest[:, start:end] = previous * r
+        ending[:, start:end] = bal
+        balance = bal[:, -1]
+
+    ending = np.where(np.abs(ending) < 1e-6, 0., ending)
+    return {'payment': payment, 'interest': interest, 'principal': payment - interest, 'balance': ending}
+
+
+# Monthly projection of a financed property. value grows with `appreciation` (compounded monthly); rent and
+# operating expenses step up once a year by their growth rates (default: appreciation). All amounts monthly
+def project(principal, rates, value, rent, expenses, appreciation, rent_growth=None, expense_growth=None):
+    loan = amortize(principal, rates)
+    rows, months = loan['payment'].shape
+    month = np.arange(1, months + 1)
+    year = (month - 1) // 12 + 1
+
+    column = lambda x: np.atleast_1d(np.asarray(x, dtype=float))[:, None]
+    appreciation = column(appreciation)
+    rent_growth = appreciation if rent_growth is None else column(rent_growth)
+    expense_growth = appreciation if expense_growth is None else column(expense_growth)
+
+    value = column(value) * (1 + appreciation) ** (month / 12)
+    rent = column(rent) * (1 + rent_growth) ** (year - 1)
+    expenses = column(expenses) * (1 + expense_growth) ** (year - 1)
+    value, rent, expenses = (np.broadcast_to(x, (rows, months)) for x in (value, rent, expenses))
+
+    schedule = dict(loan)
+    schedule.update({
+        'month': month,
+        'year': year,
+        'rate': np.atleast_2d(rates) * np.ones((rows, 1)),
+        'value': value,
+        'equity': value - loan['balance'],
+        'rent': rent,
+        'expenses': expenses,
+        'cash_flow': rent - expenses - loan['payment'],
+    })
+    return schedule
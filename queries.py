@@ -0,0 +1,232 @@
+# Query layer: push column selection, filtering, sorting and paging down to SQLite
+from dataclasses import dataclass
+
+import pandas as pd
+
+from ingest import TABLE_COLUMNS, compact_frame, quote
+from metrics import GRID_METRICS
+from tracing import span
+
+
+# Table aliases and how each table links to zp, the hub every other table is joined to
+TABLE_ALIASES = {'zp': 'z', 'page': 'p', 'address': 'a', 'physical': 'ph', 'financial': 'f', 'master_table': 'm',
+                 'listing_metrics': 'lm'}
+TABLE_LINKS = {
+    'page': "p.url = z.url",
+    'address': "a.address_id = z.address_id",
+    'physical': "ph.physical_id = z.physical_id",
+    'financial': "f.financial_id = z.financial_id",
+    'master_table': "m.rowid = z.ID",
+    'listing_metrics': "lm.listing_id = z.ID",
+}
+TABLE_JOINS = {table: "JOIN {} {} ON {}".format(table, TABLE_ALIASES[table], link)
+               for table, link in TABLE_LINKS.items()}
+
+# Column -> table it is read from; columns not in a normalized table come from master_table, the default-terms
+# metrics from listing_metrics (see estimates.build_metrics)
+MASTER_ONLY_COLUMNS = ['arm5_rate', 'propertyTaxRate', 'restimateHighPercent', 'restimateLowPercent',
+                       'zestimateHighPercent', 'zestimateLowPercent', 'datePriceChanged']
+COLUMN_TABLES = {col: table for table, columns in TABLE_COLUMNS.items() for col in columns}
+COLUMN_TABLES.update({col: 'master_table' for col in MASTER_ONLY_COLUMNS})
+COLUMN_TABLES.update({'zpid': 'zp', 'url': 'zp', 'delisted': 'zp'})
+COLUMN_TABLES.update({col: 'listing_metrics' for col in GRID_METRICS})
+
+# Listing flags usable as filters
+FLAGS = ['isNonOwnerOccupied', 'is_fsba', 'is_fsbo', 'is_bankOwned', 'is_comingSoon', 'is_forAuction',
+         'is_foreclosure', 'is_newHome', 'is_openHouse', 'is_pending']
+
+
+# Row predicates; every field left as None / empty is not applied
+# Hashable, so a filter can be used as a cache key
+@dataclass(frozen=True)
+class ListingFilter:
+    zpids: tuple = ()
+    min_price: float = None
+    max_price: float = None
+    zipcodes: tuple = ()
+    min_bedrooms: float = None
+    max_bedrooms: float = None
+    home_types: tuple = ()
+    home_statuses: tuple = ()
+    regions: tuple = ()
+    cities: tuple = ()
+    flags: tuple = ()
+    include_delisted: bool = False
+    bounds: tuple = None  # (min_lat, max_lat, min_lon, max_lon), searched through the R-tree
+
+
+# Qualified SQL reference to a column, e.g. f."price"
+def column_ref(column):
+    if column not in COLUMN_TABLES:
+        raise ValueError("Unknown column: {}".format(column))
+    return "{}.{}".format(TABLE_ALIASES[COLUMN_TABLES[column]], quote(column))
+
+
+# Return the WHERE clause and its parameters for a filter
+def where_clause(listing_filter):
+    f = listing_filter
+    conditions, params = [], []
+    if not f.include_delisted:
+        conditions.append("NOT z.delisted")
+    if f.zpids:
+        conditions.append("z.zpid IN ({})".format(", ".join("?" * len(f.zpids))))
+        params.extend(int(zpid) for zpid in f.zpids)
+    if f.min_price is not None:
+        conditions.append(column_ref('price') + " >= ?")
+        params.append(f.min_price)
+    if f.max_price is not None:
+        conditions.append(column_ref('price') + " <= ?")
+        params.append(f.max_price)
+    if f.zipcodes:
+        conditions.append("{} IN ({})".format(column_ref('zipcode'), ", ".join("?" * len(f.zipcodes))))
+        params.extend(int(zipcode) for zipcode in f.zipcodes)
+    if f.home_types:
+        conditions.append("{} IN ({})".format(column_ref('homeType'), ", ".join("?" * len(f.home_types))))
+        params.extend(f.home_types)
+    if f.home_statuses:
+        conditions.append("{} IN ({})".format(column_ref('homeStatus'), ", ".join("?" * len(f.home_statuses))))
+        params.extend(f.home_statuses)
+    if f.regions:
+        conditions.append("{} IN ({})".format(column_ref('region'), ", ".join("?" * len(f.regions))))
+        params.extend(f.regions)
+    if f.cities:
+        conditions.append("{} IN ({})".format(column_ref('city'), ", ".join("?" * len(f.cities))))
+        params.extend(f.cities)
+    if f.min_bedrooms is not None:
+        conditions.append(column_ref('bedrooms') + " >= ?")
+        params.append(f.min_bedrooms)
+    if f.max_bedrooms is not None:
+        conditions.append(column_ref('bedrooms') + " <= ?")
+        params.append(f.max_bedrooms)
+    if f.bounds is not None:
+        # Stored boxes are rounded outward to 32-bit floats, so test overlap rather than containment
+        conditions.append("r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?")
+        params.extend(float(bound) for bound in f.bounds)
+    for flag in f.flags:
+        if flag not in FLAGS:
+            raise ValueError("Unknown listing flag: {}".format(flag))
+        conditions.append(column_ref(flag))
+    return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+
+# Whether the filter has a predicate on a column
+def col_used(column, listing_filter):
+    f = listing_filter
+    return {'price': f.min_price is not None or f.max_price is not None,
+            'zipcode': bool(f.zipcodes),
+            'homeType': bool(f.home_types),
+            'homeStatus': bool(f.home_statuses),
+            'region': bool(f.regions),
+            'city': bool(f.cities),
+            'bedrooms': f.min_bedrooms is not None or f.max_bedrooms is not None}[column]
+
+
+# Rowid of the table a column is read from: breaks ties between equal sort values in that column's index order
+def sort_id(column):
+    return TABLE_ALIASES[COLUMN_TABLES[column]] + ".rowid"
+
+
+# Condition for the rows after `after`, the (value, sort_id) key of the last row of the previous page, in
+# order_by order. NULLs sort first ascending and last descending, as in SQLite
+def keyset_clause(order_by, descending, after):
+    ref, tiebreak = column_ref(order_by), sort_id(order_by)
+    value, last_id = after
+    if value is None and not descending:
+        return "(({0} IS NULL AND {1} > ?) OR {0} IS NOT NULL)".format(ref, tiebreak), [last_id]
+    if value is None:
+        return "{} IS NULL AND {} < ?".format(ref, tiebreak), [last_id]
+    if not descending:
+        return "{0} >= ? AND ({0} > ? OR {1} > ?)".format(ref, tiebreak), [value, value, last_id]
+    return "(({0} <= ? AND ({0} < ? OR {1} < ?)) OR {0} IS NULL)".format(ref, tiebreak), [value, value, last_id]
+
+
+# Build the SELECT for the requested columns, joining only the tables they (and the filter) touch.
+# Sorted queries can start `after` the key of a previous page's last row (keyset paging, see query_page());
+# keyed=True adds that key's tiebreak as a last `sort_id` column
+def build_query(columns, listing_filter=ListingFilter(), order_by=None, descending=False, limit=None, offset=0,
+                after=None, keyed=False):
+    where, params = where_clause(listing_filter)
+    referenced = list(columns) + ([order_by] if order_by else [])
+    referenced += [col for col in ['price', 'zipcode', 'homeType', 'homeStatus', 'region', 'city', 'bedrooms']
+                   if col_used(col, listing_filter)]
+    referenced += list(listing_filter.flags)
+    tables = {COLUMN_TABLES[col] for col in referenced if col in COLUMN_TABLES}
+    if after is not None:
+        condition, after_params = keyset_clause(order_by, descending, after)
+        where = (where + " AND " if where else "WHERE ") + condition
+        params += after_params
+
+    select = ", ".join("{} AS {}".format(column_ref(col), quote(col)) for col in columns)
+    if keyed:
+        select += ", {} AS sort_id".format(sort_id(order_by))
+    source = "zp z"
+    if listing_filter.bounds is not None:
+        # CROSS JOIN keeps the R-tree as the outer loop, so only listings inside the box are visited
+        source = "listing_rtree r CROSS JOIN zp z ON z.ID = r.id"
+    elif order_by and not listing_filter.zpids and COLUMN_TABLES.get(order_by, 'zp') != 'zp':
+        # Driven from the sort column's table in its index order (CROSS JOIN keeps it the outer loop), so a
+        # page stops after `limit` matches instead of sorting every one of them
+        driver = COLUMN_TABLES[order_by]
+        source = "{} {} CROSS JOIN zp z ON {}".format(driver, TABLE_ALIASES[driver], TABLE_LINKS[driver])
+        tables.discard(driver)
+    joins = " ".join(TABLE_JOINS[table] for table in TABLE_JOINS if table in tables)
+    sql = "SELECT {} FROM {} {} {}".format(select, source, joins, where)
+    if order_by:
+        # The sort table's rowid breaks ties, so pages stay stable and the sort column's index gives the order
+        direction = "DESC" if descending else "ASC"
+        sql += " ORDER BY {} {}, {} {}".format(column_ref(order_by), direction, sort_id(order_by), direction)
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+    return sql, params
+
+
+# Materialize only the requested columns of the matching rows, in the compact schema
+def query_listings(connection, columns, listing_filter=ListingFilter(), order_by=None, descending=False,
+                   limit=None, offset=0, compact=True):
+    sql, params = build_query(columns, listing_filter, order_by, descending, limit, offset)
+    with span('query_listings') as s:
+        df = pd.read_sql(sql, con=connection, params=params)
+        s.set(rows=len(df), columns=len(columns))
+    return compact_frame(df) if compact else df
+
+
+# One sorted page for keyset paging: up to `limit` rows after `after` (the key of the previous page's last
+# row; None starts from the first row), skipping `skip` rows first. Returns the page and the key of its last
+# row, to pass as `after` for the next page
+def query_page(connection, columns, listing_filter, order_by, descending=False, limit=100, after=None, skip=0,
+               compact=True):
+    read = list(columns) + ([order_by] if order_by not in columns else [])
+    sql, params = build_query(read, listing_filter, order_by, descending, limit, skip, after, keyed=True)
+    with span('query_page') as s:
+        df = pd.read_sql(sql, con=connection, params=params)
+        s.set(rows=len(df), columns=len(columns), keyset=after is not None, skip=skip)
+    last = None
+    if len(df):
+        value = df[order_by].iloc[-1]
+        last = (None if pd.isna(value) else value.item() if hasattr(value, 'item') else value,
+                int(df['sort_id'].iloc[-1]))
+    df = df[list(columns)]
+    return (compact_frame(df) if compact else df), last
+
+
+# Number of rows matching a filter
+def count_listings(connection, listing_filter=ListingFilter()):
+    sql, params = build_query(['zpid'], listing_filter)
+    with span('count_listings'):
+        return connection.execute("SELECT COUNT(*) FROM ({})".format(sql), params).fetchone()[0]
+
+
+# Distinct values of a column among active listings, e.g. to fill a filter widget
+def distinct_values(connection, column):
+    sql = "SELECT DISTINCT {0} FROM zp z {1} WHERE NOT z.delisted AND {0} IS NOT NULL ORDER BY {0}".format(
+        column_ref(column), TABLE_JOINS.get(COLUMN_TABLES[column], ""))
+    return [row[0] for row in connection.execute(sql)]
+
+
+# Read one listing by zpid through the zp.zpid index, return a one-row frame (empty if not found)
+def get_listing(connection, zpid, columns):
+    sql, params = build_query(columns, ListingFilter(zpids=(int(zpid),)), limit=1)
+    with span('get_listing'):
+        rows = connection.execute(sql, params).fetchall()
+    return pd.DataFrame.from_records(rows, columns=list(columns))
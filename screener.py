@@ -0,0 +1,94 @@
+# Top-K screener: the best listings by an investment metric among those matching a ListingFilter.
+# Filters run in SQL; metrics are computed chunk by chunk for the surviving rows only, and each chunk is
+# reduced to its top k with argpartition, so memory stays O(chunk + k) and nothing is fully sorted. Chunks and
+# results are held in the compact schema (ingest.compact_frame)
+import numpy as np
+import pandas as pd
+
+from estimates import impute
+from ingest import compact_frame
+from metrics import Assumptions, compute_metrics, fill_missing
+from queries import ListingFilter, build_query, query_listings
+from tracing import span, traced
+
+
+# Ranking objectives (metric -> label); higher is better for all of them
+OBJECTIVES = {'cash_on_cash': "Cash On Cash %", 'cap_rate': "Cap Rate %", 'cash_flow': "Cash Flow $",
+              'two_p_rule': "2% Rule %"}
+
+# Metrics returned with every result
+RESULT_METRICS = ['cash_flow', 'noi', 'cash_on_cash', 'cap_rate', 'two_p_rule', 'cash_invested']
+
+# Columns read for every candidate: the calculator inputs, plus what imputation groups on
+SCORE_COLUMNS = ['zpid', 'price', 'zestimate', 'restimate', 'taxAssessedValue', 'monthlyHoaFee']
+IMPUTE_COLUMNS = ['livingArea', 'zipcode', 'region', 'homeType', 'bedrooms']
+
+# Columns read only for the k winners
+DETAIL_COLUMNS = ['zpid', 'address', 'zipcode', 'region', 'homeType', 'bedrooms', 'bathrooms', 'livingArea']
+
+
+# Indices of the k largest values, largest first (ties broken by smaller zpid)
+def top_k(values, zpids, k):
+    if len(values) > k:
+        candidates = np.argpartition(-values, k - 1)[:k]
+        # Keep everything tied with the k-th value so ties resolve by zpid, not by partition order
+        candidates = np.flatnonzero(values >= values[candidates].min())
+    else:
+        candidates = np.arange(len(values))
+    order = np.lexsort((zpids[candidates], -values[candidates]))
+    return candidates[order][:k]
+
+
+# Score one chunk of candidates; return the metric arrays (imputation applied when stats are given)
+def score_chunk(df, assumptions, stats=None):
+    df = impute(df, stats)
+    price, zestimate, tax_assessed_value = fill_missing(df['price'].to_numpy(), df['zestimate'].to_numpy(),
+                                                        df['taxAssessedValue'].to_numpy())
+    results = compute_metrics(price, zestimate, df['restimate'].to_numpy(dtype=float), tax_assessed_value,
+                              df['monthlyHoaFee'].to_numpy(dtype=float), assumptions)
+    results['price'], results['zestimate'] = price, zestimate
+    results['restimate'] = df['restimate'].to_numpy(dtype=float)
+    return results
+
+
+# The k listings matching `listing_filter` with the highest `objective`, best first, as a frame of the listing
+# details and RESULT_METRICS. `minimums` ({metric: value}) drops listings below a floor, e.g. {'cash_flow': 0}.
+# Listings whose objective isn't finite are skipped. compact=False returns the result in the database's dtypes
+@traced()
+def screen(connection, objective='cash_on_cash', k=50, listing_filter=ListingFilter(), assumptions=Assumptions(),
+           stats=None, minimums=None, chunk_size=100000, compact=True):
+    if objective not in OBJECTIVES:
+        raise ValueError("Unknown objective: {}".format(objective))
+    minimums = minimums or {}
+    columns = SCORE_COLUMNS + (IMPUTE_COLUMNS if stats is not None else [])
+    sql, params = build_query(columns, listing_filter)
+
+    best = None
+    for chunk in pd.read_sql(sql, con=connection, params=params, chunksize=chunk_size):
+        with span('screen chunk', rows=len(chunk)):
+            chunk = compact_frame(chunk)
+            results = score_chunk(chunk, assumptions, stats)
+            values = results[objective]
+            keep = np.isfinite(values)
+            for metric, minimum in minimums.items():
+                keep &= results[metric] >= minimum
+            rows = np.flatnonzero(keep)
+
+            zpids = chunk['zpid'].to_numpy()[rows]
+            winners = rows[top_k(values[rows], zpids, k)]
+            candidates = pd.DataFrame({name: results[name][winners]
+                                       for name in RESULT_METRICS + ['price', 'zestimate', 'restimate']})
+            candidates.insert(0, 'zpid', chunk['zpid'].to_numpy()[winners])
+
+            # Merge with the best of the previous chunks and cut back to k
+            best = candidates if best is None else pd.concat([best, candidates], ignore_index=True)
+            best = best.iloc[top_k(best[objective].to_numpy(), best['zpid'].to_numpy(), k)].reset_index(drop=True)
+
+    if best is None or best.empty:
+        return pd.DataFrame(columns=DETAIL_COLUMNS + ['price', 'zestimate', 'restimate'] + RESULT_METRICS)
+
+    # Descriptive columns only for the winners
+    details = query_listings(connection, DETAIL_COLUMNS, ListingFilter(zpids=tuple(best['zpid'].tolist()),
+                                                                       include_delisted=True), compact=False)
+    result = details.merge(best, on='zpid').set_index('zpid').loc[best['zpid']].reset_index()
+    return compact_frame(result) if compact else result
@@ -0,0 +1,144 @@
+# Monte Carlo risk simulation: correlated random paths for appreciation, rent growth, vacancy and
+# ARM rate resets, evaluated for all paths at once; portfolios are spread over a process pool
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+import os
+import warnings
+
+import numpy as np
+
+from metrics import Assumptions, compute_metrics
+from projection import amortize, rate_schedule
+
+
+# Simulation settings; means for appreciation, rent growth and vacancy come from the calculator inputs
+# Order of the correlated factors: appreciation, rent growth, vacancy, rate
+@dataclass(frozen=True)
+class SimulationSettings:
+    paths: int = 2000
+    hold_years: int = 10
+    appreciation_sd: float = .04
+    rent_growth_mean: float = None
+    rent_growth_sd: float = .02
+    vacancy_sd: float = .03
+    rate_sd: float = .01
+    selling_cost: float = .06
+    correlation: tuple = ((1., .5, -.3, -.2),
+                          (.5, 1., -.4, 0.),
+                          (-.3, -.4, 1., 0.),
+                          (-.2, 0., 0., 1.))
+    seed: int = None
+
+
+# Percentiles reported for every metric
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+# Draw correlated standard normal shocks, shape (paths, years, 4)
+def correlated_shocks(rng, paths, years, correlation):
+    cholesky = np.linalg.cholesky(np.asarray(correlation, dtype=float))
+    return rng.standard_normal((paths, years, len(cholesky))) @ cholesky.T
+
+
+# IRR of each row of a (rows, periods) cash flow array, by vectorized bisection (nan if no sign change)
+def irr(cash_flows, low=-.99, high=1., iterations=60):
+    cash_flows = np.asarray(cash_flows, dtype=float)
+    periods = np.arange(cash_flows.shape[1])
+    npv = lambda rate: (cash_flows / (1 + rate[:, None]) ** periods).sum(axis=1)
+
+    low = np.full(len(cash_flows), low)
+    high = np.full(len(cash_flows), high)
+    npv_low = npv(low)
+    valid = np.sign(npv_low) != np.sign(npv(high))
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        npv_mid = npv(mid)
+        below = np.sign(npv_mid) == np.sign(npv_low)
+        low = np.where(below, mid, low)
+        npv_low = np.where(below, npv_mid, npv_low)
+        high = np.where(below, high, mid)
+    return np.where(valid, (low + high) / 2, np.nan)
+
+
+# Simulate one property. Inputs are the calculator's (monthly rent/HOA, apg = mean appreciation);
+# return per-path arrays of year 1 cash flow (monthly), cap rate, cash-on-cash and the IRR over the hold period
+def simulate(price, zestimate, restimate, tax_assessed_value, hoa, apg, assumptions=Assumptions(),
+             settings=SimulationSettings()):
+    a, s = assumptions, settings
+    rng = np.random.default_rng(s.seed)
+    years = s.hold_years
+    base = {name: float(value) for name, value in
+            compute_metrics(price, zestimate, restimate, tax_assessed_value, hoa, a).items()}
+
+    shocks = correlated_shocks(rng, s.paths, years, s.correlation)
+    rent_growth_mean = apg if s.rent_growth_mean is None else s.rent_growth_mean
+    appreciation = apg + s.appreciation_sd * shocks[:, :, 0]
+    rent_growth = rent_growth_mean + s.rent_growth_sd * shocks[:, :, 1]
+    vacancy = np.clip(a.vacancy + s.vacancy_sd * shocks[:, :, 2], 0, 1)
+
+    # Value at each year end; rent and fixed expenses grow from year 2 on
+    value = zestimate * np.cumprod(1 + appreciation, axis=1)
+    growth = np.concatenate((np.ones((s.paths, 1)), np.cumprod(1 + rent_growth[:, :-1], axis=1)), axis=1)
+    rent = restimate * growth * 12
+    fixed = (base['property_tax'] + a.insurance + a.gas_electric + a.water_sewer_garbage + hoa) * growth * 12
+
+    # ARM resets move with the rate shock drawn for the reset year; fixed loans have no rate risk
+    reset_rate = None
+    if a.arm_fixed_years is not None:
+        target = a.interest_rate if a.arm_reset_rate is None else a.arm_reset_rate
+        reset_year = min(a.arm_fixed_years, years - 1)
+        reset_rate = target + s.rate_sd * shocks[:, reset_year, 3]
+    rates = rate_schedule(np.full(s.paths, a.interest_rate), a.loan_term, a.arm_fixed_years, reset_rate)
+    loan = amortize(base['loan_principal'], rates)
+    months = min(years * 12, rates.shape[1])
+    payments = np.zeros((s.paths, years * 12))
+    payments[:, :months] = loan['payment'][:, :months]
+    payments = payments.reshape(s.paths, years, 12).sum(axis=2)
+    balance = loan['balance'][:, months - 1] if months == years * 12 else np.zeros(s.paths)
+
+    noi = rent * (1 - vacancy - a.maintenance - a.management) - fixed
+    cash_flow = noi - rent * a.capex - payments
+
+    # Sell at the end of the hold period
+    flows = np.concatenate((np.full((s.paths, 1), -base['cash_invested']), cash_flow), axis=1)
+    flows[:, -1] += value[:, -1] * (1 - s.selling_cost) - balance
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'cash_flow': cash_flow[:, 0] / 12,
+            'cap_rate': noi[:, 0] / zestimate * 100,
+            'cash_on_cash': cash_flow[:, 0] / base['cash_invested'] * 100,
+            'irr': irr(flows) * 100,
+        }
+
+
+# Percentile table (metric -> {percentile: value}, NaN for a metric no path has, e.g. an IRR that never
+# changes sign) plus the share of paths with negative cash flow
+def summarize(results, percentiles=PERCENTILES):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        summary = {name: dict(zip(percentiles, np.nanpercentile(values, percentiles).tolist()))
+                   for name, values in results.items()}
+    summary['negative_cash_flow_share'] = float(np.mean(results['cash_flow'] < 0))
+    return summary
+
+
+# Simulate a chunk of properties (each a dict of simulate() keyword arguments) in one worker
+def simulate_chunk(properties, settings, seeds):
+    return [summarize(simulate(settings=replace(settings, seed=seed), **prop))
+            for prop, seed in zip(properties, seeds)]
+
+
+# Simulate a portfolio across a process pool; return one summary per property, in input order
+def simulate_portfolio(properties, settings=SimulationSettings(), workers=None, chunk_size=16):
+    properties = list(properties)
+    seeds = np.random.SeedSequence(settings.seed).generate_state(len(properties)).tolist()
+    chunks = [(properties[i:i + chunk_size], settings, seeds[i:i + chunk_size])
+              for i in range(0, len(properties), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) == 1:
+        return [summary for chunk in chunks for summary in simulate_chunk(*chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(simulate_chunk, *zip(*chunks))
+        return [summary for chunk in results for summary in chunk]
@@ -0,0 +1,96 @@
+# Spatial queries over the listing R-tree: everything within a radius and the k nearest listings,
+# combined with any ListingFilter (home type, bedrooms, price, ...) in the same SQL query
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from queries import ListingFilter, build_query
+from tracing import traced
+
+
+# Mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+
+# Great-circle distance in meters between a point and arrays of points
+def haversine(latitude, longitude, latitudes, longitudes):
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# (min_lat, max_lat, min_lon, max_lon) of a box containing the circle of `meters` around a point
+def bounding_box(latitude, longitude, meters):
+    dlat = np.degrees(meters / EARTH_RADIUS)
+    dlon = np.degrees(meters / (EARTH_RADIUS * max(np.cos(np.radians(latitude)), 1e-6)))
+    return (latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon)
+
+
+# Rows (as tuples) within `meters` of a point and their distances, nearest first
+# Kept in plain Python/NumPy so a search costs one indexed query, not DataFrame construction
+def search(connection, latitude, longitude, meters, columns, listing_filter=ListingFilter()):
+    sql, params = build_query(columns, replace(listing_filter, bounds=bounding_box(latitude, longitude, meters)))
+    rows = connection.execute(sql, params).fetchall()
+    if not rows:
+        return [], np.empty(0)
+    lat_index, lon_index = columns.index('latitude'), columns.index('longitude')
+    distance = haversine(latitude, longitude, [row[lat_index] for row in rows], [row[lon_index] for row in rows])
+    order = [i for i in np.argsort(distance, kind='stable') if distance[i] <= meters]
+    return [rows[i] for i in order], distance[order]
+
+
+# Columns read by a spatial search: the requested ones plus zpid and coordinates
+def search_columns(columns):
+    return list(dict.fromkeys(['zpid'] + list(columns) + ['latitude', 'longitude']))
+
+
+# Frame of search results with a `distance` column (meters)
+def to_frame(rows, distance, columns):
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    df['distance'] = distance
+    return df
+
+
+# Listings within `meters` of a point, nearest first, with a `distance` column like nearest()
+@traced()
+def within_radius(connection, latitude, longitude, meters, columns, listing_filter=ListingFilter()):
+    columns = search_columns(columns)
+    return to_frame(*search(connection, latitude, longitude, meters, columns, listing_filter), columns)
+
+
+# The k listings nearest a point (optionally excluding one zpid, e.g. the subject property)
+# The search radius starts small and doubles until k listings are inside it, so only nearby rows are read
+@traced()
+def nearest(connection, latitude, longitude, k, columns, listing_filter=ListingFilter(), exclude=None,
+            start_meters=400, max_meters=50000):
+    columns = search_columns(columns)
+    meters = start_meters
+    while True:
+        rows, distance = search(connection, latitude, longitude, meters, columns, listing_filter)
+        if exclude is not None:
+            keep = [i for i, row in enumerate(rows) if row[0] != int(exclude)]
+            rows, distance = [rows[i] for i in keep], distance[keep]
+        if len(rows) >= k or meters >= max_meters:
+            return to_frame(rows[:k], distance[:k], columns)
+        meters = min(meters * 2, max_meters)
+
+
+# Most listings plotted on the multi-listing map; larger result sets are thinned evenly
+MAP_POINTS = 50000
+
+
+# Compact arrays (float32 coordinates and price, int64 zpid) of the listings matching a filter, for the
+# multi-listing map; rows without coordinates are skipped
+@traced()
+def map_points(connection, listing_filter=ListingFilter(), limit=MAP_POINTS):
+    sql, params = build_query(['zpid', 'latitude', 'longitude', 'price'], listing_filter)
+    rows = connection.execute(sql, params).fetchall()
+    zpid, latitude, longitude, price = (np.array(col, dtype=float) for col in zip(*rows)) if rows \
+        else (np.empty(0),) * 4
+    keep = ~np.isnan(latitude) & ~np.isnan(longitude)
+    if keep.sum() > limit:
+        keep[keep] = np.arange(keep.sum()) % -(-keep.sum() // limit) == 0
+    return {'zpid': zpid[keep].astype('int64'), 'latitude': latitude[keep].astype('float32'),
+            'longitude': longitude[keep].astype('float32'), 'price': np.nan_to_num(price[keep]).astype('float32')}
@@ -0,0 +1,30 @@
+# Shared fixtures: the bundled export, cleaned once, and a database built from it
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from estimates import build_metrics
+from ingest import build_stats, clean_data, update_db
+
+
+# The bundled Philadelphia export, cleaned (copy before changing it)
+@pytest.fixture(scope='session')
+def listings():
+    return clean_data(os.path.join(ROOT, 'zillow_philly_data.csv'))
+
+
+# A database of the bundled export, loaded as one snapshot, with its aggregates and metrics
+@pytest.fixture
+def connection(tmp_path, listings):
+    connection = sqlite3.connect(str(tmp_path / 'listings.db'))
+    update_db(listings.copy(), connection, '2022-04-01')
+    build_stats(connection)
+    build_metrics(connection)
+    connection.commit()
+    yield connection
+    connection.close()
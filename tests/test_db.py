@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from db import Database
+
+
+def build(database, value):
+    with database.build() as connection:
+        connection.execute("CREATE TABLE t (v)")
+        connection.execute("INSERT INTO t VALUES (?)", (value,))
+
+
+def read(connection):
+    return connection.execute("SELECT v FROM t").fetchone()[0]
+
+
+def test_publish_swaps_whole_database(tmp_path):
+    path = str(tmp_path / 'live.db')
+    database = Database(path)
+    build(database, 1)
+
+    # A reader in a read transaction keeps its snapshot across a publish, and sees the new data after it
+    with database.reader() as connection:
+        connection.execute("BEGIN")
+        assert read(connection) == 1
+        build(database, 2)
+        assert read(connection) == 1
+        connection.commit()
+        assert read(connection) == 2
+
+    # Other connections to the file, in this process or another, see the published database
+    other = Database(path)
+    with other.reader() as connection:
+        assert read(connection) == 2
+    other.close()
+    script = "import sqlite3; print(sqlite3.connect({!r}).execute('SELECT v FROM t').fetchone()[0])".format(path)
+    assert subprocess.check_output([sys.executable, '-c', script]).strip() == b'2'
+    assert sorted(os.listdir(str(tmp_path))) == ['live.db', 'live.db-shm', 'live.db-wal']
+    database.close()
+
+
+def test_failed_build_leaves_live_database(tmp_path):
+    database = Database(str(tmp_path / 'live.db'))
+    build(database, 1)
+    with pytest.raises(RuntimeError):
+        with database.build() as connection:
+            connection.execute("CREATE TABLE t (v)")
+            raise RuntimeError
+    with database.reader() as connection:
+        assert read(connection) == 1
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.build')]
+    database.close()
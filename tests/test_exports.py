@@ -0,0 +1,50 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from ingest import _checked, ensure_db
+
+EXPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zillow_philly_data.csv')
+
+
+# Three exports over two snapshot dates: the second date splits the listings over two files (one of them with
+# price cuts and new listings) and drops the rest
+@pytest.fixture
+def exports(tmp_path):
+    raw = pd.read_csv(EXPORT)
+    directory = tmp_path / 'exports'
+    directory.mkdir()
+    raw.iloc[:300].to_csv(str(directory / 'philly_2022-04-01.csv'), index=False)
+    cut = raw.iloc[100:350].copy()
+    cut.loc[cut.index[:20], 'price'] -= 5000
+    cut.to_csv(str(directory / 'philly_2022-04-08.csv'), index=False)
+    raw.iloc[50:100].to_csv(str(directory / 'suburbs_2022-04-08.csv'), index=False)
+    return directory
+
+
+def tables(path):
+    connection = sqlite3.connect(str(path))
+    return {table: connection.execute("SELECT * FROM {} ORDER BY 1, 2".format(table)).fetchall()
+            for table in ['master_table', 'zp', 'page', 'financial', 'price_history', 'listing_snapshots']}
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_exports_parsed_in_workers_load_like_one_process(tmp_path, exports, incremental):
+    results = {}
+    for workers in (1, 3):
+        _checked.clear()
+        stats = ensure_db(str(exports), str(tmp_path / '{}.db'.format(workers)), incremental, workers=workers)
+        assert stats['changes'] == {'inserted': 350, 'updated': 20, 'refreshed': 0, 'delisted': 50, 'snapshots': 370}
+        results[workers] = tables(tmp_path / '{}.db'.format(workers))
+    assert results[1] == results[3]
+
+    connection = sqlite3.connect(str(tmp_path / '3.db'))
+    assert dict(connection.execute("SELECT snapshot_date, COUNT(*) FROM price_history GROUP BY 1")) == \
+        {'2022-04-01': 300, '2022-04-08': 70}
+    assert dict(connection.execute("SELECT source, COUNT(*) FROM listing_snapshots GROUP BY 1")) == \
+        {'philly_2022-04-01': 300, 'philly_2022-04-08': 250, 'suburbs_2022-04-08': 50}
+    assert not connection.execute("SELECT name FROM sqlite_master WHERE name LIKE '%staging%'").fetchall()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['1.db', '1.db-shm', '1.db-wal', '3.db', '3.db-shm',
+                                                          '3.db-wal', 'exports']
@@ -0,0 +1,63 @@
+import sqlite3
+
+from ingest import update_db
+from queries import ListingFilter, query_listings
+
+
+def history(connection):
+    return dict(connection.execute("SELECT snapshot_date, COUNT(*) FROM price_history GROUP BY snapshot_date"))
+
+
+def test_update_db_merges_by_zpid(tmp_path, listings):
+    connection = sqlite3.connect(str(tmp_path / 'update.db'))
+    first = listings.iloc[:200].copy()
+    changes = update_db(first, connection, '2022-04-01')
+    assert changes == {'inserted': 200, 'updated': 0, 'refreshed': 0, 'delisted': 0, 'snapshots': 200}
+
+    # Drop the first 20 listings, add 30 new ones and change the price of 5 kept ones
+    second = listings.iloc[20:230].copy()
+    moved = second.index[second['price'] > 0][:5]
+    second.loc[moved, 'price'] += 1000
+    changes = update_db(second, connection, '2022-04-08')
+    assert changes == {'inserted': 30, 'updated': 5, 'refreshed': 0, 'delisted': 20, 'snapshots': 35}
+
+    assert history(connection) == {'2022-04-01': 200, '2022-04-08': 35}
+    assert connection.execute("SELECT COUNT(*), SUM(delisted) FROM zp").fetchone() == (230, 20)
+    delisted = {row[0] for row in connection.execute("SELECT zpid FROM zp WHERE delisted")}
+    assert delisted == set(listings['zpid'].iloc[:20])
+    for zpid, price in second.loc[moved, ['zpid', 'price']].itertuples(index=False):
+        rows = connection.execute("SELECT snapshot_date, price FROM price_history WHERE zpid = ? "
+                                  "ORDER BY snapshot_date", (int(zpid),)).fetchall()
+        assert rows[-1] == ('2022-04-08', price)
+        assert connection.execute("SELECT f.price FROM zp z JOIN financial f ON f.financial_id = z.financial_id "
+                                  "WHERE z.zpid = ?", (int(zpid),)).fetchone()[0] == price
+
+    # The same export again changes nothing; a delisted listing coming back is updated and active again
+    assert update_db(second.copy(), connection, '2022-04-15') == \
+        {'inserted': 0, 'updated': 0, 'refreshed': 0, 'delisted': 0, 'snapshots': 0}
+    back = update_db(listings.iloc[:230].copy(), connection, '2022-04-22')
+    assert back['updated'] == 20 + 5 and back['delisted'] == 0
+    assert connection.execute("SELECT SUM(delisted) FROM zp").fetchone()[0] == 0
+    assert not connection.execute("SELECT name FROM sqlite_master WHERE name LIKE 'staging%'").fetchall()
+
+
+def test_update_db_refreshes_page_statistics_in_place(tmp_path, listings):
+    connection = sqlite3.connect(str(tmp_path / 'update.db'))
+    update_db(listings.iloc[:200].copy(), connection, '2022-04-01')
+    ids = dict(connection.execute("SELECT zpid, ID FROM zp"))
+
+    # A day later only views, favorites and days on market moved
+    second = listings.iloc[:200].copy()
+    second['pageViewCount'] += 7
+    second['favoriteCount'] += 1
+    second['daysOnZillow'] += 1
+    changes = update_db(second, connection, '2022-04-02')
+    assert changes == {'inserted': 0, 'updated': 0, 'refreshed': 200, 'delisted': 0, 'snapshots': 0}
+    assert dict(connection.execute("SELECT zpid, ID FROM zp")) == ids
+
+    df = query_listings(connection, ['zpid', 'pageViewCount', 'favoriteCount', 'daysOnZillow'], ListingFilter(),
+                        compact=False)
+    expected = second.set_index('zpid').loc[df['zpid']]
+    assert df['pageViewCount'].tolist() == expected['pageViewCount'].tolist()
+    assert df['favoriteCount'].tolist() == expected['favoriteCount'].tolist()
+    assert df['daysOnZillow'].tolist() == expected['daysOnZillow'].tolist()
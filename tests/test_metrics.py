@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_metrics import per_row_metrics
+from estimates import METRIC_INPUTS, build_metrics, impute, load_stats
+from metrics import GRID_METRICS, Assumptions, compute_metrics, fill_missing, score_listings
+from queries import query_listings
+
+
+@pytest.mark.parametrize('assumptions', [
+    Assumptions(),
+    Assumptions(down_payment=.25, rehab=15000, interest_rate=.065, loan_term=15, management=.08, gas_electric=120),
+])
+def test_compute_metrics_matches_per_row_loop(listings, assumptions):
+    price, zestimate, tax_assessed_value = fill_missing(listings['price'].to_numpy(),
+                                                        listings['zestimate'].to_numpy(),
+                                                        listings['taxAssessedValue'].to_numpy())
+    restimate = listings['restimate'].to_numpy(dtype=float)
+    hoa = listings['monthlyHoaFee'].to_numpy(dtype=float)
+
+    loop = np.array([per_row_metrics(*row, assumptions)
+                     for row in zip(price, zestimate, restimate, tax_assessed_value, hoa)])
+    results = compute_metrics(price, zestimate, restimate, tax_assessed_value, hoa, assumptions)
+    for i, name in enumerate(['cash_flow', 'noi', 'cash_on_cash', 'cap_rate', 'fifty_p_rule', 'two_p_rule']):
+        np.testing.assert_allclose(results[name], loop[:, i], rtol=1e-9)
+
+
+def test_materialized_metrics_match_scoring(connection):
+    df = query_listings(connection, ['zpid'] + METRIC_INPUTS + GRID_METRICS, compact=False).set_index('zpid')
+    expected = score_listings(impute(df, load_stats(connection)))
+    pd.testing.assert_frame_equal(df[GRID_METRICS].astype(float), expected.astype(float))
+
+    # A second build finds nothing to rewrite
+    assert build_metrics(connection) == 0
@@ -0,0 +1,44 @@
+import numpy as np
+
+from projection import amortize, rate_schedule
+
+
+# Month by month amortization, recomputing the payment on the remaining balance whenever the rate changes
+def amortize_loop(principal, rates):
+    months = len(rates)
+    balance, payment, rate = principal, None, None
+    schedule = []
+    for month, annual in enumerate(rates):
+        r = annual / 12
+        if r != rate:
+            remaining = months - month
+            payment = balance / remaining if r == 0 else balance * r * (1 + r) ** remaining / ((1 + r) ** remaining - 1)
+            rate = r
+        interest = balance * r
+        balance -= payment - interest
+        schedule.append((payment, interest, balance))
+    return np.array(schedule)
+
+
+def test_arm_schedule_resets_within_caps():
+    rates = rate_schedule([.03, .03, .05], 30, arm_fixed_years=5, reset_rate=[.09, .01, .05])
+    assert rates.shape == (3, 360)
+    np.testing.assert_allclose(rates[:, 59], [.03, .03, .05])
+    # First cap .02, then .02 more a year, up to the lifetime cap of .05
+    np.testing.assert_allclose(rates[0, [60, 72, 84, 359]], [.05, .07, .08, .08])
+    np.testing.assert_allclose(rates[1, [60, 72, 359]], [.01, .01, .01])
+    np.testing.assert_allclose(rates[2], .05)
+
+
+def test_amortize_matches_monthly_loop():
+    rates = np.vstack((rate_schedule([.03, .03, .05], 30, arm_fixed_years=5, reset_rate=[.09, .01, .05]),
+                       np.zeros((1, 360))))
+    principal = np.array([400000., 250000., 100000., 120000.])
+    loan = amortize(principal, rates)
+    for row in range(len(rates)):
+        expected = amortize_loop(principal[row], rates[row])
+        np.testing.assert_allclose(loan['payment'][row], expected[:, 0], rtol=1e-9)
+        np.testing.assert_allclose(loan['interest'][row], expected[:, 1], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(loan['balance'][row], expected[:, 2], rtol=1e-9, atol=1e-5)
+    np.testing.assert_allclose(loan['balance'][:, -1], 0)
+    np.testing.assert_allclose(loan['principal'].sum(axis=1), principal)
@@ -0,0 +1,54 @@
+import pytest
+
+from queries import ListingFilter, count_listings, get_listing, query_listings, query_page
+
+
+@pytest.mark.parametrize('listing_filter, keep', [
+    (ListingFilter(), lambda df: df['zpid'] > 0),
+    (ListingFilter(min_price=150000, max_price=400000),
+     lambda df: (df['price'] >= 150000) & (df['price'] <= 400000)),
+    (ListingFilter(zipcodes=(19104, 19146), home_types=('SINGLE_FAMILY', 'TOWNHOUSE')),
+     lambda df: df['zipcode'].isin([19104, 19146]) & df['homeType'].isin(['SINGLE_FAMILY', 'TOWNHOUSE'])),
+    (ListingFilter(min_bedrooms=3, max_bedrooms=4, flags=('is_pending',)),
+     lambda df: (df['bedrooms'] >= 3) & (df['bedrooms'] <= 4) & df['is_pending'].astype(bool)),
+    (ListingFilter(home_statuses=('FOR_SALE',), regions=('Richmond', 'Fishtown')),
+     lambda df: (df['homeStatus'] == 'FOR_SALE') & df['region'].isin(['Richmond', 'Fishtown'])),
+])
+def test_filters_pushed_down_match_pandas(connection, listings, listing_filter, keep):
+    listings = listings.drop_duplicates('zpid', keep='last')
+    expected = listings[keep(listings)]
+    assert len(expected)
+    df = query_listings(connection, ['zpid', 'price', 'address'], listing_filter, compact=False)
+    assert sorted(df['zpid']) == sorted(expected['zpid'])
+    assert count_listings(connection, listing_filter) == len(expected)
+    merged = df.merge(expected[['zpid', 'price', 'address']], on='zpid', suffixes=('', '_expected'))
+    assert merged['price'].fillna(-1).tolist() == merged['price_expected'].fillna(-1).tolist()
+    assert merged['address'].tolist() == merged['address_expected'].tolist()
+
+
+def test_get_listing(connection, listings):
+    row = listings.iloc[123]
+    df = get_listing(connection, row['zpid'], ['zpid', 'address', 'zestimate'])
+    assert df.values.tolist() == [[row['zpid'], row['address'], row['zestimate']]]
+    assert get_listing(connection, -1, ['zpid']).empty
+
+
+# Read every page by key, each starting after the last row of the one before
+def keyset_pages(connection, listing_filter, order_by, descending, limit):
+    zpids, after = [], None
+    while True:
+        page, after = query_page(connection, ['zpid'], listing_filter, order_by, descending, limit, after,
+                                 compact=False)
+        zpids += page['zpid'].tolist()
+        if len(page) < limit:
+            return zpids
+
+
+@pytest.mark.parametrize('order_by', ['price', 'bedrooms', 'livingArea', 'daysOnZillow', 'zpid', 'cash_flow',
+                                      'cap_rate'])
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('listing_filter', [ListingFilter(), ListingFilter(min_price=150000, zipcodes=(19104, 19146))])
+def test_keyset_pages_match_full_sort(connection, order_by, descending, listing_filter):
+    expected = query_listings(connection, ['zpid'], listing_filter, order_by, descending, compact=False)
+    assert len(expected)
+    assert keyset_pages(connection, listing_filter, order_by, descending, 333) == expected['zpid'].tolist()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from metrics import Assumptions
+from queries import ListingFilter, query_listings
+from screener import SCORE_COLUMNS, score_chunk, screen
+
+
+# Every matching listing scored and fully sorted: the best k zpids by objective, ties by smaller zpid
+def brute_force(connection, objective, k, listing_filter, assumptions, minimums):
+    df = query_listings(connection, SCORE_COLUMNS, listing_filter, compact=False)
+    results = score_chunk(df, assumptions)
+    keep = np.isfinite(results[objective])
+    for metric, minimum in minimums.items():
+        keep &= results[metric] >= minimum
+    ranked = sorted(zip(-results[objective][keep], df['zpid'].to_numpy()[keep]))
+    return [int(zpid) for _, zpid in ranked[:k]]
+
+
+@pytest.mark.parametrize('objective', ['cash_on_cash', 'cap_rate', 'cash_flow', 'two_p_rule'])
+@pytest.mark.parametrize('listing_filter, minimums', [
+    (ListingFilter(), {}),
+    (ListingFilter(min_price=100000, home_types=('SINGLE_FAMILY',)), {'cash_flow': 0}),
+])
+def test_screen_matches_full_sort(connection, objective, listing_filter, minimums):
+    assumptions = Assumptions(interest_rate=.045)
+    expected = brute_force(connection, objective, 25, listing_filter, assumptions, minimums)
+    result = screen(connection, objective, 25, listing_filter, assumptions, minimums=minimums, chunk_size=700)
+    assert expected and result['zpid'].tolist() == expected
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from queries import ListingFilter, query_listings
+from spatial import haversine, nearest, within_radius
+
+# Center City Philadelphia
+POINT = (39.9526, -75.1652)
+
+
+# Every matching listing with coordinates and its distance from POINT, nearest first
+def brute_force(connection, listing_filter):
+    df = query_listings(connection, ['zpid', 'latitude', 'longitude'], listing_filter, compact=False)
+    df = df.dropna(subset=['latitude', 'longitude'])
+    df['distance'] = haversine(*POINT, df['latitude'], df['longitude'])
+    return df.sort_values(['distance', 'zpid'], kind='stable')
+
+
+@pytest.mark.parametrize('meters', [800, 1500, 5000])
+@pytest.mark.parametrize('listing_filter', [ListingFilter(), ListingFilter(home_types=('SINGLE_FAMILY',), min_bedrooms=3)])
+def test_within_radius_matches_every_distance(connection, meters, listing_filter):
+    expected = brute_force(connection, listing_filter)
+    expected = expected[expected['distance'] <= meters]
+    df = within_radius(connection, *POINT, meters, ['price'], listing_filter)
+    assert len(expected)
+    assert list(df.columns) == ['zpid', 'price', 'latitude', 'longitude', 'distance']
+    assert sorted(df['zpid']) == sorted(expected['zpid'])
+    assert df['distance'].is_monotonic_increasing
+    np.testing.assert_allclose(np.sort(df['distance']), expected['distance'])
+
+
+def test_nearest_matches_brute_force(connection):
+    expected = brute_force(connection, ListingFilter())
+    df = nearest(connection, *POINT, 15, ['price'], exclude=expected['zpid'].iloc[0])
+    np.testing.assert_allclose(df['distance'], expected['distance'].iloc[1:16])
@@ -0,0 +1,183 @@
+# Lightweight tracing: named spans and memory readings for one script run, exportable as JSON or as
+# a Chrome trace (chrome://tracing, https://ui.perfetto.dev). Each thread has its own active trace (a Streamlit
+# session reruns the script in one thread); when none is active, span() hands back a shared no-op object
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+_local = threading.local()
+
+# Memory traces alive across all threads: tracemalloc is process-wide, so it runs while there is at least one
+_memory_lock = threading.Lock()
+_memory_traces = 0
+
+
+# Peak resident memory of the process so far, in MB (None where unavailable)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'start', 'depth', 'memory')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    # Attach extra values (row counts, cache hits, ...) to the span
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.depth = self.tracer.depth
+        self.tracer.depth += 1
+        self.memory = tracemalloc.get_traced_memory()[0] if self.tracer.memory else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        tracer = self.tracer
+        tracer.depth -= 1
+        event = {'name': self.name, 'start_ms': (self.start - tracer.origin) * 1000,
+                 'duration_ms': (end - self.start) * 1000, 'depth': self.depth,
+                 'thread': threading.get_ident(), 'peak_rss_mb': peak_rss_mb(), 'args': self.args}
+        if self.memory is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            event['allocated_mb'] = (current - self.memory) / 2 ** 20
+            event['traced_peak_mb'] = peak / 2 ** 20
+        tracer.events.append(event)
+        return False
+
+
+# Stand-in for Span when tracing is off
+class NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+
+    def __init__(self, name='run', memory=False):
+        self.name = name
+        self.memory = memory
+        self.events = []
+        self.release = None
+        self.depth = 0
+        self.origin = time.perf_counter()
+        self.wall_start = time.time()
+
+    def span(self, name, **args):
+        return Span(self, name, args)
+
+    # Per span name: calls, total and max milliseconds, slowest first
+    def summary(self):
+        totals = {}
+        for event in self.events:
+            calls, total, longest = totals.get(event['name'], (0, 0., 0.))
+            totals[event['name']] = (calls + 1, total + event['duration_ms'], max(longest, event['duration_ms']))
+        return sorted(({'name': name, 'calls': calls, 'total_ms': total, 'max_ms': longest}
+                       for name, (calls, total, longest) in totals.items()), key=lambda row: -row['total_ms'])
+
+    def to_dict(self):
+        return {'name': self.name, 'started': self.wall_start, 'events': sorted(self.events, key=lambda e: e['start_ms'])}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1, default=str)
+
+    # Chrome trace event format: one complete ("X") event per span
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        events = [{'name': event['name'], 'ph': 'X', 'ts': event['start_ms'] * 1000, 'dur': event['duration_ms'] * 1000,
+                   'pid': pid, 'tid': event['thread'], 'args': dict(event['args'], peak_rss_mb=event['peak_rss_mb'])}
+                  for event in self.events]
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, default=str)
+
+
+# Count one more memory trace, starting tracemalloc for the first
+def _acquire_memory():
+    global _memory_traces
+    with _memory_lock:
+        if _memory_traces == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _memory_traces += 1
+
+
+# Count one memory trace less, stopping tracemalloc after the last
+def _release_memory():
+    global _memory_traces
+    with _memory_lock:
+        _memory_traces -= 1
+        if _memory_traces == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# Start a trace for the current thread (replacing and stopping any previous one) and return it; with
+# enabled=False tracing is switched off and None is returned. memory=True also records Python allocations per
+# span through tracemalloc, which slows everything down while any such trace is running, in any thread
+def start_trace(enabled=True, name='run', memory=False):
+    stop_trace()
+    tracer = Tracer(name, memory and enabled) if enabled else None
+    if tracer is not None and tracer.memory:
+        _acquire_memory()
+        # Released once, by stop_trace() or when a trace that was never stopped is collected
+        tracer.release = weakref.finalize(tracer, _release_memory)
+    _local.tracer = tracer
+    return tracer
+
+
+# Stop the current thread's trace and return it (None if there was none)
+def stop_trace():
+    tracer = getattr(_local, 'tracer', None)
+    _local.tracer = None
+    if tracer is not None and tracer.memory:
+        tracer.release()
+    return tracer
+
+
+# Time a block: `with span("init_db", rows=n):`. Costs one attribute lookup when tracing is off
+def span(name, **args):
+    tracer = getattr(_local, 'tracer', None)
+    return NULL_SPAN if tracer is None else Span(tracer, name, args)
+
+
+# Decorator form of span(), named after the function unless given a name
+def traced(name=None):
+    def decorator(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = getattr(_local, 'tracer', None)
+            if tracer is None:
+                return function(*args, **kwargs)
+            with Span(tracer, label, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
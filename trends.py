@@ -0,0 +1,91 @@
+# Market trends across export snapshots (listing_snapshots): days on market and price drops per snapshot date,
+# overall or by zipcode/region, and the listings with the largest cuts. Listings are narrowed with a
+# ListingFilter (delisted listings included: they were on the market in earlier snapshots)
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from queries import ListingFilter, build_query
+from tracing import traced
+
+
+# Columns trends can be grouped by
+GROUP_COLUMNS = ('zipcode', 'region', 'homeType')
+
+
+# Snapshot dates in the database, oldest first
+def snapshot_dates(connection):
+    if not connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'listing_snapshots'").fetchone():
+        return []
+    return [row[0] for row in connection.execute(
+        "SELECT DISTINCT snapshot_date FROM listing_snapshots ORDER BY snapshot_date")]
+
+
+# Snapshot rows of the listings matching `listing_filter`, with `group_by` (if any) from the current listing
+def read_snapshots(connection, columns, listing_filter=ListingFilter(), group_by=None):
+    if group_by is not None and group_by not in GROUP_COLUMNS:
+        raise ValueError("Unknown trend grouping: {}".format(group_by))
+    listings, params = build_query(['zpid'] + ([group_by] if group_by else []),
+                                   replace(listing_filter, include_delisted=True))
+    sql = "SELECT s.zpid, s.snapshot_date, {} FROM listing_snapshots s JOIN ({}) f ON f.zpid = s.zpid".format(
+        ", ".join(["s." + col for col in columns] + (["f." + group_by] if group_by else [])), listings)
+    return pd.read_sql(sql, con=connection, params=params)
+
+
+# Days on market per snapshot date (and group) among listings for sale in that snapshot:
+# listings, median and mean daysOnZillow
+@traced()
+def days_on_market_trend(connection, listing_filter=ListingFilter(), group_by=None, statuses=('FOR_SALE',)):
+    df = read_snapshots(connection, ['homeStatus', 'daysOnZillow'], listing_filter, group_by)
+    if statuses:
+        df = df[df['homeStatus'].isin(statuses)]
+    keys = ['snapshot_date'] + ([group_by] if group_by else [])
+    days = df.groupby(keys)['daysOnZillow']
+    return pd.DataFrame({'listings': days.size(), 'median_days': days.median(),
+                         'mean_days': days.mean()}).reset_index()
+
+
+# Each listing's snapshots in date order with the change from its previous snapshot (NaN on the first one);
+# prices of zero (no asking price) count as missing
+def price_changes(df):
+    df = df.sort_values(['zpid', 'snapshot_date'])
+    df['price'] = df['price'].where(df['price'] > 0)
+    previous = df.groupby('zpid')['price'].shift()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (df['price'] - previous) / previous * 100
+    return df.assign(previous_price=previous, change_pct=change)
+
+
+# Price drops per snapshot date (and group): listings seen in an earlier snapshot too, how many of them
+# dropped their price since then, that share, and the median drop of those that did (in %)
+@traced()
+def price_drop_trend(connection, listing_filter=ListingFilter(), group_by=None):
+    df = price_changes(read_snapshots(connection, ['price'], listing_filter, group_by))
+    df = df[df['change_pct'].notna()]
+    drops = df['change_pct'].where(df['change_pct'] < 0)
+    keys = [df['snapshot_date']] + ([df[group_by]] if group_by else [])
+    trend = pd.DataFrame({'repeat_listings': df.groupby(keys).size(),
+                          'price_drops': drops.notna().groupby(keys).sum(),
+                          'median_drop_pct': -drops.groupby(keys).median()})
+    trend['drop_share'] = trend['price_drops'] / trend['repeat_listings']
+    return trend.reset_index()
+
+
+# Listings with the largest total price cut between their first and latest snapshot (at least `min_drop` %),
+# with how often they were cut, when they were first and last seen, and their latest days on market
+@traced()
+def largest_price_drops(connection, listing_filter=ListingFilter(), min_drop=0, limit=100):
+    df = price_changes(read_snapshots(connection, ['price', 'daysOnZillow'], listing_filter))
+    listings = df.groupby('zpid')
+    result = pd.DataFrame({'first_seen': listings['snapshot_date'].first(),
+                           'last_seen': listings['snapshot_date'].last(),
+                           'snapshots': listings.size(),
+                           'first_price': listings['price'].first(),
+                           'price': listings['price'].last(),
+                           'cuts': (df['change_pct'] < 0).groupby(df['zpid']).sum(),
+                           'daysOnZillow': listings['daysOnZillow'].last()})
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['drop_pct'] = (result['first_price'] - result['price']) / result['first_price'] * 100
+    result = result[(result['cuts'] > 0) & (result['drop_pct'] >= min_drop)]
+    return result.sort_values(['drop_pct', 'cuts'], ascending=False).head(limit).reset_index()